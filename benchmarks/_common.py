@@ -0,0 +1,156 @@
+# benchmarks/_common.py
+#
+# Shared helpers for the standalone benchmark scripts in this directory.
+# They run without Django: only torch, torchvision, PIL and the Django-free
+# modules under plant_identifier/inference are imported.
+
+import io
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from plant_identifier.inference.metrics import percentile  # noqa: E402
+from plant_identifier.inference.reference import reference_images  # noqa: E402
+
+MEDIA_ROOT = os.path.join(REPO_ROOT, "media")
+JSON_DIR = os.path.join(REPO_ROOT, "json")
+DEFAULT_MODEL = os.path.join(REPO_ROOT, "models", "efficientnet_b3.pt")
+
+
+def summarize(timings_ms, items_per_call=1):
+    """p50/p95/p99/mean over a list of per-call timings in ms."""
+    ordered = sorted(timings_ms)
+    total = sum(ordered)
+    return {
+        "n": len(ordered),
+        "mean_ms": total / len(ordered) if ordered else None,
+        "p50_ms": percentile(ordered, 50),
+        "p95_ms": percentile(ordered, 95),
+        "p99_ms": percentile(ordered, 99),
+        "items_per_s": (items_per_call * len(ordered) * 1000.0 / total) if total else None,
+    }
+
+
+def time_calls(fn, runs, warmup=2):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return timings
+
+
+def reference_photos(limit):
+    return reference_images(MEDIA_ROOT, limit=limit)
+
+
+def sample_jpeg(megapixels, index=0, quality=90):
+    """
+    A ~``megapixels`` MP JPEG upload: a re-encoded reference photo when
+    media/images is populated, otherwise a synthetic gradient-and-noise image
+    (so the benchmarks run on any box).
+    """
+    photos = reference_photos(index + 1)
+    if len(photos) > index:
+        return upscaled_jpeg(photos[index][0], megapixels, quality)
+
+    import numpy as np
+    from PIL import Image
+
+    width = max(1, int((megapixels * 1_000_000 * 4 / 3) ** 0.5))
+    height = max(1, int(megapixels * 1_000_000 / width))
+    rng = np.random.default_rng(index)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = gradient + rng.normal(0, 40, size=(height, width, 3)).astype(np.float32)
+    buf = io.BytesIO()
+    Image.fromarray(pixels.clip(0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def species_to_class_index():
+    """species id (str) -> model class index, from json/class_idx_to_species_id.json."""
+    with open(os.path.join(JSON_DIR, "class_idx_to_species_id.json"), "r", encoding="utf-8") as f:
+        mapping = json.load(f)
+    return {str(v).strip(): int(k) for k, v in mapping.items()}
+
+
+def upscaled_jpeg(path, megapixels, quality=90):
+    """Re-encode a reference photo at roughly ``megapixels`` MP, like a phone upload."""
+    from PIL import Image
+
+    image = Image.open(path).convert("RGB")
+    scale = (megapixels * 1_000_000 / (image.width * image.height)) ** 0.5
+    size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+    buf = io.BytesIO()
+    image.resize(size, Image.BILINEAR).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def load_model_if_present(path=DEFAULT_MODEL):
+    """The real TorchScript model, or None when the weights are not on disk."""
+    if not path or not os.path.isfile(path):
+        return None
+    import torch
+
+    model = torch.jit.load(path, map_location="cpu")
+    return model.eval()
+
+
+def load_species_tables():
+    """(species_ids, common_names, scientific_names) arrays indexed by class, as the views build them."""
+    from plant_identifier.inference.species import build_class_tables
+
+    def load(name):
+        with open(os.path.join(JSON_DIR, name), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    cmn = {str(k).strip(): v for k, v in load("plantnet300k_species_id_2_CmnName.json").items()}
+    scn = {str(k).strip(): v for k, v in load("plantnet300K_species_id_2_ScnName.json").items()}
+    return build_class_tables(load("class_idx_to_species_id.json"), cmn, scn)
+
+
+def stand_in_model(num_classes=1081, cache_dir=None):
+    """
+    Path to a randomly initialized, scripted torchvision EfficientNet-B3 with
+    the production head, generated once and cached. Same architecture and
+    FLOPs as the real model, so timings are representative; predictions
+    are meaningless.
+    """
+    import tempfile
+
+    import torch
+    import torchvision
+
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "plant_identifier_bench")
+    path = os.path.join(cache_dir, f"efficientnet_b3_standin_{num_classes}.pt")
+    if not os.path.isfile(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        torch.manual_seed(0)
+        model = torchvision.models.efficientnet_b3(weights=None, num_classes=num_classes).eval()
+        torch.jit.script(model).save(path + ".tmp")
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def load_model_or_stand_in(path=DEFAULT_MODEL):
+    """(model, source): the real weights when present, else the generated stand-in."""
+    model = load_model_if_present(path)
+    if model is not None:
+        return model, path
+    stand_in = stand_in_model()
+    return load_model_if_present(stand_in), f"stand-in ({stand_in})"
+
+
+def emit(report, output=None):
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,134 @@
+"""
+TorchScript vs ONNX Runtime: forward latency and worker cold start.
+
+    python benchmarks/bench_backends.py --batch-sizes 1 4 8 --threads 1 4
+
+Latency: both backends on the same random batches, p50/p95/p99 and
+images/s per (threads, batch size), plus the max logit difference.
+Cold start: a fresh process per backend that imports only what the backend
+needs, loads the model and runs one forward pass; reports import, load and
+first-inference time and the process' peak RSS.
+
+Uses models/efficientnet_b3.pt and models/efficientnet_b3.onnx when present;
+otherwise exports the generated stand-in to a temporary ONNX file.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from _common import DEFAULT_MODEL, emit, stand_in_model, summarize, time_calls
+
+from plant_identifier.inference.backends import onnx_path
+
+
+def _vm_hwm_kb():
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _cold_start_worker(backend, path):
+    """Runs in a child process; prints timings (ms) and peak RSS (kB) as JSON."""
+    import numpy as np
+
+    t0 = time.perf_counter()
+    if backend == "onnxruntime":
+        import onnxruntime as ort
+        t1 = time.perf_counter()
+        session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        t2 = time.perf_counter()
+        session.run(None, {"input": np.zeros((1, 3, 300, 300), dtype=np.float32)})
+    else:
+        import torch
+        t1 = time.perf_counter()
+        model = torch.jit.load(path, map_location="cpu").eval()
+        t2 = time.perf_counter()
+        with torch.no_grad():
+            model(torch.zeros(1, 3, 300, 300))
+    t3 = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (t1 - t0) * 1000.0,
+        "load_ms": (t2 - t1) * 1000.0,
+        "first_inference_ms": (t3 - t2) * 1000.0,
+        "peak_rss_mb": _vm_hwm_kb() / 1024.0,
+    }))
+
+
+def _cold_start(backend, path):
+    out = subprocess.run(
+        [sys.executable, __file__, "--_worker", backend, path],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _model_paths(model):
+    import tempfile
+
+    import torch
+
+    from plant_identifier.inference.backends import export_onnx
+
+    pt = model or DEFAULT_MODEL
+    if not os.path.isfile(pt):
+        pt = stand_in_model()
+    onnx = onnx_path(pt)
+    if not os.path.isfile(onnx):
+        onnx = os.path.join(tempfile.gettempdir(), "plant_identifier_bench", os.path.basename(onnx))
+        if not os.path.isfile(onnx):
+            os.makedirs(os.path.dirname(onnx), exist_ok=True)
+            export_onnx(torch.jit.load(pt, map_location="cpu"), onnx, {"source": pt})
+    return pt, onnx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--model", default=None, help="TorchScript model (default models/efficientnet_b3.pt).")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    parser.add_argument("--_worker", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._worker:
+        _cold_start_worker(*args._worker)
+        return
+
+    import torch
+
+    from plant_identifier.inference.backends import OnnxRuntimeModel
+
+    pt, onnx = _model_paths(args.model)
+    report = {
+        "torchscript_model": pt,
+        "onnx_model": onnx,
+        "cold_start": {"torchscript": _cold_start("torchscript", pt), "onnxruntime": _cold_start("onnxruntime", onnx)},
+        "latency": [],
+    }
+
+    scripted = torch.jit.load(pt, map_location="cpu").eval()
+    with torch.no_grad():
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            ort_model = OnnxRuntimeModel(onnx, intra_op_threads=threads)
+            for batch_size in args.batch_sizes:
+                batch = torch.randn(batch_size, 3, 300, 300)
+                entry = {"threads": threads, "batch_size": batch_size}
+                for name, model in (("torchscript", scripted), ("onnxruntime", ort_model)):
+                    entry[name] = summarize(time_calls(lambda: model(batch), args.runs), batch_size)
+                entry["max_abs_logit_diff"] = float((scripted(batch) - ort_model(batch)).abs().max())
+                entry["onnxruntime_speedup"] = entry["torchscript"]["mean_ms"] / entry["onnxruntime"]["mean_ms"]
+                report["latency"].append(entry)
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
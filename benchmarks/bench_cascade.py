@@ -0,0 +1,101 @@
+"""
+Two-stage cascade (cheap model -> efficientnet_b3.pt) vs the main model alone.
+
+    python benchmarks/bench_cascade.py --stage1 models/mobilenet_v3.pt \\
+        --stage1-size 224 --confidence 0.6 0.8 --margin 0.1 0.2
+
+Both models run once over the labelled reference photos; every
+(confidence, margin) pair is then evaluated from the recorded outputs:
+escalation rate, mean per-request latency (stage 1 always, stage 2 only
+when escalated) against the main model alone, top-1 agreement with the
+main model and top-1 accuracy.
+"""
+
+import argparse
+import itertools
+import time
+
+from _common import emit, load_model_if_present, reference_photos, species_to_class_index, summarize
+
+from plant_identifier.inference.cascade import confidence_and_margin
+from plant_identifier.inference.preprocess import build_transform, decode_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stage1", required=True, help="TorchScript stage-1 model over the same classes.")
+    parser.add_argument("--stage1-size", type=int, default=224, help="Stage-1 input size (PREDICT_CASCADE_INPUT_SIZE).")
+    parser.add_argument("--model", default=None, help="Stage-2 model (default models/efficientnet_b3.pt).")
+    parser.add_argument("--images", type=int, default=200, help="Reference photos to evaluate.")
+    parser.add_argument("--confidence", type=float, nargs="+", default=[0.5, 0.7, 0.8, 0.9])
+    parser.add_argument("--margin", type=float, nargs="+", default=[0.0, 0.1, 0.2])
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads for the run.")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    stage1 = load_model_if_present(args.stage1)
+    stage2 = load_model_if_present(args.model) if args.model else load_model_if_present()
+    if stage1 is None or stage2 is None:
+        parser.error("both model files are required")
+
+    transforms = {1: build_transform(args.stage1_size), 2: build_transform()}
+    models = {1: stage1, 2: stage2}
+    labels = species_to_class_index()
+
+    def run(stage, image):
+        started = time.perf_counter()
+        with torch.no_grad():
+            probs = torch.softmax(models[stage](transforms[stage](image).unsqueeze(0)), dim=1)[0]
+        return probs, (time.perf_counter() - started) * 1000.0
+
+    warm = decode_image(reference_photos(1)[0][0])
+    for _ in range(3):
+        run(1, warm), run(2, warm)
+
+    rows = []
+    for path, species_id in reference_photos(args.images):
+        image = decode_image(path)
+        p1, ms1 = run(1, image)
+        p2, ms2 = run(2, image)
+        confidence, margin = confidence_and_margin(p1)
+        rows.append({
+            "ms1": ms1, "ms2": ms2, "confidence": confidence, "margin": margin,
+            "top1": int(p1.argmax()), "top2": int(p2.argmax()), "label": labels.get(species_id),
+        })
+
+    def accuracy(predicted):
+        pairs = [(p, r["label"]) for p, r in zip(predicted, rows) if r["label"] is not None]
+        return (sum(p == t for p, t in pairs) / len(pairs)) if pairs else None
+
+    baseline = [r["ms2"] for r in rows]
+    settings = []
+    for min_confidence, min_margin in itertools.product(args.confidence, args.margin):
+        escalated = [r["confidence"] < min_confidence or r["margin"] < min_margin for r in rows]
+        latency = [r["ms1"] + (r["ms2"] if e else 0.0) for r, e in zip(rows, escalated)]
+        final = [r["top2"] if e else r["top1"] for r, e in zip(rows, escalated)]
+        settings.append({
+            "min_confidence": min_confidence,
+            "min_margin": min_margin,
+            "escalation_rate": sum(escalated) / len(rows),
+            "latency": summarize(latency),
+            "avg_latency_saved_ms": (sum(baseline) - sum(latency)) / len(rows),
+            "agreement_with_stage2": sum(f == r["top2"] for f, r in zip(final, rows)) / len(rows),
+            "top1_accuracy": accuracy(final),
+        })
+
+    emit({
+        "images": len(rows),
+        "threads": torch.get_num_threads(),
+        "stage1_size": args.stage1_size,
+        "latency": {"stage1": summarize([r["ms1"] for r in rows]), "stage2": summarize(baseline)},
+        "top1_accuracy": {"stage1": accuracy([r["top1"] for r in rows]), "stage2": accuracy([r["top2"] for r in rows])},
+        "settings": settings,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
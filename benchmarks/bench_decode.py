@@ -0,0 +1,119 @@
+"""
+Full-resolution decode vs JPEG draft-mode decode before Resize(300).
+
+    python benchmarks/bench_decode.py --megapixels 12 48 --images 8
+
+For each upload size, reports per-image decode+transform latency, the peak
+RSS growth of a fresh process decoding the images (PIL allocates outside
+the Python heap, so tracemalloc would not see it), the mean absolute
+difference of the resulting input tensors and, when models/efficientnet_b3.pt
+is present, the top-1 agreement of the model on both paths.
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from _common import emit, load_model_if_present, reference_photos, summarize, time_calls, upscaled_jpeg
+
+from plant_identifier.inference.preprocess import build_transform, decode_image
+
+
+def _uploads(megapixels, count):
+    return [upscaled_jpeg(path, megapixels) for path, _ in reference_photos(count)]
+
+
+def _vm_hwm_kb():
+    # Peak RSS of this mm. Unlike ru_maxrss it is not inherited across exec,
+    # so the (large) parent process does not mask the child's peak.
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _peak_rss_worker(paths, draft):
+    """Runs in a child process: decode every upload, print the peak RSS growth in kB."""
+    uploads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            uploads.append(f.read())
+    transform = build_transform()
+    transform(decode_image(io.BytesIO(uploads[0]), draft=True).resize((8, 8)))  # warm imports
+    before = _vm_hwm_kb()
+    for data in uploads:
+        transform(decode_image(io.BytesIO(data), draft=draft))
+    after = _vm_hwm_kb()
+    print(json.dumps({"peak_rss_growth_kb": after - before}))
+
+
+def _peak_rss(uploads, draft):
+    # Uploads are generated here and handed over as files: building a 48 MP
+    # JPEG in the child would itself set the high-water mark being measured.
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i, data in enumerate(uploads):
+            paths.append(os.path.join(tmp, f"{i}.jpg"))
+            with open(paths[-1], "wb") as f:
+                f.write(data)
+        out = subprocess.run(
+            [sys.executable, __file__, "--_worker", "1" if draft else "0", *paths],
+            capture_output=True, text=True, check=True,
+        )
+    return json.loads(out.stdout.strip().splitlines()[-1])["peak_rss_growth_kb"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[12, 24, 48])
+    parser.add_argument("--images", type=int, default=8, help="Reference photos re-encoded per size.")
+    parser.add_argument("--runs", type=int, default=3, help="Timed passes over the image set.")
+    parser.add_argument("--model", default=None, help="TorchScript model for the agreement check.")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    parser.add_argument("--_worker", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._worker:
+        draft, *paths = args._worker
+        _peak_rss_worker(paths, draft == "1")
+        return
+
+    import torch
+
+    model = load_model_if_present(args.model) if args.model else load_model_if_present()
+    transform = build_transform()
+    report = {"images": args.images, "model": bool(model), "sizes": []}
+
+    for mp in args.megapixels:
+        uploads = _uploads(mp, args.images)
+        entry = {"megapixels": mp}
+        tensors = {}
+        for name, draft in (("full", False), ("draft", True)):
+            def run():
+                return [transform(decode_image(io.BytesIO(d), draft=draft)) for d in uploads]
+            tensors[name] = run()
+            timings = time_calls(run, args.runs, warmup=1)
+            entry[name] = {
+                "per_image": summarize([t / len(uploads) for t in timings]),
+                "peak_rss_growth_kb": _peak_rss(uploads, draft),
+            }
+
+        full, draft = torch.stack(tensors["full"]), torch.stack(tensors["draft"])
+        entry["tensor_mean_abs_diff"] = float((full - draft).abs().mean())
+        if model is not None:
+            with torch.no_grad():
+                agree = (model(full).argmax(1) == model(draft).argmax(1)).float().mean()
+            entry["top1_agreement"] = float(agree)
+        entry["speedup"] = entry["full"]["per_image"]["mean_ms"] / entry["draft"]["per_image"]["mean_ms"]
+        report["sizes"].append(entry)
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Stage-by-stage micro-benchmark of the /predict/ hot path, without Django.
+
+    python benchmarks/bench_pipeline.py --batch-sizes 1 4 8 --threads 1 4 \\
+        --megapixels 1 12 --output pipeline.json
+
+Times each stage on its own, with the same code the views run:
+  decode          decode_image (JPEG draft mode unless --no-draft)
+  transform       build_transform() on the decoded image
+  forward         model(batch) under no_grad
+  softmax_argmax  softmax + top-k over the batch
+  species_lookup  class index -> species id / names via the class tables
+  end_to_end      all of the above for one batch of uploads
+
+Every stage reports p50/p95/p99, mean and items/s (images/s). Uses
+models/efficientnet_b3.pt when present, otherwise a generated stand-in with
+the same architecture (see _common.stand_in_model).
+"""
+
+import argparse
+import io
+import os
+import platform
+
+from _common import emit, load_model_or_stand_in, load_species_tables, sample_jpeg, summarize, time_calls
+
+from plant_identifier.inference.preprocess import build_transform, decode_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 12], help="Upload sizes.")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=10, help="Timed calls per stage.")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--no-draft", action="store_true", help="Decode JPEGs at full resolution.")
+    parser.add_argument("--model", default=None, help="TorchScript model (default models/efficientnet_b3.pt).")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    args = parser.parse_args()
+
+    import torch
+
+    model, source = load_model_or_stand_in(args.model) if args.model else load_model_or_stand_in()
+    species_ids, cmn_names, scn_names = load_species_tables()
+    transform = build_transform()
+    draft = not args.no_draft
+    max_batch = max(args.batch_sizes)
+    uploads = {mp: [sample_jpeg(mp, i) for i in range(max_batch)] for mp in args.megapixels}
+
+    def postprocess(batch):
+        probs = torch.softmax(model(batch), dim=1)
+        return torch.topk(probs, args.top_k, dim=1)
+
+    def lookup(indices):
+        idx = indices.numpy()
+        return species_ids[idx], cmn_names[idx], scn_names[idx]
+
+    report = {
+        "model": source,
+        "torch": torch.__version__,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "draft_decode": draft,
+        "top_k": args.top_k,
+        "runs": args.runs,
+        "configs": [],
+    }
+
+    with torch.no_grad():
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            config = {"threads": threads, "preprocess": [], "batches": []}
+
+            for mp, images in uploads.items():
+                data = images[0]
+                decoded = decode_image(io.BytesIO(data), draft=draft)
+                config["preprocess"].append({
+                    "megapixels": mp,
+                    "decoded_size": list(decoded.size),
+                    "decode": summarize(time_calls(lambda: decode_image(io.BytesIO(data), draft=draft), args.runs, args.warmup)),
+                    "transform": summarize(time_calls(lambda: transform(decoded), args.runs, args.warmup)),
+                })
+
+            sample = transform(decode_image(io.BytesIO(uploads[args.megapixels[0]][0]), draft=draft))
+            for batch_size in args.batch_sizes:
+                batch = sample.unsqueeze(0).repeat(batch_size, 1, 1, 1)
+                logits = model(batch)
+                _, top_idx = postprocess(batch)
+                entry = {
+                    "batch_size": batch_size,
+                    "forward": summarize(time_calls(lambda: model(batch), args.runs, args.warmup), batch_size),
+                    "softmax_argmax": summarize(time_calls(
+                        lambda: torch.topk(torch.softmax(logits, dim=1), args.top_k, dim=1), args.runs, args.warmup
+                    ), batch_size),
+                    "species_lookup": summarize(time_calls(lambda: lookup(top_idx), args.runs, args.warmup), batch_size),
+                    "end_to_end": [],
+                }
+                for mp, images in uploads.items():
+                    chunk = images[:batch_size]
+
+                    def pipeline():
+                        tensors = [transform(decode_image(io.BytesIO(d), draft=draft)) for d in chunk]
+                        _, idx = postprocess(torch.stack(tensors))
+                        lookup(idx)
+
+                    entry["end_to_end"].append({
+                        "megapixels": mp,
+                        **summarize(time_calls(pipeline, args.runs, args.warmup), batch_size),
+                    })
+                config["batches"].append(entry)
+            report["configs"].append(config)
+
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Per-image torchvision preprocessing vs the fused uint8 path with pooled input buffers.
+
+    python benchmarks/bench_preprocess.py --images 32 --batch-sizes 1 8
+
+Over decoded reference photos (synthetic uploads when media/images is
+empty), reports for each batch size the latency of building a model-input
+batch on both paths:
+
+  classic   Resize -> CenterCrop -> ToTensor -> Normalize per image, then
+            torch.stack into a new batch (what /predict/ did before)
+  fused     one PIL resize of the crop box to a uint8 crop per image, then
+            a single normalize of each crop into a reused, preallocated
+            batch buffer (PREDICT_FUSED_PREPROCESS=1)
+
+and the torch tensor allocations (count and bytes, from torch.profiler)
+needed per batch. Both paths decode the same way, so decoding is left out.
+With --forward, the model's forward pass is timed on top (real weights when
+present, else a stand-in) together with the top-1 agreement of both inputs.
+"""
+
+import argparse
+import io
+
+from _common import emit, load_model_or_stand_in, reference_photos, sample_jpeg, summarize, time_calls
+
+from plant_identifier.inference.preprocess import (
+    FusedPreprocess, InputBufferPool, build_transform, decode_image,
+)
+
+
+def _images(count):
+    photos = reference_photos(count)
+    if photos:
+        return [decode_image(path, draft=True) for path, _ in photos]
+    return [decode_image(io.BytesIO(sample_jpeg(2, index=i)), draft=True) for i in range(count)]
+
+
+def _allocations(fn):
+    """(count, bytes) of torch CPU allocations made by one call of ``fn``."""
+    from torch.profiler import ProfilerActivity, profile
+
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn()
+    allocs = [e.self_cpu_memory_usage for e in prof.events() if e.self_cpu_memory_usage > 0]
+    return len(allocs), sum(allocs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=32, help="Decoded photos cycled through the batches.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--runs", type=int, default=20, help="Timed batches per path and size.")
+    parser.add_argument("--forward", action="store_true", help="Also time the forward pass on both inputs.")
+    parser.add_argument("--model", default=None, help="TorchScript model for --forward.")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    args = parser.parse_args()
+
+    import torch
+
+    images = _images(args.images)
+    transform = build_transform()
+    fused = FusedPreprocess()
+    pool = InputBufferPool(fused.size, capacity=max(args.batch_sizes))
+
+    model = source = None
+    if args.forward:
+        model, source = load_model_or_stand_in(args.model) if args.model else load_model_or_stand_in()
+
+    report = {"images": len(images), "model": source, "batch_sizes": []}
+    for batch_size in args.batch_sizes:
+        batches = [
+            [images[(start + i) % len(images)] for i in range(batch_size)]
+            for start in range(0, len(images), batch_size)
+        ]
+        cursor = {"classic": 0, "fused": 0}
+
+        def classic():
+            batch = batches[cursor["classic"] % len(batches)]
+            cursor["classic"] += 1
+            return torch.stack([transform(image) for image in batch])
+
+        def fused_batch():
+            batch = batches[cursor["fused"] % len(batches)]
+            cursor["fused"] += 1
+            buf = pool.acquire(len(batch))
+            try:
+                return fused.normalize_into([fused.crop_uint8(image) for image in batch], buf[:len(batch)])
+            finally:
+                pool.release(buf)
+
+        entry = {"batch_size": batch_size}
+        for name, fn in (("classic", classic), ("fused", fused_batch)):
+            timings = time_calls(fn, args.runs, warmup=2)
+            count, nbytes = _allocations(fn)
+            entry[name] = {
+                "per_image": summarize([t / batch_size for t in timings]),
+                "torch_allocations_per_batch": count,
+                "torch_alloc_mb_per_batch": nbytes / (1024 * 1024),
+            }
+
+        expected, actual = classic(), fused_batch().clone()
+        diff = (expected - actual).abs()
+        entry["input_max_abs_diff"] = float(diff.max())
+        entry["input_mean_abs_diff"] = float(diff.mean())
+        entry["speedup"] = entry["classic"]["per_image"]["mean_ms"] / entry["fused"]["per_image"]["mean_ms"]
+
+        if model is not None:
+            with torch.no_grad():
+                entry["forward"] = {
+                    name: summarize(time_calls(lambda: model(fn()), max(3, args.runs // 4), warmup=1), batch_size)
+                    for name, fn in (("classic", classic), ("fused", fused_batch))
+                }
+                agree = (model(expected).argmax(1) == model(actual).argmax(1)).float().mean()
+            entry["top1_agreement"] = float(agree)
+        report["batch_sizes"].append(entry)
+
+    report["input_pool"] = pool.stats()
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Accuracy and latency of the main model at each resolution tier.
+
+    python benchmarks/bench_resolution.py --images 100 --tiers 300 260 224 --batch-sizes 1 8
+
+Over the labelled reference photos in media/images/<species_id>/, runs the
+model on center crops at every tier (the same fused preprocessing the
+server uses with PREDICT_ADAPTIVE_RESOLUTION=1) and reports per tier:
+
+  top1_accuracy        against the photo's species label
+  agreement_with_full  top-1 agreement with the first (full) tier
+  forward              forward-pass latency per batch size, p50/p95/p99
+
+These are the numbers to pick PREDICT_RESOLUTION_TIERS from: how much
+accuracy each step down gives up for how much latency. Uses the stand-in
+model when the weights are missing (latency only; accuracy is meaningless).
+"""
+
+import argparse
+import io
+
+from _common import (
+    emit, load_model_or_stand_in, reference_photos, sample_jpeg, species_to_class_index, summarize, time_calls,
+)
+
+from plant_identifier.inference.preprocess import INPUT_SIZE, FusedPreprocess, decode_image
+from plant_identifier.inference.resolution import parse_tiers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=100, help="Reference photos to evaluate.")
+    parser.add_argument("--tiers", type=int, nargs="+", default=[300, 260, 224])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--runs", type=int, default=20, help="Timed forward passes per tier and batch size.")
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads for the run.")
+    parser.add_argument("--model", default=None, help="TorchScript model (default models/efficientnet_b3.pt).")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, source = load_model_or_stand_in(args.model) if args.model else load_model_or_stand_in()
+    tiers = parse_tiers(",".join(map(str, args.tiers)), INPUT_SIZE)
+    labels = species_to_class_index()
+
+    photos = reference_photos(args.images)
+    if photos:
+        images = [decode_image(path, draft=True) for path, _ in photos]
+        truth = [labels.get(species_id) for _, species_id in photos]
+    else:
+        images = [decode_image(io.BytesIO(sample_jpeg(2, index=i)), draft=True) for i in range(8)]
+        truth = [None] * len(images)
+
+    def predict(batch):
+        with torch.no_grad():
+            return model(batch).argmax(dim=1)
+
+    report = {"model": source, "images": len(images), "labelled": sum(t is not None for t in truth), "tiers": []}
+    full_top = None
+    for size in tiers:
+        preprocess = FusedPreprocess(size)
+        inputs = torch.stack([preprocess(image) for image in images])
+        top = torch.cat([predict(inputs[i:i + 16]) for i in range(0, len(inputs), 16)]).tolist()
+        if full_top is None:
+            full_top = top
+
+        scored = [(p, t) for p, t in zip(top, truth) if t is not None]
+        entry = {
+            "resolution": size,
+            "relative_pixels": (size / tiers[0]) ** 2,
+            "top1_accuracy": sum(p == t for p, t in scored) / len(scored) if scored else None,
+            "agreement_with_full": sum(a == b for a, b in zip(top, full_top)) / len(top),
+            "forward": {},
+        }
+        for batch_size in args.batch_sizes:
+            batch = inputs[:batch_size].repeat((batch_size + len(inputs) - 1) // len(inputs), 1, 1, 1)[:batch_size]
+            timings = time_calls(lambda: predict(batch), args.runs, warmup=3)
+            entry["forward"][str(batch_size)] = summarize(timings, batch_size)
+        report["tiers"].append(entry)
+
+    full_ms = {bs: report["tiers"][0]["forward"][bs]["p50_ms"] for bs in report["tiers"][0]["forward"]}
+    for entry in report["tiers"]:
+        entry["p50_speedup_vs_full"] = {bs: full_ms[bs] / run["p50_ms"] for bs, run in entry["forward"].items()}
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
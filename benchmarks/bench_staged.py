@@ -0,0 +1,127 @@
+"""
+Serial decode -> transform -> forward per request vs the staged pipeline.
+
+    python benchmarks/bench_staged.py --requests 64 --clients 4 --workers 2 --megapixels 3
+
+--clients threads each send uploads (re-encoded reference photos, synthetic
+when media/images is empty) and wait for the answer, like threaded web
+workers. Two modes run over the same uploads:
+
+  serial   every client decodes, transforms and runs the model itself
+           (what /predict/ does without PREDICT_PIPELINE)
+  staged   clients submit to a StagedPipeline: --workers threads decode and
+           transform, one inference thread runs the model
+           (PREDICT_PIPELINE=1, PREDICT_PIPELINE_WORKERS)
+
+Reports throughput and per-request latency for both, plus the staged run's
+per-stage utilization and queue waits, which show whether decode or the
+model is the bottleneck.
+"""
+
+import argparse
+import io
+import threading
+import time
+
+from _common import emit, load_model_or_stand_in, reference_photos, sample_jpeg, summarize, upscaled_jpeg
+
+from plant_identifier.inference import metrics
+from plant_identifier.inference.batching import MicroBatcher
+from plant_identifier.inference.pipeline import StagedPipeline
+from plant_identifier.inference.preprocess import FusedPreprocess, decode_image
+
+
+def _uploads(count, megapixels):
+    photos = reference_photos(count)
+    if photos:
+        return [upscaled_jpeg(path, megapixels) for path, _ in photos]
+    return [sample_jpeg(megapixels, index=i) for i in range(count)]
+
+
+def _drive(uploads, requests, clients, handle):
+    """Run ``requests`` calls of ``handle(upload)`` from ``clients`` threads -> (latencies ms, wall s)."""
+    latencies, lock = [], threading.Lock()
+    cursor = iter(range(requests))
+
+    def client():
+        while True:
+            with lock:
+                i = next(cursor, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            handle(uploads[i % len(uploads)])
+            elapsed = (time.perf_counter() - started) * 1000.0
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=4, help="Concurrent client threads.")
+    parser.add_argument("--workers", type=int, default=2, help="Decode/transform threads of the staged run.")
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--max-batch-size", type=int, default=1, help="Inference batch size of the staged run.")
+    parser.add_argument("--megapixels", type=float, default=3, help="Upload size.")
+    parser.add_argument("--images", type=int, default=16, help="Distinct uploads cycled through.")
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads for the run.")
+    parser.add_argument("--model", default=None, help="TorchScript model (default models/efficientnet_b3.pt).")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model, source = load_model_or_stand_in(args.model) if args.model else load_model_or_stand_in()
+    preprocess = FusedPreprocess()
+    uploads = _uploads(args.images, args.megapixels)
+
+    def prepare(data):
+        return None, preprocess(decode_image(io.BytesIO(data), draft=True))
+
+    def forward(inputs):
+        with torch.no_grad():
+            return list(torch.softmax(model(torch.stack(inputs)), dim=1).unbind(0))
+
+    def serial(data):
+        _, tensor = prepare(data)
+        return forward([tensor])[0]
+
+    for data in uploads[:2]:
+        serial(data)   # warm-up
+
+    report = {"model": source, "requests": args.requests, "clients": args.clients, "megapixels": args.megapixels}
+    latencies, wall = _drive(uploads, args.requests, args.clients, serial)
+    report["serial"] = {"requests_per_s": args.requests / wall, "latency": summarize(latencies)}
+
+    infer = MicroBatcher(forward, max_batch_size=args.max_batch_size, max_wait_ms=0, name="bench.staged.infer")
+    pipeline = StagedPipeline(
+        prepare, infer, workers=args.workers, queue_size=args.queue_size, name="bench.staged",
+    )
+    latencies, wall = _drive(uploads, args.requests, args.clients, lambda data: pipeline.submit((data,)).result())
+    snapshot = metrics.snapshot()
+    report["staged"] = {
+        "workers": args.workers,
+        "requests_per_s": args.requests / wall,
+        "latency": summarize(latencies),
+        "prepare_utilization": snapshot["bench.staged.prepare.utilization"],
+        "infer_utilization": snapshot["bench.staged.infer.utilization"],
+        "prepare_queue_wait_ms": snapshot["bench.staged.prepare.queue_wait_ms"]["p50"],
+        "infer_queue_wait_ms": snapshot["bench.staged.infer.queue_wait_ms"]["p50"],
+    }
+    report["throughput_gain"] = report["staged"]["requests_per_s"] / report["serial"]["requests_per_s"]
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Throughput matrix over gunicorn-like worker counts x torch threads per worker.
+
+    python benchmarks/bench_threads.py --workers 1 2 4 --threads 1 2 4 --pin
+
+Each cell starts ``workers`` separate processes, applies the thread plan
+the server would (plant_identifier.inference.threads), and has every
+process run batch-1 forward passes back to back for --seconds. Reports
+aggregate images/s and per-request p50/p95/p99 latency for every cell, and
+the cell where throughput peaks. Uses models/efficientnet_b3.pt when
+present, otherwise the generated stand-in.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from _common import DEFAULT_MODEL, emit, stand_in_model, summarize
+
+from plant_identifier.inference.threads import available_cpus
+
+
+def _worker(model_path, workers, slot, threads, pin, start_at, seconds):
+    """Runs in a child process; prints its latencies (ms) as JSON."""
+    import torch
+
+    from plant_identifier.inference.threads import apply_threads, plan_threads
+
+    applied = apply_threads(plan_threads(workers, available_cpus(), threads=threads, pin=pin, slot=slot))
+    model = torch.jit.load(model_path, map_location="cpu").eval()
+    x = torch.randn(1, 3, 300, 300)
+    with torch.no_grad():
+        for _ in range(3):
+            model(x)
+        time.sleep(max(0.0, start_at - time.time()))
+        timings = []
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            model(x)
+            timings.append((time.perf_counter() - started) * 1000.0)
+    print(json.dumps({"timings_ms": timings, "errors": applied["errors"]}))
+
+
+def _cell(model_path, workers, threads, pin, seconds):
+    # Start all workers at the same wall-clock instant, after model load and warm-up.
+    start_at = time.time() + 5.0 + 2.0 * workers
+    procs = [
+        subprocess.Popen(
+            [sys.executable, __file__, "--_worker", model_path, str(workers), str(slot),
+             str(threads), "1" if pin else "0", repr(start_at), repr(seconds)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        for slot in range(workers)
+    ]
+    timings, errors = [], set()
+    for proc in procs:
+        out, _ = proc.communicate()
+        result = json.loads(out.strip().splitlines()[-1])
+        timings.extend(result["timings_ms"])
+        errors.update(result["errors"])
+    latency = summarize(timings)
+    return {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "total_threads": workers * threads,
+        "pinned": pin,
+        "images_per_s": len(timings) / seconds,
+        "latency": latency,
+        "errors": sorted(errors),
+    }
+
+
+def main():
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, max(1, cpus // 2), cpus}))
+    parser.add_argument("--threads", type=int, nargs="+", default=sorted({1, 2, max(1, cpus // 2), cpus}))
+    parser.add_argument("--pin", action="store_true", help="Pin each worker to its slice of the CPUs.")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Measurement window per cell.")
+    parser.add_argument("--model", default=None, help="TorchScript model (default models/efficientnet_b3.pt).")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    parser.add_argument("--_worker", nargs=7, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._worker:
+        path, workers, slot, threads, pin, start_at, seconds = args._worker
+        _worker(path, int(workers), int(slot), int(threads), pin == "1", float(start_at), float(seconds))
+        return
+
+    model_path = args.model or DEFAULT_MODEL
+    if not os.path.isfile(model_path):
+        model_path = stand_in_model()
+
+    cells = []
+    for workers in args.workers:
+        for threads in args.threads:
+            cell = _cell(model_path, workers, threads, args.pin, args.seconds)
+            cells.append(cell)
+            print(
+                f"workers={workers} threads={threads}: {cell['images_per_s']:.1f} img/s, "
+                f"p95 {cell['latency']['p95_ms'] or 0:.0f} ms",
+                file=sys.stderr,
+            )
+
+    best = max(cells, key=lambda c: c["images_per_s"])
+    emit({
+        "model": model_path,
+        "cpus": cpus,
+        "seconds": args.seconds,
+        "cells": cells,
+        "peak": {k: best[k] for k in ("workers", "threads_per_worker", "images_per_s")},
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
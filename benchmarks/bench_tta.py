@@ -0,0 +1,114 @@
+"""
+Plain prediction vs batched test-time augmentation (TTA).
+
+    python benchmarks/bench_tta.py --images 100 --views 8 --threshold 0.5
+
+Over the labelled reference photos in media/images/<species_id>/, reports
+the latency of the plain forward pass, of TTA as one batched call, and of
+the same views run as sequential batch-1 calls (what TTA would cost without
+batching), plus top-1 accuracy of plain, always-on TTA and TTA triggered
+only below --threshold confidence (with the fraction of requests that
+escalate). Needs models/efficientnet_b3.pt or --model.
+"""
+
+import argparse
+import time
+
+from _common import emit, load_model_if_present, reference_photos, species_to_class_index, summarize
+
+from plant_identifier.inference.preprocess import TTATransform, build_transform, decode_image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=100, help="Reference photos to evaluate.")
+    parser.add_argument("--views", type=int, default=8, help="TTA views per image (incl. the plain one).")
+    parser.add_argument("--zoom", type=float, default=1.15)
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.3, 0.5, 0.7],
+                        help="Confidence thresholds for the low-confidence trigger.")
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads for the run.")
+    parser.add_argument("--model", default=None, help="TorchScript model (default models/efficientnet_b3.pt).")
+    parser.add_argument("--output", help="Also write the JSON report here.")
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model_if_present(args.model) if args.model else load_model_if_present()
+    if model is None:
+        parser.error("model weights not found; pass --model")
+
+    transform = build_transform()
+    tta = TTATransform(zoom=args.zoom, views=args.views)
+    labels = species_to_class_index()
+
+    def probs(batch):
+        with torch.no_grad():
+            return torch.softmax(model(batch), dim=1)
+
+    probs(transform(decode_image(reference_photos(1)[0][0])).unsqueeze(0))  # warm-up
+    for _ in range(2):
+        probs(torch.zeros(len(tta) - 1, 3, tta.size, tta.size))
+
+    plain_ms, batched_ms, sequential_ms = [], [], []
+    plain_top, tta_top, plain_conf = [], [], []
+    truth = []
+    for path, species_id in reference_photos(args.images):
+        image = decode_image(path)
+
+        started = time.perf_counter()
+        p_plain = probs(transform(image).unsqueeze(0))[0]
+        plain_ms.append((time.perf_counter() - started) * 1000.0)
+
+        # Extra views only: the plain row is reused, as the server does.
+        started = time.perf_counter()
+        extra = tta(image, include_base=False)
+        p_tta = (probs(extra).sum(dim=0) + p_plain) / len(tta)
+        batched_ms.append((time.perf_counter() - started) * 1000.0)
+
+        started = time.perf_counter()
+        for view in tta(image, include_base=False):
+            probs(view.unsqueeze(0))
+        sequential_ms.append((time.perf_counter() - started) * 1000.0)
+
+        plain_top.append(int(p_plain.argmax()))
+        plain_conf.append(float(p_plain.max()))
+        tta_top.append(int(p_tta.argmax()))
+        truth.append(labels.get(species_id))
+
+    def accuracy(predicted):
+        pairs = [(p, t) for p, t in zip(predicted, truth) if t is not None]
+        return (sum(p == t for p, t in pairs) / len(pairs)) if pairs else None
+
+    thresholds = []
+    for threshold in args.threshold:
+        escalated = [c < threshold for c in plain_conf]
+        mixed = [t if e else p for p, t, e in zip(plain_top, tta_top, escalated)]
+        mean_extra = sum(b for b, e in zip(batched_ms, escalated) if e) / len(batched_ms)
+        thresholds.append({
+            "threshold": threshold,
+            "escalation_rate": sum(escalated) / len(escalated),
+            "top1_accuracy": accuracy(mixed),
+            "mean_added_ms": mean_extra,
+        })
+
+    report = {
+        "images": len(truth),
+        "views": len(tta),
+        "zoom": args.zoom,
+        "threads": torch.get_num_threads(),
+        "latency": {
+            "plain": summarize(plain_ms),
+            "tta_batched_extra": summarize(batched_ms),
+            "tta_sequential_extra": summarize(sequential_ms),
+        },
+        "batched_vs_sequential_speedup": sum(sequential_ms) / sum(batched_ms),
+        "top1_accuracy": {"plain": accuracy(plain_top), "tta": accuracy(tta_top)},
+        "low_confidence_trigger": thresholds,
+    }
+    emit(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# gunicorn.conf.py
+#
+# gunicorn picks this file up from the working directory:
+#
+#     gunicorn            # uses wsgi_app below
+#
+# Opt in with PREDICT_PRELOAD=1 to load the TorchScript model and species
+# tables once in the master before fork, so every worker shares the same
+# weight pages copy-on-write instead of holding its own copy:
+#
+#     PREDICT_PRELOAD=1 gunicorn
+#
+# It turns on preload_app, so it does not combine with --reload, and a
+# model that fails to load is logged by the master (workers then load
+# lazily). Check the sharing with:
+#
+#     python manage.py memory_report --pidfile gunicorn.pid
+#
+# `manage.py build_fast_start` writes models/efficientnet_b3.fast.pt; with
+# PREDICT_FAST_START=1 its weights are memory-mapped rather than
+# deserialized, which keeps master and worker (re)starts short.
+#
+# Each worker sizes its torch thread pools from the core budget divided by
+# the worker count (and optionally pins itself to its own CPUs), see
+# plant_identifier/inference/threads.py for the PREDICT_* knobs.
+
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "plant.settings")
+
+_preload = os.getenv("PREDICT_PRELOAD", "0").strip().lower() in ("1", "true", "yes")
+if _preload:
+    # Tells prediction_views not to warm up in the master (see hooks below).
+    os.environ["PREDICT_PREFORK"] = "1"
+
+wsgi_app = "plant.wsgi:application"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+pidfile = os.getenv("GUNICORN_PIDFILE", "gunicorn.pid")
+preload_app = _preload
+
+
+def on_starting(server):
+    if not _preload:
+        return
+    # The app (and Django) is already imported at this point because of
+    # preload_app; load the model before the first worker is forked.
+    from plant_identifier.views import prediction_views
+    from plant_identifier.inference.memory import model_bytes
+
+    try:
+        prediction_views.preload_for_fork()
+    except Exception as e:
+        server.log.warning("Model preload failed, workers will load lazily: %s", e)
+        return
+    report = prediction_views._load_report
+    server.log.info(
+        "Preloaded model in master (%.0f ms, %.1f MB of weights, %s from %s)",
+        prediction_views._readiness["load_ms"],
+        model_bytes(prediction_views._model) / (1024 * 1024),
+        report["format"], report["artifact"],
+    )
+
+
+def pre_fork(server, worker):
+    # Stable slot per worker (reused when a worker is replaced), used to pick
+    # the CPU slice when PREDICT_PIN_CPUS is on.
+    taken = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(i for i in range(len(taken) + 1) if i not in taken)
+
+
+def post_fork(server, worker):
+    # Before the app (or any forward pass) touches torch in this worker.
+    from plant_identifier.inference.threads import configure_from_env
+
+    applied = configure_from_env(server.cfg.workers, slot=worker.cpu_slot)
+    worker.log.info(
+        "Worker %s torch threads: intra-op %d, inter-op %d, cpus %s%s",
+        worker.pid, applied["intra_op_threads"], applied["inter_op_threads"],
+        applied["pinned_cpus"] or "unpinned",
+        f" ({'; '.join(applied['errors'])})" if applied["errors"] else "",
+    )
+
+
+def post_worker_init(worker):
+    from plant_identifier.views import prediction_views
+    from plant_identifier.inference.memory import process_memory
+
+    if prediction_views.PREDICT_EAGER_LOAD:
+        prediction_views.warm_up()
+
+    mem = process_memory(os.getpid())
+    if mem:
+        worker.log.info(
+            "Worker %s ready: rss %.1f MB, shared %.1f MB, unique %.1f MB",
+            worker.pid, mem["rss_kb"] / 1024, mem["shared_kb"] / 1024, mem["unique_kb"] / 1024,
+        )
@@ -10,24 +10,26 @@ from . import views
 
 # Mobile app endpoints (existing)
 from plant_identifier.views.auth_views import registerUser, loginUser
-from plant_identifier.views.prediction_views import predict, explain_llm
+from plant_identifier.views.prediction_views import predict, predict_async, predict_batch, predict_metrics, ready, similar, explain_llm
 from plant_identifier.views.random_views import random_plants
 from plant_identifier.views.saved_plant_views import SavedPlantListCreateView, SavedPlantDetailView
 from plant_identifier.views.plant_history_views import PlantHistoryListCreateView, PlantHistoryDetailView
-<<<<<<< HEAD
 from plant_identifier.views.reports_view import generate_report
-=======
 from plant_identifier.views.admin_views import AllPlantIdentificationsView, AnalyticsPlantView
 
 # Import the dashboard stats view directly
 from authentication.views import DashboardStatsView
->>>>>>> 21f4496113b2d8c585353a6bc54f7b67f4f2fac0
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('register/', registerUser, name='register'),
     path('login/', loginUser, name='login'),
     path('predict/', predict, name='predict'),
+    path('predict/async/', predict_async, name='predict_async'),
+    path('predict/batch/', predict_batch, name='predict_batch'),
+    path('predict/metrics/', predict_metrics, name='predict_metrics'),
+    path('ready/', ready, name='ready'),
+    path('similar/', similar, name='similar'),
     path('explain-llm/', explain_llm, name='explain_llm'),
     path('random-plants/', random_plants, name='random_plants'),
     path('api/plants/admin/identifications/', AllPlantIdentificationsView.as_view(), name='admin_identifications'),
@@ -38,11 +40,10 @@ urlpatterns = [
 
     path('plant-history/', PlantHistoryListCreateView.as_view(), name='plant-history'),
     path('plant-history/<int:id>/', PlantHistoryDetailView.as_view(), name='plant-history-detail'),
-<<<<<<< HEAD
 
     # Report module
     path('reports/', generate_report),
-=======
+
     path('api/plants/analytics/', AnalyticsPlantView.as_view(), name='analytics-plant'),
     
 
@@ -67,7 +68,6 @@ urlpatterns = [
     path('', views.plant_list_create, name='plant-list-create'),
     path('api/plants/<str:plant_id>/', views.plant_detail, name='plant-detail'),
     path('api/plants/tags/available/', views.get_available_tags, name='available-tags'),
->>>>>>> 21f4496113b2d8c585353a6bc54f7b67f4f2fac0
 ]
 
 if settings.DEBUG:
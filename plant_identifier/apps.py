@@ -1,6 +1,15 @@
+import os
+
 from django.apps import AppConfig
 
 
 class PlantIdentifierConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'plant_identifier'
+
+    def ready(self):
+        # Opt-in eager model load + warm-up. Checked here so management
+        # commands don't import torch unless the deployment asks for it.
+        if os.getenv("PREDICT_EAGER_LOAD", "0").strip().lower() in ("1", "true", "yes"):
+            from .views import prediction_views
+            prediction_views.start_warm_up()
@@ -0,0 +1,123 @@
+# plant_identifier/flagging.py
+#
+# Automatic review flags: uncertain /predict/ results become FlaggedCase rows
+# (reason low_confidence or multiple_matches) through the same kind of
+# write-behind queue as the prediction history, under an hourly cap.
+
+import atexit
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .history import WriteBehindQueue, save_upload, upload_name
+from .inference import metrics
+
+# FlaggedCase.submitted_by of every automatic flag. The hourly cap matches
+# it exactly; a username cannot contain ":", so no person's reports count.
+AUTO_SUBMITTER = "auto:predict"
+
+
+class HourlyCap:
+    """In-process limit of ``limit`` events per clock hour; cheap pre-check before queueing."""
+
+    def __init__(self, limit: int):
+        self.limit = int(limit)
+        self._lock = threading.Lock()
+        self._hour = None
+        self._count = 0
+
+    def allow(self) -> bool:
+        hour = int(time.time() // 3600)
+        with self._lock:
+            if hour != self._hour:
+                self._hour, self._count = hour, 0
+            if self._count >= self.limit:
+                return False
+            self._count += 1
+            return True
+
+
+def flag_reason(confidence: float, margin: float, min_confidence: float, min_margin: float):
+    """FlaggedCase reason for a prediction, or None when it needs no review."""
+    if confidence < min_confidence:
+        return "low_confidence"
+    if margin < min_margin:
+        return "multiple_matches"
+    return None
+
+
+def make_flag_writer(max_per_hour: int):
+    """
+    Flush callback enforcing the cap across workers: rows already flagged
+    automatically in the last hour count against it, and an upload already
+    flagged in that window is not flagged again.
+    """
+    rate_limited = metrics.counter("predict.flags.rate_limited")
+
+    def write_flags(records):
+        from plant.models import FlaggedCase
+
+        since = timezone.now() - timedelta(hours=1)
+        recent = FlaggedCase.objects.filter(submitted_at__gte=since, submitted_by=AUTO_SUBMITTER)
+
+        cases, uploads = [], {}
+        for r in records:
+            name = upload_name(r["image"])
+            image_url = r["media_base_url"] + name
+            if image_url in uploads:
+                continue
+            uploads[image_url] = (name, r["image"])
+            cases.append(FlaggedCase(
+                plant_name=r["plant_name"],
+                image_url=image_url,
+                reason=r["reason"],
+                confidence=r["confidence"],
+                submitted_by=AUTO_SUBMITTER,
+            ))
+
+        with transaction.atomic():
+            already = set(recent.filter(image_url__in=list(uploads)).values_list("image_url", flat=True))
+            cases = [c for c in cases if c.image_url not in already]
+            room = max(0, max_per_hour - recent.count())
+            if len(cases) > room:
+                rate_limited.inc(len(cases) - room)
+                cases = cases[:room]
+            # Only uploads that end up flagged are written to storage.
+            for case in cases:
+                name, data = uploads[case.image_url]
+                save_upload(data, name)
+            FlaggedCase.objects.bulk_create(cases)
+
+    return write_flags
+
+
+_flag_queue = None
+_flag_cap = None
+_queue_lock = threading.Lock()
+
+
+def flag_queue(max_per_hour: int, **kwargs):
+    """(WriteBehindQueue, HourlyCap) for this process, created on first use."""
+    global _flag_queue, _flag_cap
+    if _flag_queue is None:
+        with _queue_lock:
+            if _flag_queue is None:
+                _flag_cap = HourlyCap(max_per_hour)
+                _flag_queue = WriteBehindQueue(make_flag_writer(max_per_hour), name="predict.flags", **kwargs)
+                atexit.register(_flag_queue.drain)
+    return _flag_queue, _flag_cap
+
+
+def _reset_after_fork():
+    # As in history.py: each forked worker starts its own writer thread.
+    global _flag_queue, _flag_cap, _queue_lock
+    _flag_queue = None
+    _flag_cap = None
+    _queue_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,220 @@
+# plant_identifier/history.py
+#
+# Write-behind logging of predictions into PlantHistory / PlantIdentification.
+# /predict/ only enqueues a record; a background thread batches the inserts
+# so no response ever waits on SQLite's write lock.
+
+import atexit
+import hashlib
+import io
+import os
+import queue
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError, close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .inference import metrics
+from .models import PlantHistory
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue drained by one daemon thread that hands ``flush`` batches
+    of up to ``max_batch`` records, at least every ``flush_interval_ms``.
+    ``submit`` never blocks: when the queue is full the record is dropped
+    and counted. A flush failing with "database is locked" is retried with
+    backoff before its batch is dropped.
+    """
+
+    def __init__(self, flush, max_items=1000, max_batch=100, flush_interval_ms=250.0,
+                 retries=3, name="predict.history"):
+        self._flush = flush
+        self.name = name
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000.0
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=max(1, int(max_items)))
+        self._thread = None
+        self._lock = threading.Lock()
+        self._enqueued = metrics.counter(f"{name}.enqueued")
+        self._written = metrics.counter(f"{name}.written")
+        self._dropped = metrics.counter(f"{name}.dropped")
+        self._failed = metrics.counter(f"{name}.failed")
+        self._depth = metrics.gauge(f"{name}.queue_depth")
+        self._batch_size = metrics.histogram(f"{name}.batch_size", [1, 2, 5, 10, 20, 50, 100, 200])
+        self._flush_ms = metrics.histogram(f"{name}.flush_ms", metrics.LATENCY_MS_BUCKETS)
+
+    def submit(self, record) -> bool:
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._dropped.inc()
+            return False
+        self._enqueued.inc()
+        self._depth.set(self._queue.qsize())
+        return True
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name=f"{self.name}-writer", daemon=True)
+                    self._thread.start()
+
+    def _take_batch(self, timeout):
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._depth.set(self._queue.qsize())
+        return batch
+
+    def _write(self, batch):
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                self._flush(batch)
+            except OperationalError as e:
+                if attempt < self.retries and "locked" in str(e).lower():
+                    time.sleep(0.05 * (2 ** attempt))
+                    continue
+                self._failed.inc(len(batch))
+                print(f"[history] Warning: dropped {len(batch)} records: {e}")
+                return
+            except Exception as e:
+                self._failed.inc(len(batch))
+                print(f"[history] Warning: dropped {len(batch)} records: {e}")
+                return
+            finally:
+                close_old_connections()
+            self._flush_ms.observe((time.perf_counter() - started) * 1000.0)
+            self._batch_size.observe(len(batch))
+            self._written.inc(len(batch))
+            return
+
+    def _loop(self):
+        while True:
+            batch = self._take_batch(timeout=1.0)
+            if batch:
+                self._write(batch)
+
+    def drain(self):
+        """Flush whatever is queued, on the calling thread (shutdown, tests)."""
+        while True:
+            batch = self._take_batch(timeout=0)
+            if not batch:
+                return
+            self._write(batch)
+
+
+# =============================================================================
+# Prediction records
+# =============================================================================
+
+_EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "BMP": "bmp"}
+
+
+def upload_name(data: bytes) -> str:
+    """Storage name of an upload under plant_identifications/, derived from its content hash."""
+    digest = hashlib.sha256(data).hexdigest()
+    with Image.open(io.BytesIO(data)) as image:
+        ext = _EXTENSIONS.get(image.format, "jpg")
+    return timezone.now().strftime(f"plant_identifications/%Y/%m/%d/{digest[:32]}.{ext}")
+
+
+def save_upload(data: bytes, name=None) -> str:
+    """Store the upload (once per content hash); returns the storage name."""
+    name = name or upload_name(data)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    return name
+
+
+def write_predictions(records):
+    """
+    Flush callback: one PlantHistory upsert per (user, species) and one
+    PlantIdentification row per prediction, in a single transaction.
+    Records for users that do not exist are discarded.
+    """
+    from plant.models import PlantIdentification, PlantSpecies
+
+    users = User.objects.in_bulk({r["user_id"] for r in records})
+    records = [r for r in records if r["user_id"] in users]
+    if not records:
+        return
+
+    species = {
+        s.scientific_name: s
+        for s in PlantSpecies.objects.filter(scientific_name__in={r["scientific_name"] for r in records})
+    }
+
+    identifications = []
+    history = {}
+    for r in records:
+        image_name = save_upload(r["image"]) if r.get("image") else ""
+        image_url = r["media_base_url"] + image_name if image_name else None
+        identifications.append(PlantIdentification(
+            user=users[r["user_id"]],
+            image=image_name,
+            identified_species=species.get(r["scientific_name"]),
+            predicted_name=r["scientific_name"],
+            confidence_score=r["confidence"],
+        ))
+        # Unique (user, species_id): the latest prediction wins, within the
+        # batch and against rows already in the table.
+        history[(r["user_id"], r["species_id"])] = PlantHistory(
+            user=users[r["user_id"]],
+            species_id=r["species_id"],
+            common_name=r["common_name"],
+            scientific_name=r["scientific_name"],
+            confidence=r["confidence"],
+            image_url=image_url,
+        )
+
+    with transaction.atomic():
+        PlantIdentification.objects.bulk_create(identifications)
+        PlantHistory.objects.bulk_create(
+            list(history.values()),
+            update_conflicts=True,
+            unique_fields=["user", "species_id"],
+            update_fields=["common_name", "scientific_name", "confidence", "image_url", "identified_at"],
+        )
+
+
+_history_queue = None
+_queue_lock = threading.Lock()
+
+
+def history_queue(**kwargs):
+    """The process' WriteBehindQueue for prediction records, created on first use."""
+    global _history_queue
+    if _history_queue is None:
+        with _queue_lock:
+            if _history_queue is None:
+                _history_queue = WriteBehindQueue(write_predictions, **kwargs)
+                atexit.register(_history_queue.drain)
+    return _history_queue
+
+
+def _reset_after_fork():
+    # The writer thread does not survive fork(); workers start their own.
+    global _history_queue, _queue_lock
+    _history_queue = None
+    _queue_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
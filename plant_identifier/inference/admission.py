@@ -0,0 +1,133 @@
+# plant_identifier/inference/admission.py
+#
+# Latency-SLO admission control. Under overload every accepted request
+# queues behind the ones before it until clients give up, and the CPU then
+# goes to answers nobody reads. The controller instead projects how long a
+# new request would take from the work already in flight and the observed
+# per-image service time, and turns it away up front (503 + Retry-After)
+# when that misses the SLO. Requests carrying a client deadline are also
+# dropped wherever they are still waiting once it has passed.
+
+import math
+import threading
+import time
+from collections import deque
+
+from . import metrics
+from .metrics import percentile
+
+
+class AdmissionError(Exception):
+    """Request shed before inference; ``retry_after_s`` goes into the Retry-After header."""
+
+    def __init__(self, message: str, retry_after_s: int = 1):
+        super().__init__(message)
+        self.message = message
+        self.retry_after_s = max(1, int(retry_after_s))
+
+
+class Overloaded(AdmissionError):
+    """The projected wait would miss the latency SLO (or the client's budget)."""
+
+
+class DeadlineExceeded(AdmissionError):
+    """The client's deadline passed while the request was still waiting."""
+
+
+def deadline_after(budget_ms, now=None):
+    """time.perf_counter() deadline ``budget_ms`` from ``now``; None for no budget."""
+    if budget_ms is None:
+        return None
+    return (time.perf_counter() if now is None else now) + budget_ms / 1000.0
+
+
+def check_deadline(deadline, where="queued"):
+    """Raise DeadlineExceeded when ``deadline`` (perf_counter seconds) has passed."""
+    if deadline is not None and time.perf_counter() >= deadline:
+        raise DeadlineExceeded(f"Client deadline passed while {where}.")
+
+
+class AdmissionController:
+    """
+    Admits work in units of images. The projected latency of a new request
+    is (images in flight + its own) x the median per-image service time of
+    the last ``window`` model calls / ``concurrency`` (forward passes the
+    process runs side by side). Above ``slo_ms``, or above the client's own
+    remaining budget, the request is rejected. With nothing in flight a
+    request is always admitted, so the service time estimate keeps being
+    refreshed even when a single image costs more than the SLO.
+    ``slo_ms`` <= 0 only tracks and never rejects.
+    """
+
+    def __init__(self, slo_ms=0.0, concurrency=1, window=50, min_samples=5, name="predict.admission"):
+        self.slo_ms = float(slo_ms)
+        self.concurrency = max(1, int(concurrency))
+        self.min_samples = max(1, int(min_samples))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._service_ms = deque(maxlen=max(1, int(window)))
+        self._in_flight_gauge = metrics.gauge(f"{name}.in_flight")
+        self._admitted = metrics.counter(f"{name}.admitted")
+        self._rejected = metrics.counter(f"{name}.rejected")
+        self._expired = metrics.counter(f"{name}.expired")
+
+    def _service_estimate(self):
+        if len(self._service_ms) < self.min_samples:
+            return None
+        return percentile(sorted(self._service_ms), 50)
+
+    def admit(self, cost=1, deadline=None):
+        """
+        Count ``cost`` images in, or raise Overloaded / DeadlineExceeded.
+        Every successful admit() must be paired with release(cost).
+        """
+        now = time.perf_counter()
+        if deadline is not None and now >= deadline:
+            raise DeadlineExceeded("Client deadline passed before the request was admitted.")
+        with self._lock:
+            service = self._service_estimate()
+            if service is not None and self._in_flight > 0:
+                wait_ms = self._in_flight * service / self.concurrency
+                projected_ms = wait_ms + cost * service / self.concurrency
+                limits = [self.slo_ms] if self.slo_ms > 0 else []
+                if deadline is not None:
+                    limits.append((deadline - now) * 1000.0)
+                if limits and projected_ms > min(limits):
+                    self._rejected.inc()
+                    raise Overloaded(
+                        f"Server busy: projected latency {projected_ms:.0f} ms exceeds "
+                        f"{min(limits):.0f} ms ({self._in_flight} images in flight).",
+                        retry_after_s=math.ceil(wait_ms / 1000.0),
+                    )
+            self._in_flight += cost
+            self._in_flight_gauge.set(self._in_flight)
+        self._admitted.inc()
+
+    def release(self, cost=1):
+        with self._lock:
+            self._in_flight -= cost
+            self._in_flight_gauge.set(self._in_flight)
+
+    def observe(self, service_ms_per_image):
+        """Record the per-image cost of one model call (batch time / batch size)."""
+        with self._lock:
+            self._service_ms.append(service_ms_per_image)
+
+    def expired(self):
+        """Count a request dropped because its deadline passed (wherever it was waiting)."""
+        self._expired.inc()
+
+    def stats(self):
+        with self._lock:
+            in_flight = self._in_flight
+            service = self._service_estimate()
+        return {
+            "slo_ms": self.slo_ms if self.slo_ms > 0 else None,
+            "concurrency": self.concurrency,
+            "in_flight": in_flight,
+            "service_ms_per_image": service,
+            "projected_wait_ms": in_flight * service / self.concurrency if service is not None else None,
+            "admitted": self._admitted.value,
+            "rejected": self._rejected.value,
+            "expired": self._expired.value,
+        }
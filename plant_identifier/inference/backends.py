@@ -0,0 +1,127 @@
+# plant_identifier/inference/backends.py
+#
+# Pluggable inference backends. A backend loads one model artifact and
+# returns a callable mapping a float32 (N, 3, H, W) batch to (N, classes)
+# logits, plus the artifact's metadata. Selected with PREDICT_BACKEND.
+#
+#   torchscript   efficientnet_b3[.<variant>].pt via torch.jit.load (default)
+#   onnxruntime   efficientnet_b3.onnx (from `manage.py export_onnx`) on the
+#                 ONNX Runtime CPU provider; torch is not used for the forward
+
+import json
+import os
+
+BACKENDS = ("torchscript", "onnxruntime")
+
+# Key of the JSON metadata stored in the ONNX model's metadata_props.
+ONNX_META_KEY = "plant_identifier"
+ONNX_INPUT = "input"
+ONNX_OUTPUT = "logits"
+
+
+def onnx_path(model_path: str) -> str:
+    """efficientnet_b3.pt -> efficientnet_b3.onnx"""
+    return os.path.splitext(model_path)[0] + ".onnx"
+
+
+class OnnxRuntimeModel:
+    """
+    ONNX Runtime session behind the same call signature as the TorchScript
+    module: torch tensors in, torch tensors out (numpy arrays in, numpy
+    arrays out). The session is created on first call in each process, so a
+    model opened in a preloading gunicorn master does not hand dead thread
+    pools to its forked workers.
+    """
+
+    def __init__(self, path: str, intra_op_threads=None):
+        self.path = path
+        self.intra_op_threads = intra_op_threads
+        self.nbytes = os.path.getsize(path)
+        self._session = None
+        self._pid = None
+
+    def _get_session(self):
+        if self._session is None or self._pid != os.getpid():
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.inter_op_num_threads = 1
+            threads = self.intra_op_threads
+            if threads is None:
+                try:
+                    import torch
+                    threads = torch.get_num_threads()   # the per-worker plan, see threads.py
+                except ImportError:
+                    threads = 0                         # ORT default: one per core
+            options.intra_op_num_threads = threads
+            self._session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+            self._pid = os.getpid()
+        return self._session
+
+    def metadata(self):
+        """The export's metadata_props[ONNX_META_KEY], read through the session (no onnx import)."""
+        raw = self._get_session().get_modelmeta().custom_metadata_map.get(ONNX_META_KEY)
+        return json.loads(raw) if raw else {}
+
+    def eval(self):
+        return self
+
+    def __call__(self, batch):
+        as_numpy = not hasattr(batch, "numpy")
+        array = batch if as_numpy else batch.detach().cpu().contiguous().numpy()
+        logits = self._get_session().run([ONNX_OUTPUT], {ONNX_INPUT: array})[0]
+        if as_numpy:
+            return logits
+        import torch
+        return torch.from_numpy(logits)
+
+
+def load_backend(backend: str, path: str, device=None):
+    """(model callable, meta) for ``path`` on ``backend``."""
+    if backend == "torchscript":
+        from .optimize import load_model
+        return load_model(path, device)
+    if backend == "onnxruntime":
+        model = OnnxRuntimeModel(path)
+        meta = model.metadata()
+        # Layout is handled inside the ORT graph; inputs stay NCHW-contiguous.
+        meta["channels_last"] = False
+        return model, meta
+    raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+
+
+def export_onnx(module, path: str, meta: dict, input_size: int = 300, opset: int = 17):
+    """
+    Export a TorchScript classifier to ONNX with a dynamic batch axis and
+    ``meta`` stored as metadata_props[ONNX_META_KEY]. Record the source
+    model's file_fingerprint as meta["source_fingerprint"] so the server
+    can tell a stale export from a current one.
+    """
+    import inspect
+
+    import onnx
+    import torch
+
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False   # TorchScript input needs the TorchScript-based exporter
+    tmp = path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            module.eval(),
+            (torch.zeros(1, 3, input_size, input_size),),
+            tmp,
+            input_names=[ONNX_INPUT],
+            output_names=[ONNX_OUTPUT],
+            dynamic_axes={ONNX_INPUT: {0: "batch"}, ONNX_OUTPUT: {0: "batch"}},
+            opset_version=opset,
+            **kwargs,
+        )
+    model = onnx.load(tmp)
+    entry = model.metadata_props.add()
+    entry.key = ONNX_META_KEY
+    entry.value = json.dumps(meta)
+    onnx.save(model, tmp)
+    os.replace(tmp, path)
@@ -0,0 +1,97 @@
+# plant_identifier/inference/batching.py
+#
+# Micro-batching scheduler: concurrent callers submit one input each, a single
+# background thread gathers whatever arrives within a short window and runs
+# them through the model as one batch.
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from . import metrics
+from .admission import DeadlineExceeded
+
+
+class MicroBatcher:
+    """
+    Collects submitted items for up to ``max_wait_ms`` (or until
+    ``max_batch_size`` items are waiting) and hands them to ``run_batch`` as a
+    list. ``run_batch`` must return one result per item, in order; each caller
+    gets its own result back through a Future. An item submitted with a
+    ``deadline`` (time.perf_counter() seconds) that passes while it is still
+    queued is dropped: its Future fails with DeadlineExceeded and it never
+    reaches ``run_batch``.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, name="predict"):
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+
+        self._batch_size = metrics.histogram(
+            f"{name}.batch_size", buckets=range(1, self.max_batch_size + 1)
+        )
+        self._queue_wait = metrics.histogram(f"{name}.queue_wait_ms", metrics.LATENCY_MS_BUCKETS)
+        self._batch_latency = metrics.histogram(f"{name}.batch_latency_ms", metrics.LATENCY_MS_BUCKETS)
+        self._queue_depth = metrics.gauge(f"{name}.queue_depth")
+        self._expired = metrics.counter(f"{name}.expired")
+        self._utilization = metrics.utilization(f"{name}.utilization")
+
+        self._thread = threading.Thread(target=self._loop, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item, deadline=None) -> Future:
+        future = Future()
+        self._queue.put((item, future, time.perf_counter(), deadline))
+        self._queue_depth.set(self._queue.qsize())
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            self._queue_depth.set(self._queue.qsize())
+
+            started = time.perf_counter()
+            live = []
+            for entry in batch:
+                _, future, enqueued, deadline = entry
+                self._queue_wait.observe((started - enqueued) * 1000.0)
+                if deadline is not None and started >= deadline:
+                    self._expired.inc()
+                    future.set_exception(DeadlineExceeded("Client deadline passed while queued for a batch."))
+                else:
+                    live.append(entry)
+            batch = live
+            if not batch:
+                continue
+            self._batch_size.observe(len(batch))
+
+            try:
+                results = self._run_batch([item for item, _, _, _ in batch])
+                for (_, future, _, _), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                elapsed = time.perf_counter() - started
+                self._batch_latency.observe(elapsed * 1000.0)
+                self._utilization.add(elapsed)
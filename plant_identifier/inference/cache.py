@@ -0,0 +1,151 @@
+# plant_identifier/inference/cache.py
+#
+# Bounded LRU cache for prediction results, keyed by a content hash of the
+# uploaded bytes plus the model version, and single-flight coalescing of
+# identical computations that are in flight at the same time.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from . import metrics
+
+
+def content_key(data: bytes, model_version: str) -> str:
+    return f"{model_version}:{hashlib.sha256(data).hexdigest()}"
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with hit/miss/eviction counters in the metrics registry."""
+
+    def __init__(self, max_entries: int, name: str = "predict.cache"):
+        self.max_entries = max(0, int(max_entries))
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._hits = metrics.counter(f"{name}.hits")
+        self._misses = metrics.counter(f"{name}.misses")
+        self._evictions = metrics.counter(f"{name}.evictions")
+        self._size = metrics.gauge(f"{name}.size")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+        if value is None:
+            self._misses.inc()
+        else:
+            self._hits.inc()
+        return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+            size = len(self._data)
+        if evicted:
+            self._evictions.inc(evicted)
+        self._size.set(size)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        self._size.set(0)
+
+    def stats(self):
+        hits, misses = self._hits.value, self._misses.value
+        return {
+            "enabled": self.enabled,
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "evictions": self._evictions.value,
+            "hit_rate": (hits / (hits + misses)) if (hits + misses) else None,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent work on the same key. The first caller for a key
+    (the leader) does the work; callers arriving before it finishes get the
+    leader's Future and its result, or its exception. Nothing is kept once
+    the leader settles: later repeats are the result cache's job.
+    """
+
+    def __init__(self, name: str = "predict.coalesce"):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._leaders = metrics.counter(f"{name}.leaders")
+        self._coalesced = metrics.counter(f"{name}.coalesced")
+        self._in_flight = metrics.gauge(f"{name}.in_flight")
+
+    def join(self, key):
+        """(future, is_leader). A leader must settle() the future; a key of None never coalesces."""
+        if key is None:
+            return Future(), True
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._coalesced.inc()
+                return future, False
+            future = self._inflight[key] = Future()
+            in_flight = len(self._inflight)
+        self._leaders.inc()
+        self._in_flight.set(in_flight)
+        return future, True
+
+    def settle(self, key, future, result=None, exception=None):
+        if key is not None:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+                in_flight = len(self._inflight)
+            self._in_flight.set(in_flight)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def run(self, key, fn, *args, retry_on=()):
+        """
+        fn(*args), or the result of an identical call already in flight. A
+        follower that gets one of the ``retry_on`` exceptions from the leader
+        (failures specific to the leader's request, not to the work) joins
+        again, becoming the leader itself if nobody else has.
+        """
+        while True:
+            future, leader = self.join(key)
+            if leader:
+                break
+            try:
+                return future.result()
+            except retry_on:
+                continue
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            self.settle(key, future, exception=e)
+            raise
+        self.settle(key, future, result)
+        return result
+
+    def stats(self):
+        leaders, coalesced = self._leaders.value, self._coalesced.value
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": leaders,
+            "coalesced": coalesced,
+            "coalesced_rate": (coalesced / (leaders + coalesced)) if (leaders + coalesced) else None,
+        }
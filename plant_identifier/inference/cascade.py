@@ -0,0 +1,66 @@
+# plant_identifier/inference/cascade.py
+#
+# Two-stage cascade: a cheap model answers the easy uploads and only the
+# uncertain ones escalate to EfficientNet-B3. Both models must share the
+# class index of json/class_idx_to_species_id.json.
+
+import torch
+
+from . import metrics
+
+
+def confidence_and_margin(probs):
+    """Top-1 probability and its lead over the runner-up for a 1-D probability vector."""
+    top = torch.topk(probs, min(2, probs.numel())).values.tolist()
+    margin = top[0] - top[1] if len(top) > 1 else top[0]
+    return top[0], margin
+
+
+class CascadeGate:
+    """
+    Escalation policy plus its bookkeeping. A stage-1 prediction is accepted
+    only when its confidence and margin both reach their thresholds.
+    """
+
+    def __init__(self, min_confidence: float, min_margin: float, name: str = "predict.cascade"):
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+        self._accepted = metrics.counter(f"{name}.accepted")
+        self._escalated = metrics.counter(f"{name}.escalated")
+        self._stage1_ms = metrics.histogram(f"{name}.stage1_ms", metrics.LATENCY_MS_BUCKETS)
+        self._stage2_ms = metrics.histogram(f"{name}.stage2_ms", metrics.LATENCY_MS_BUCKETS)
+
+    def should_escalate(self, probs):
+        """(escalate, confidence, margin) for stage-1 probabilities."""
+        confidence, margin = confidence_and_margin(probs)
+        escalate = confidence < self.min_confidence or margin < self.min_margin
+        (self._escalated if escalate else self._accepted).inc()
+        return escalate, confidence, margin
+
+    def observe(self, stage: int, ms: float):
+        (self._stage1_ms if stage == 1 else self._stage2_ms).observe(ms)
+
+    def stats(self):
+        """
+        Escalation rate and the estimated latency saved per request against
+        running every request through stage 2 alone: accepted requests save
+        a stage-2 pass, every request pays for stage 1.
+        """
+        accepted, escalated = self._accepted.value, self._escalated.value
+        total = accepted + escalated
+        stage1 = self._stage1_ms.snapshot()["mean"]
+        stage2 = self._stage2_ms.snapshot()["mean"]
+        saved = None
+        if total and stage1 is not None and stage2 is not None:
+            saved = (accepted * stage2 - total * stage1) / total
+        return {
+            "min_confidence": self.min_confidence,
+            "min_margin": self.min_margin,
+            "requests": total,
+            "accepted": accepted,
+            "escalated": escalated,
+            "escalation_rate": (escalated / total) if total else None,
+            "stage1_mean_ms": stage1,
+            "stage2_mean_ms": stage2,
+            "avg_latency_saved_ms": saved,
+        }
@@ -0,0 +1,103 @@
+# plant_identifier/inference/embeddings.py
+#
+# Penultimate-layer embeddings of the reference photos and a memory-mapped
+# float16 index for cosine nearest-neighbour search ("similar plants").
+
+import json
+import os
+
+import numpy as np
+import torch
+
+MATRIX_FILE = "embeddings.f16.npy"
+META_FILE = "embeddings.json"
+
+# Rows converted to float32 per matmul; bounds the temporary copy of the
+# memory-mapped matrix to SEARCH_CHUNK_ROWS * dim * 4 bytes.
+SEARCH_CHUNK_ROWS = 16384
+
+
+class Embedder:
+    """
+    (N, C, H, W) batch -> (N, D) L2-normalized embeddings: the pooled input
+    of the classifier. Needs a TorchScript module that still exposes its
+    submodules (torchvision's ``features``/``avgpool``); frozen variants
+    have them inlined away, so embed with the fp32 model.
+    """
+
+    def __init__(self, model):
+        if not (hasattr(model, "features") and hasattr(model, "avgpool")):
+            raise ValueError(
+                "Model does not expose 'features'/'avgpool' submodules; "
+                "embeddings need the unfrozen fp32 model."
+            )
+        self.model = model
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            pooled = self.model.avgpool(self.model.features(batch))
+            return torch.nn.functional.normalize(torch.flatten(pooled, 1), dim=1)
+
+
+def save_index(out_dir: str, matrix, entries, meta: dict):
+    """
+    Write the (N, D) float16 matrix and its sidecar JSON (one entry per row:
+    media-relative path + species id, plus ``meta``). The JSON is written
+    last so a half-built index is never picked up.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, MATRIX_FILE), np.ascontiguousarray(matrix, dtype=np.float16))
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({**meta, "dim": int(matrix.shape[1]), "count": len(entries), "entries": entries}, f)
+
+
+class EmbeddingIndex:
+    """Read-only view of an index written by save_index; the matrix is mmap'd."""
+
+    def __init__(self, matrix, entries, meta):
+        self.matrix = matrix
+        self.entries = entries
+        self.meta = meta
+        self.species_ids = np.array([int(e["species_id"]) for e in entries], dtype=np.int64)
+
+    @classmethod
+    def load(cls, index_dir: str):
+        with open(os.path.join(index_dir, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        entries = meta.pop("entries")
+        matrix = np.load(os.path.join(index_dir, MATRIX_FILE), mmap_mode="r")
+        if matrix.shape != (len(entries), meta["dim"]):
+            raise ValueError(f"Index matrix shape {matrix.shape} does not match its metadata.")
+        return cls(matrix, entries, meta)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def dim(self):
+        return self.matrix.shape[1]
+
+    def scores(self, query):
+        """Cosine similarity of a normalized (D,) query against every row."""
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        out = np.empty(len(self.entries), dtype=np.float32)
+        for start in range(0, len(out), SEARCH_CHUNK_ROWS):
+            chunk = self.matrix[start:start + SEARCH_CHUNK_ROWS]
+            out[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        return out
+
+    def search(self, query, k: int = 10, distinct_species: bool = False):
+        """
+        Best-first [(row, score)] for the ``k`` nearest rows. With
+        ``distinct_species`` only the best row per species is kept.
+        """
+        scores = self.scores(query)
+        if distinct_species:
+            order = np.argsort(-scores)
+            _, first = np.unique(self.species_ids[order], return_index=True)
+            rows = order[np.sort(first)][:k]
+        else:
+            k = min(k, len(scores))
+            rows = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+            rows = rows[np.argsort(-scores[rows])]
+        return [(int(r), float(scores[r])) for r in rows]
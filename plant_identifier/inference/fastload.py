@@ -0,0 +1,121 @@
+# plant_identifier/inference/fastload.py
+#
+# Fast cold-start artifact (efficientnet_b3.fast.pt, from
+# `manage.py build_fast_start`). TorchScript startup is slow twice over:
+# torch.jit.load deserializes and copies every weight, and the profiling
+# executor makes the first forward passes several times slower than the
+# rest. This artifact is instead the eager torchvision EfficientNet-B3
+# with every BatchNorm folded into the preceding convolution, saved as a
+# plain state dict. Loading builds the module on the meta device and
+# assigns memory-mapped weights: no copy, no JIT, and the weight pages are
+# shared through the page cache by every worker and survive restarts.
+
+import os
+
+import torch
+
+ARCHITECTURE = "torchvision.efficientnet_b3"
+FORMAT_VERSION = 1
+
+
+def fast_artifact_path(model_path: str) -> str:
+    """efficientnet_b3.pt -> efficientnet_b3.fast.pt"""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.fast{ext}"
+
+
+def source_stamp(path: str) -> dict:
+    """Cheap identity of the source model, checked at every load instead of re-hashing it."""
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _conv_bn_pairs(model):
+    """(container, conv name, bn name) for every Conv2d directly followed by a BatchNorm2d."""
+    pairs = []
+    for container in model.modules():
+        if not isinstance(container, torch.nn.Sequential):
+            continue
+        children = list(container.named_children())
+        for (conv_name, conv), (bn_name, bn) in zip(children, children[1:]):
+            if isinstance(conv, torch.nn.Conv2d) and isinstance(bn, torch.nn.BatchNorm2d):
+                pairs.append((container, conv_name, bn_name))
+    return pairs
+
+
+def _architecture(num_classes: int, device=None):
+    import torchvision
+
+    with torch.device(device or "cpu"):
+        return torchvision.models.efficientnet_b3(weights=None, num_classes=num_classes)
+
+
+def build_fast_artifact(module):
+    """
+    (state dict, meta) for a TorchScript EfficientNet-B3 classifier, BN
+    folded. Raises ValueError when its weights do not fit torchvision's
+    architecture (the only one this loader can rebuild).
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+    state = module.state_dict()
+    classifier = state.get("classifier.1.weight")
+    if classifier is None:
+        raise ValueError(f"Model is not a {ARCHITECTURE} classifier (no classifier.1.weight)")
+    num_classes = classifier.shape[0]
+
+    model = _architecture(num_classes).eval()
+    expected = set(model.state_dict())
+    if set(state) != expected:
+        missing, unexpected = sorted(expected - set(state)), sorted(set(state) - expected)
+        raise ValueError(
+            f"Model weights do not match {ARCHITECTURE}: missing {missing[:3]}, unexpected {unexpected[:3]}"
+        )
+    model.load_state_dict(state)
+
+    pairs = _conv_bn_pairs(model)
+    for container, conv_name, bn_name in pairs:
+        fused = fuse_conv_bn_eval(getattr(container, conv_name), getattr(container, bn_name))
+        setattr(container, conv_name, fused)
+        setattr(container, bn_name, torch.nn.Identity())
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "architecture": ARCHITECTURE,
+        "num_classes": num_classes,
+        "folded_batchnorms": len(pairs),
+        "channels_last": False,
+        "torch_version": str(torch.__version__),   # plain str: the archive is loaded weights_only
+    }
+    weights = {k: v.detach().contiguous() for k, v in model.state_dict().items()}
+    return weights, meta
+
+
+def save_fast_artifact(weights: dict, meta: dict, path: str):
+    """Write atomically, so workers starting meanwhile never map a partial file."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    torch.save({"meta": meta, "weights": weights}, tmp)
+    os.replace(tmp, path)
+
+
+def load_fast_artifact(path: str, device=None):
+    """(eval-mode module with memory-mapped weights, meta)."""
+    archive = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    meta = archive["meta"]
+    if meta.get("architecture") != ARCHITECTURE or meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a format-{FORMAT_VERSION} {ARCHITECTURE} artifact")
+
+    # Same module tree as at build time, without allocating or initializing
+    # any weights: the mapped tensors are assigned in place of the meta ones.
+    model = _architecture(meta["num_classes"], device="meta")
+    for container, conv_name, bn_name in _conv_bn_pairs(model):
+        conv = getattr(container, conv_name)
+        conv.bias = torch.nn.Parameter(torch.empty(conv.out_channels, device="meta"))
+        setattr(container, bn_name, torch.nn.Identity())
+    model.load_state_dict(archive["weights"], assign=True)
+    model.eval()
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        tensor.requires_grad_(False)
+    if device is not None and torch.device(device).type != "cpu":
+        model = model.to(device)
+    return model, meta
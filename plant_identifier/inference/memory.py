@@ -0,0 +1,92 @@
+# plant_identifier/inference/memory.py
+#
+# Helpers for sharing the model between pre-forked gunicorn workers and for
+# checking that it actually stays shared (Linux /proc only).
+
+import gc
+import os
+
+
+def prepare_for_fork(model):
+    """
+    Make a model loaded in the gunicorn master safe to share copy-on-write.
+
+    Weights are never written after load (no grads, eval mode), so their
+    pages stay shared with every forked worker. gc.freeze() moves every
+    object alive now into the permanent generation, so the collector in the
+    workers does not write to their GC headers and dirty pages that would
+    otherwise stay shared (species tables, module objects, ...).
+    """
+    model.eval()
+    if hasattr(model, "parameters"):   # not for ONNX Runtime models
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            tensor.requires_grad_(False)
+    gc.collect()
+    gc.freeze()
+
+
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+
+def smaps_rollup(pid):
+    """kB values from /proc/<pid>/smaps_rollup, or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    values = {}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in _SMAPS_FIELDS:
+            values[key] = int(rest.split()[0])
+    return values
+
+
+def process_memory(pid):
+    """RSS split into memory shared with other processes and memory unique to ``pid``."""
+    smaps = smaps_rollup(pid)
+    if smaps is None:
+        return None
+    return {
+        "pid": pid,
+        "rss_kb": smaps.get("Rss", 0),
+        "pss_kb": smaps.get("Pss", 0),
+        "shared_kb": smaps.get("Shared_Clean", 0) + smaps.get("Shared_Dirty", 0),
+        "unique_kb": smaps.get("Private_Clean", 0) + smaps.get("Private_Dirty", 0),
+    }
+
+
+def child_pids(pid):
+    children = []
+    try:
+        tasks = os.listdir(f"/proc/{pid}/task")
+    except OSError:
+        return children
+    for tid in tasks:
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children", "r") as f:
+                children.extend(int(p) for p in f.read().split())
+        except OSError:
+            continue
+    return sorted(set(children))
+
+
+def model_bytes(model):
+    if not hasattr(model, "parameters"):
+        return getattr(model, "nbytes", 0)
+    return sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+
+
+def fork_report(master_pid):
+    """Memory of a pre-fork master and all its workers, with totals."""
+    master = process_memory(master_pid)
+    workers = [m for m in (process_memory(p) for p in child_pids(master_pid)) if m]
+    everyone = ([master] if master else []) + workers
+    return {
+        "master": master,
+        "workers": workers,
+        "total_rss_kb": sum(m["rss_kb"] for m in everyone),
+        "total_pss_kb": sum(m["pss_kb"] for m in everyone),
+        "total_unique_kb": sum(m["unique_kb"] for m in everyone),
+    }
@@ -0,0 +1,175 @@
+# plant_identifier/inference/metrics.py
+#
+# Small in-process metrics registry for the inference path. Kept dependency
+# free on purpose: every gunicorn/daphne worker keeps its own numbers and
+# exposes them as JSON through /predict/metrics/.
+
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list (q in 0..100)."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[rank]
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Gauge:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Histogram:
+    """Bucketed distribution plus a window of recent samples for p50/p95/p99."""
+
+    def __init__(self, buckets, window=2048):
+        self._lock = threading.Lock()
+        self._buckets = sorted(buckets)
+        self._counts = [0] * (len(self._buckets) + 1)
+        self._recent = deque(maxlen=window)
+        self._count = 0
+        self._sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect_left(self._buckets, value)] += 1
+            self._recent.append(value)
+            self._count += 1
+            self._sum += value
+
+    def recent(self):
+        with self._lock:
+            return list(self._recent)
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            counts = list(self._counts)
+            count, total = self._count, self._sum
+        labels = [f"<={b:g}" for b in self._buckets] + [f">{self._buckets[-1]:g}"]
+        return {
+            "count": count,
+            "mean": (total / count) if count else None,
+            "p50": percentile(recent, 50),
+            "p95": percentile(recent, 95),
+            "p99": percentile(recent, 99),
+            "buckets": dict(zip(labels, counts)),
+        }
+
+
+class Utilization:
+    """
+    Fraction of wall time that ``workers`` threads spent busy, reported over
+    the last complete ``window_s`` window (the current one until the first
+    completes). Busy time is credited to the window in which the work ends.
+    """
+
+    def __init__(self, workers=1, window_s=10.0):
+        self._lock = threading.Lock()
+        self.workers = max(1, int(workers))
+        self.window_s = float(window_s)
+        self._window_start = time.monotonic()
+        self._busy = 0.0
+        self._last = None
+
+    def _roll(self, now):
+        elapsed = now - self._window_start
+        if elapsed < self.window_s:
+            return
+        # A gap of more than one window means the windows in between were idle.
+        self._last = 0.0 if elapsed >= 2 * self.window_s else min(1.0, self._busy / (self.window_s * self.workers))
+        self._window_start = now - (elapsed % self.window_s)
+        self._busy = 0.0
+
+    def add(self, busy_s):
+        with self._lock:
+            self._roll(time.monotonic())
+            self._busy += busy_s
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            self._roll(now)
+            if self._last is not None:
+                return self._last
+            elapsed = now - self._window_start
+            return min(1.0, self._busy / (elapsed * self.workers)) if elapsed > 0 else None
+
+
+_registry_lock = threading.Lock()
+_registry = {}
+
+
+def _get_or_create(name, factory):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = factory()
+        return metric
+
+
+def counter(name):
+    return _get_or_create(name, Counter)
+
+
+def gauge(name):
+    return _get_or_create(name, Gauge)
+
+
+def histogram(name, buckets):
+    return _get_or_create(name, lambda: Histogram(buckets))
+
+
+def utilization(name, workers=1, window_s=10.0):
+    return _get_or_create(name, lambda: Utilization(workers, window_s))
+
+
+# Shared bucket layouts
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def snapshot():
+    with _registry_lock:
+        items = list(_registry.items())
+    return {name: metric.snapshot() for name, metric in sorted(items)}
@@ -0,0 +1,101 @@
+# plant_identifier/inference/optimize.py
+#
+# CPU-optimized variants of the TorchScript classifier. Artifacts are written
+# next to the FP32 model (efficientnet_b3.<variant>.pt) by
+# `manage.py optimize_model` and selected at runtime with
+# PREDICT_MODEL_VARIANT.
+
+import hashlib
+import json
+import os
+
+import torch
+
+VARIANTS = ("fp32", "optimized", "int8-dynamic", "int8-static")
+
+# Metadata stored inside the TorchScript archive.
+META_FILE = "plant_identifier.json"
+
+
+def artifact_path(model_path: str, variant: str) -> str:
+    if variant == "fp32":
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.{variant}{ext}"
+
+
+def _calibrate(model, batches):
+    with torch.no_grad():
+        for batch in batches:
+            model(batch)
+
+
+def build_variant(model, variant: str, calibration_batches=()):
+    """
+    Returns (frozen module, meta) for ``variant``:
+
+    optimized     torch.jit.freeze, optimize_for_inference + channels-last at load
+    int8-dynamic  dynamic INT8 quantization (Linear layers), then as above
+    int8-static   static INT8 quantization calibrated on ``calibration_batches``
+
+    optimize_for_inference is applied by load_model() rather than here: the
+    MKLDNN constants it produces cannot be serialized.
+    """
+    if variant not in VARIANTS or variant == "fp32":
+        raise ValueError(f"Unknown variant {variant!r}; expected one of {VARIANTS[1:]}")
+
+    model = model.eval()
+    if variant == "optimized":
+        built = torch.jit.freeze(model)
+    elif variant == "int8-dynamic":
+        from torch.ao.quantization import default_dynamic_qconfig, quantize_dynamic_jit
+        built = torch.jit.freeze(quantize_dynamic_jit(model, {"": default_dynamic_qconfig}).eval())
+    else:
+        from torch.ao.quantization import get_default_qconfig, quantize_jit
+        if not calibration_batches:
+            raise ValueError("int8-static needs calibration images")
+        engine = torch.backends.quantized.engine
+        qconfig = get_default_qconfig(engine)
+        try:
+            quantized = quantize_jit(model, {"": qconfig}, _calibrate, [list(calibration_batches)])
+        except RuntimeError as e:
+            # Graph-mode quantization can't observe data-dependent branches
+            # (e.g. torchvision's StochasticDepth in scripted models).
+            reason = str(e).strip().splitlines()[0]
+            raise RuntimeError(f"Static quantization is not supported for this model: {reason}") from e
+        built = torch.jit.freeze(quantized.eval())
+
+    meta = {
+        "variant": variant,
+        "channels_last": True,
+        "optimize_for_inference": True,
+        "quantized_engine": torch.backends.quantized.engine if variant.startswith("int8") else None,
+        "torch_version": torch.__version__,
+    }
+    return built, meta
+
+
+def save_variant(module, meta: dict, path: str):
+    torch.jit.save(module, path, _extra_files={META_FILE: json.dumps(meta)})
+
+
+def file_fingerprint(path: str, length: int = 16) -> str:
+    """Short SHA-256 of a model file, used as the model version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def load_model(path: str, device):
+    """Load any model artifact; returns (module, meta). FP32 models have empty meta."""
+    extra = {META_FILE: ""}
+    module = torch.jit.load(path, map_location=device, _extra_files=extra)
+    raw = extra[META_FILE]
+    meta = json.loads(raw) if raw else {}
+    if meta.get("quantized_engine"):
+        torch.backends.quantized.engine = meta["quantized_engine"]
+    if meta.get("optimize_for_inference"):
+        module = torch.jit.optimize_for_inference(module)
+    return module, meta
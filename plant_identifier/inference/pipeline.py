@@ -0,0 +1,119 @@
+# plant_identifier/inference/pipeline.py
+#
+# Staged executor for /predict/: decode + transform on a small thread pool,
+# the forward pass on the MicroBatcher's dedicated inference thread. Run
+# serially on the request thread the two never overlap; here the pool is
+# already decoding request N+1 while request N is in the model, and bounded
+# queues between the stages push back on callers instead of piling work up.
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from . import metrics
+from .admission import DeadlineExceeded
+
+
+class StagedPipeline:
+    """
+    ``submit(args)`` queues ``prepare(*args)`` for one of ``workers``
+    threads. ``prepare`` returns (result, None) when it answered by itself
+    (cascade stage 1) or (None, model input); a model input is handed to
+    ``infer`` (a MicroBatcher) and the worker moves on to the next item
+    without waiting for the forward pass. The Future resolves to
+    (result, model input or None, inference ms or None).
+
+    Both hand-offs are bounded by ``queue_size``: submit() blocks while the
+    prepare queue is full, and a worker blocks while ``queue_size`` inputs
+    are already waiting for or in the model. Items whose ``deadline``
+    (time.perf_counter() seconds) passes while queued fail with
+    DeadlineExceeded and are never prepared or run.
+    """
+
+    def __init__(self, prepare, infer, workers=2, queue_size=16, name="predict.pipeline"):
+        self._prepare = prepare
+        self._infer = infer
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._infer_slots = threading.BoundedSemaphore(self.queue_size)
+
+        self._prepare_depth = metrics.gauge(f"{name}.prepare.queue_depth")
+        self._prepare_wait = metrics.histogram(f"{name}.prepare.queue_wait_ms", metrics.LATENCY_MS_BUCKETS)
+        self._prepare_latency = metrics.histogram(f"{name}.prepare.latency_ms", metrics.LATENCY_MS_BUCKETS)
+        self._prepare_utilization = metrics.utilization(f"{name}.prepare.utilization", workers=self.workers)
+        self._infer_pending = metrics.gauge(f"{name}.infer.pending")
+        self._infer_latency = metrics.histogram(f"{name}.infer.latency_ms", metrics.LATENCY_MS_BUCKETS)
+        self._expired = metrics.counter(f"{name}.expired")
+
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"{name}-prepare-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, args, deadline=None) -> Future:
+        future = Future()
+        self._queue.put((args, future, time.perf_counter(), deadline))
+        self._prepare_depth.set(self._queue.qsize())
+        return future
+
+    def _loop(self):
+        while True:
+            args, future, enqueued, deadline = self._queue.get()
+            self._prepare_depth.set(self._queue.qsize())
+            started = time.perf_counter()
+            self._prepare_wait.observe((started - enqueued) * 1000.0)
+            if deadline is not None and started >= deadline:
+                self._expired.inc()
+                future.set_exception(DeadlineExceeded("Client deadline passed while queued for decoding."))
+                continue
+
+            try:
+                result, model_input = self._prepare(*args)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            finally:
+                elapsed = time.perf_counter() - started
+                self._prepare_latency.observe(elapsed * 1000.0)
+                self._prepare_utilization.add(elapsed)
+
+            if model_input is None:
+                future.set_result((result, None, None))
+                continue
+            self._infer_slots.acquire()
+            self._infer_pending.inc()
+            handed_off = time.perf_counter()
+            try:
+                inner = self._infer.submit(model_input, deadline)
+            except Exception as e:
+                self._inferred()
+                future.set_exception(e)
+                continue
+            inner.add_done_callback(lambda done, f=future, x=model_input, t=handed_off: self._finish(done, f, x, t))
+
+    def _inferred(self):
+        self._infer_pending.dec()
+        self._infer_slots.release()
+
+    def _finish(self, done, future, model_input, handed_off):
+        self._inferred()
+        infer_ms = (time.perf_counter() - handed_off) * 1000.0
+        self._infer_latency.observe(infer_ms)
+        error = done.exception()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result((done.result(), model_input, infer_ms))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "prepare_queue_depth": self._queue.qsize(),
+            "prepare_utilization": self._prepare_utilization.snapshot(),
+            "infer_pending": self._infer_pending.value,
+        }
@@ -0,0 +1,220 @@
+# plant_identifier/inference/preprocess.py
+#
+# Image -> tensor preprocessing shared by the views, management commands and
+# benchmarks. Django-free so it can be imported from standalone scripts.
+
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+from torchvision.transforms import functional as TF
+
+INPUT_SIZE = 300
+MEAN = [0.485, 0.456, 0.406]
+STD = [0.229, 0.224, 0.225]
+
+# Formats PIL decodes that phones and browsers actually upload.
+ALLOWED_FORMATS = frozenset({"JPEG", "MPO", "PNG", "WEBP", "GIF", "BMP"})
+
+# Test-time augmentation views, in the order they are dropped from the end
+# when fewer are requested. "base" is exactly what build_transform produces.
+TTA_VIEWS = (
+    "base", "base_flip",
+    "zoom_center", "zoom_center_flip",
+    "zoom_top_left", "zoom_top_right", "zoom_bottom_left", "zoom_bottom_right",
+)
+
+
+class ImageRejected(ValueError):
+    """An upload refused from its header alone; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def build_transform(size: int = INPUT_SIZE):
+    """The EfficientNet-B3 eval transform: Resize -> CenterCrop -> ToTensor -> Normalize."""
+    return transforms.Compose([
+        transforms.Resize(size),
+        transforms.CenterCrop(size),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=MEAN, std=STD),
+    ])
+
+
+class TTATransform:
+    """
+    Image -> (N, C, size, size) batch of test-time augmentation views, meant
+    for a single batched forward pass whose softmax rows are averaged.
+
+    The base view and its mirror come from the eval transform; the zoom
+    views are crops of the image resized to ``size * zoom``, normalized once
+    and sliced, so each extra view costs a tensor copy rather than a resize.
+    """
+
+    def __init__(self, size: int = INPUT_SIZE, zoom: float = 1.15, views: int = len(TTA_VIEWS)):
+        self.size = size
+        self.views = TTA_VIEWS[:max(1, min(int(views), len(TTA_VIEWS)))]
+        self._base = build_transform(size)
+        self._zoom = transforms.Resize(int(round(size * zoom)))
+        self._normalize = transforms.Compose([
+            transforms.ToTensor(),
+            transforms.Normalize(mean=MEAN, std=STD),
+        ])
+
+    def __len__(self):
+        return len(self.views)
+
+    def __call__(self, image, include_base: bool = True):
+        wanted = self.views if include_base else self.views[1:]
+        out = {}
+        if "base" in wanted or "base_flip" in wanted:
+            base = self._base(image)
+            out["base"], out["base_flip"] = base, base.flip(-1)
+        if any(name.startswith("zoom") for name in wanted):
+            zoomed = self._normalize(self._zoom(image))
+            top_left, top_right, bottom_left, bottom_right, center = TF.five_crop(zoomed, [self.size, self.size])
+            out.update(
+                zoom_center=center, zoom_center_flip=center.flip(-1),
+                zoom_top_left=top_left, zoom_top_right=top_right,
+                zoom_bottom_left=bottom_left, zoom_bottom_right=bottom_right,
+            )
+        return torch.stack([out[name] for name in wanted])
+
+
+def resize_crop_box(width: int, height: int, size: int = INPUT_SIZE):
+    """
+    Source-space box that Resize(size) -> CenterCrop(size) ends up showing,
+    with the resized dimensions computed exactly as torchvision does.
+    """
+    if width <= height:
+        resized_w, resized_h = size, int(size * height / width)
+    else:
+        resized_w, resized_h = int(size * width / height), size
+    top = int(round((resized_h - size) / 2.0))
+    left = int(round((resized_w - size) / 2.0))
+    sx, sy = width / resized_w, height / resized_h
+    return (left * sx, top * sy, (left + size) * sx, (top + size) * sy)
+
+
+class FusedPreprocess:
+    """
+    The eval transform without the float intermediates. ``crop_uint8`` does
+    Resize + CenterCrop as one PIL resize of just the crop box and returns a
+    (3, size, size) uint8 tensor; ``normalize_into`` then writes
+    ToTensor + Normalize for a whole batch straight into a caller-provided
+    float buffer, as ``x * scale + bias`` in place. Matches build_transform
+    to within a rounding step at crop edges.
+    """
+
+    def __init__(self, size: int = INPUT_SIZE):
+        self.size = size
+        self._scale = torch.tensor([1.0 / (255.0 * s) for s in STD]).view(3, 1, 1)
+        self._bias = torch.tensor([-m / s for m, s in zip(MEAN, STD)]).view(3, 1, 1)
+
+    def crop_uint8(self, image):
+        box = resize_crop_box(image.width, image.height, self.size)
+        cropped = image.resize((self.size, self.size), Image.BILINEAR, box=box)
+        return torch.from_numpy(np.array(cropped, dtype=np.uint8)).permute(2, 0, 1)
+
+    def normalize_into(self, crops, out):
+        """uint8 (3, H, W) crops -> rows of the float ``out`` batch; returns ``out``."""
+        for row, crop in zip(out, crops):
+            # In place: the uint8 -> float cast happens in the copy, so no
+            # promoted temporary is allocated per image.
+            row.copy_(crop).mul_(self._scale).add_(self._bias)
+        return out
+
+    def __call__(self, image):
+        """Drop-in for build_transform(): image -> float (3, size, size)."""
+        out = torch.empty(1, 3, self.size, self.size)
+        return self.normalize_into([self.crop_uint8(image)], out)[0]
+
+
+class InputBufferPool:
+    """
+    Reusable float (capacity, 3, size, size) model-input buffers, so a
+    forward pass does not allocate its input batch. Buffers are created in
+    the model's memory format (channels-last for optimized variants), so
+    slicing one to the batch size needs no layout copy either.
+    """
+
+    def __init__(self, size: int, capacity: int, channels_last: bool = False, max_buffers: int = 4):
+        self.size = size
+        self.capacity = max(1, int(capacity))
+        self.memory_format = torch.channels_last if channels_last else torch.contiguous_format
+        self.max_buffers = max_buffers
+        self._free = []
+        self._lock = threading.Lock()
+        self.allocations = 0
+        self.reuses = 0
+
+    def acquire(self, n: int):
+        """A buffer with at least ``n`` rows; slice it to [:n] and release() it after the forward pass."""
+        with self._lock:
+            for i, buf in enumerate(self._free):
+                if buf.shape[0] >= n:
+                    self.reuses += 1
+                    return self._free.pop(i)
+            self.allocations += 1
+        return torch.empty(
+            (max(n, self.capacity), 3, self.size, self.size), memory_format=self.memory_format
+        )
+
+    def release(self, buf):
+        with self._lock:
+            if len(self._free) < self.max_buffers:
+                self._free.append(buf)
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "free": len(self._free),
+            "allocations": self.allocations,
+            "reuses": self.reuses,
+        }
+
+
+def decode_image(fp, min_size: int = INPUT_SIZE, draft: bool = True):
+    """
+    Open an image as RGB. For JPEGs, ``draft`` lets libjpeg decode straight
+    to the smallest DCT scale (1/2, 1/4, 1/8) whose both sides are still
+    >= ``min_size``, so a 12-48 MP phone photo is never materialized at
+    full resolution only for Resize(min_size) to throw it away. Other
+    formats are decoded losslessly as before.
+    """
+    image = Image.open(fp)
+    if draft and image.format in ("JPEG", "MPO"):
+        image.draft("RGB", (min_size, min_size))
+    return image.convert("RGB")
+
+
+def sniff_image(fp, max_pixels: int, allowed_formats=ALLOWED_FORMATS):
+    """
+    Read only the image header (Image.open is lazy) and check format and
+    dimensions before anything is decoded, so a decompression-bomb PNG is
+    refused for the price of a few hundred bytes. Returns (format, (w, h))
+    and rewinds ``fp``.
+    """
+    try:
+        with Image.open(fp) as image:
+            fmt, size = image.format, image.size
+    except Image.DecompressionBombError as e:
+        raise ImageRejected(str(e), status=413)
+    except Exception:
+        raise ImageRejected("Upload is not a readable image.", status=415)
+    finally:
+        fp.seek(0)
+
+    if fmt not in allowed_formats:
+        raise ImageRejected(f"Unsupported image format: {fmt}.", status=415)
+    width, height = size
+    if width * height > max_pixels:
+        raise ImageRejected(
+            f"Image is {width}x{height} ({width * height} px); the limit is {max_pixels} px.",
+            status=413,
+        )
+    return fmt, size
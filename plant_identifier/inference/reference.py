@@ -0,0 +1,40 @@
+# plant_identifier/inference/reference.py
+#
+# Access to the labelled reference photos under media/images/<species_id>/,
+# used for calibration, agreement checks and benchmarks.
+
+import os
+
+
+def reference_images(media_root, limit=None):
+    """
+    (path, species_id) pairs from ``<media_root>/images/<species_id>/``,
+    in a stable order, spread across species before repeating any of them.
+    """
+    images_dir = os.path.join(media_root, "images")
+    if not os.path.isdir(images_dir):
+        return []
+
+    per_species = []
+    for species_id in sorted(os.listdir(images_dir)):
+        folder = os.path.join(images_dir, species_id)
+        if not os.path.isdir(folder):
+            continue
+        files = sorted(f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)))
+        if files:
+            per_species.append((species_id, files))
+
+    pairs = []
+    depth = 0
+    while per_species and (limit is None or len(pairs) < limit):
+        added = False
+        for species_id, files in per_species:
+            if depth < len(files):
+                pairs.append((os.path.join(images_dir, species_id, files[depth]), species_id))
+                added = True
+                if limit is not None and len(pairs) >= limit:
+                    break
+        if not added:
+            break
+        depth += 1
+    return pairs
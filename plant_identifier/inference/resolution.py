@@ -0,0 +1,115 @@
+# plant_identifier/inference/resolution.py
+#
+# Load-aware input resolution. EfficientNet-B3 pools globally before its
+# classifier, so the same weights run at any input size; a smaller square
+# crop costs roughly quadratically less compute for a small accuracy loss.
+# Under load a worker steps down through resolution tiers instead of
+# letting requests queue, and climbs back once the load has passed.
+
+import threading
+import time
+from collections import deque
+
+from . import metrics
+from .metrics import percentile
+
+
+def parse_tiers(raw: str, full: int):
+    """
+    "300,260,224" -> (300, 260, 224): unique, highest first, starting at
+    ``full`` (added when missing) and never above it.
+    """
+    tiers = {int(t) for t in raw.split(",") if t.strip()}
+    return tuple(sorted({t for t in tiers if 0 < t < full} | {full}, reverse=True))
+
+
+class ResolutionGovernor:
+    """
+    Current resolution tier of a worker, driven by two load signals: the
+    requests in flight (entered but not exited, so waiting for a batch or
+    the model counts) and the p95 of the last ``window`` inference
+    latencies. The tier drops one step when either signal reaches its high
+    watermark and rises one step only when both are at or under their low
+    watermarks. Between the watermarks it holds, and it never moves twice
+    within ``dwell_s``: the hysteresis that keeps it from flapping.
+    """
+
+    def __init__(self, tiers, high_depth=4, low_depth=1, high_p95_ms=800.0, low_p95_ms=300.0,
+                 window=50, dwell_s=5.0, name="predict.resolution"):
+        self.tiers = tuple(tiers)
+        self.high_depth, self.low_depth = high_depth, low_depth
+        self.high_p95_ms, self.low_p95_ms = high_p95_ms, low_p95_ms
+        self.dwell_s = dwell_s
+        self._lock = threading.Lock()
+        self._index = 0
+        self._in_flight = 0
+        self._latencies = deque(maxlen=max(1, int(window)))
+        self._changed_at = float("-inf")
+        self._tier = metrics.gauge(f"{name}.tier")
+        self._tier.set(self.tiers[0])
+        self._down = metrics.counter(f"{name}.step_down")
+        self._up = metrics.counter(f"{name}.step_up")
+        self._requests = {t: metrics.counter(f"{name}.requests.{t}") for t in self.tiers}
+
+    @property
+    def current(self) -> int:
+        return self.tiers[self._index]
+
+    def enter(self) -> int:
+        """Count a request in and return the resolution it should use."""
+        with self._lock:
+            self._in_flight += 1
+            self._evaluate(time.monotonic())
+            tier = self.tiers[self._index]
+        self._requests[tier].inc()
+        return tier
+
+    def exit(self, latency_ms=None):
+        """Count a request out; ``latency_ms`` of inference, None for cache hits and failures."""
+        with self._lock:
+            self._in_flight -= 1
+            if latency_ms is not None:
+                self._latencies.append(latency_ms)
+            self._evaluate(time.monotonic())
+
+    def _p95(self):
+        return percentile(sorted(self._latencies), 95)
+
+    def _evaluate(self, now):
+        if now - self._changed_at < self.dwell_s:
+            return
+        p95 = self._p95()
+        overloaded = self._in_flight >= self.high_depth or (p95 is not None and p95 >= self.high_p95_ms)
+        # Climbing back needs fresh evidence from the current tier.
+        idle = self._in_flight <= self.low_depth and p95 is not None and p95 <= self.low_p95_ms
+        if overloaded and self._index < len(self.tiers) - 1:
+            self._index += 1
+            self._down.inc()
+        elif idle and not overloaded and self._index > 0:
+            self._index -= 1
+            self._up.inc()
+        else:
+            return
+        # Latencies measured at the old tier say little about the new one.
+        self._latencies.clear()
+        self._changed_at = now
+        self._tier.set(self.tiers[self._index])
+
+    def stats(self):
+        with self._lock:
+            p95 = self._p95()
+            in_flight = self._in_flight
+        return {
+            "tiers": list(self.tiers),
+            "current": self.current,
+            "in_flight": in_flight,
+            "recent_p95_ms": p95,
+            "high_depth": self.high_depth,
+            "low_depth": self.low_depth,
+            "high_p95_ms": self.high_p95_ms,
+            "low_p95_ms": self.low_p95_ms,
+            "dwell_s": self.dwell_s,
+            "step_down": self._down.value,
+            "step_up": self._up.value,
+            "requests": {str(t): c.value for t, c in self._requests.items()},
+        }
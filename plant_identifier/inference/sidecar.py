@@ -0,0 +1,272 @@
+# plant_identifier/inference/sidecar.py
+#
+# Out-of-process inference over a Unix domain socket. One server process
+# (`manage.py run_inference_server`) owns the model; web workers started
+# with PREDICT_SIDECAR_SOCKET send preprocessed images and get
+# probabilities back, so they never load weights themselves and the server
+# can micro-batch requests coming from all of them.
+#
+# Wire format (network byte order), one request/response pair at a time per
+# connection; connections are kept open and reused:
+#
+#   request   !4sBBHH   magic, op, dtype, count, size
+#             PREDICT: count x (3, size, size) images of dtype, C-order
+#             INFO:    no payload (count = size = 0)
+#   response  !4sBHI    magic, status, count, payload bytes
+#             OK PREDICT: count x classes float32 probabilities
+#             OK INFO:    UTF-8 JSON (model_version, input_size, classes, ...)
+#             ERROR:      UTF-8 message
+#
+# dtype 0 is a uint8 center crop (FusedPreprocess.crop_uint8, 4x smaller
+# than float32 and normalized server-side); dtype 1 is an already
+# normalized float32 batch (TTA views).
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+
+from . import metrics
+
+MAGIC = b"PIS1"
+REQUEST = struct.Struct("!4sBBHH")
+RESPONSE = struct.Struct("!4sBHI")
+
+OP_PREDICT = 1
+OP_INFO = 2
+
+DTYPE_UINT8 = 0
+DTYPE_FLOAT32 = 1
+_NUMPY_DTYPES = {DTYPE_UINT8: np.uint8, DTYPE_FLOAT32: np.float32}
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+
+class SidecarError(RuntimeError):
+    """The inference server answered with an error (or not at all)."""
+
+
+def _recv_exact(sock, nbytes):
+    """``nbytes`` from ``sock`` into a writable bytearray; None on a clean EOF before the first byte."""
+    buf = bytearray(nbytes)
+    view = memoryview(buf)
+    received = 0
+    while received < nbytes:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            if received == 0:
+                return None
+            raise ConnectionError("connection closed mid-message")
+        received += n
+    return buf
+
+
+# =============================================================================
+# Server
+# =============================================================================
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        server.connections.inc()
+        try:
+            while True:
+                header = _recv_exact(self.request, REQUEST.size)
+                if header is None:
+                    return
+                magic, op, dtype, count, size = REQUEST.unpack(header)
+                if magic != MAGIC:
+                    return   # not our protocol; drop the connection
+                payload = b""
+                if op == OP_PREDICT:
+                    # Validated before reading: the header alone sizes the
+                    # payload, so a bad one must not make us allocate it.
+                    # Its bytes stay unread, so the connection is dropped.
+                    error = None
+                    if dtype not in _NUMPY_DTYPES or count == 0 or count > server.max_images:
+                        error = f"bad PREDICT header: dtype {dtype}, count {count}"
+                    elif size != server.input_size:
+                        error = f"input size {size} != served input size {server.input_size}"
+                    if error is not None:
+                        server.errors.inc()
+                        self._reply(STATUS_ERROR, 0, error.encode())
+                        return
+                    itemsize = np.dtype(_NUMPY_DTYPES[dtype]).itemsize
+                    payload = _recv_exact(self.request, count * 3 * size * size * itemsize)
+                    if payload is None:
+                        return
+                self._dispatch(op, dtype, count, size, payload)
+        except (ConnectionError, OSError):
+            return
+        finally:
+            server.connections.dec()
+
+    def _dispatch(self, op, dtype, count, size, payload):
+        server = self.server
+        started = time.perf_counter()
+        try:
+            if op == OP_INFO:
+                self._reply(STATUS_OK, 0, json.dumps(server.info()).encode())
+                return
+            if op != OP_PREDICT:
+                raise ValueError(f"unknown op {op}")
+            images = np.frombuffer(payload, dtype=_NUMPY_DTYPES[dtype]).reshape(count, 3, size, size)
+            probs = np.ascontiguousarray(server.predict(images), dtype=np.float32)
+        except Exception as e:
+            server.errors.inc()
+            self._reply(STATUS_ERROR, 0, str(e).encode())
+            return
+        server.images.inc(count)
+        server.latency_ms.observe((time.perf_counter() - started) * 1000.0)
+        self._reply(STATUS_OK, count, probs.tobytes())
+
+    def _reply(self, status, count, payload):
+        self.request.sendall(RESPONSE.pack(MAGIC, status, count, len(payload)) + payload)
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Thread-per-connection server. ``predict(images)`` gets an (N, 3, S, S)
+    uint8 or float32 numpy array and returns (N, classes) probabilities;
+    ``info()`` returns the JSON-able description sent for INFO. An existing
+    socket file at ``path`` is replaced.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, predict, info, input_size, max_images=64, name="sidecar.server"):
+        if os.path.exists(path):
+            os.unlink(path)
+        self.path = path
+        self.predict = predict
+        self.info = info
+        self.input_size = input_size
+        self.max_images = max_images
+        self.connections = metrics.gauge(f"{name}.connections")
+        self.images = metrics.counter(f"{name}.images")
+        self.errors = metrics.counter(f"{name}.errors")
+        self.latency_ms = metrics.histogram(f"{name}.latency_ms", metrics.LATENCY_MS_BUCKETS)
+        super().__init__(path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+# =============================================================================
+# Client
+# =============================================================================
+
+class SidecarClient:
+    """
+    Client side of the protocol. Each thread keeps its own connection,
+    opened on first use and again after a fork, so it can be created in a
+    preloading gunicorn master. A request that fails on a stale connection
+    is retried once on a fresh one (predictions are idempotent).
+    """
+
+    nbytes = 0   # no weights in this process (see memory.model_bytes)
+
+    def __init__(self, path, timeout=30.0, name="sidecar.client"):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._requests = metrics.counter(f"{name}.requests")
+        self._errors = metrics.counter(f"{name}.errors")
+        self._reconnects = metrics.counter(f"{name}.reconnects")
+        self._roundtrip_ms = metrics.histogram(f"{name}.roundtrip_ms", metrics.LATENCY_MS_BUCKETS)
+
+    def eval(self):
+        return self
+
+    def _socket(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None or self._local.pid != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock, self._local.pid = sock, os.getpid()
+        return sock
+
+    def _drop_socket(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None and self._local.pid == os.getpid():
+            sock.close()
+
+    def _exchange(self, header, payload):
+        sock = self._socket()
+        sock.sendall(header)
+        if payload:
+            try:
+                sock.sendall(payload)
+            except (BrokenPipeError, ConnectionResetError):
+                # The server rejects a bad header before reading the payload
+                # and hangs up; its error reply is still there to read.
+                pass
+        response = _recv_exact(sock, RESPONSE.size)
+        if response is None:
+            raise ConnectionError("inference server closed the connection")
+        magic, status, count, nbytes = RESPONSE.unpack(response)
+        if magic != MAGIC:
+            raise ConnectionError("unexpected response from inference server")
+        body = _recv_exact(sock, nbytes) if nbytes else bytearray()
+        return status, count, body
+
+    def _call(self, op, dtype=0, count=0, size=0, payload=b""):
+        header = REQUEST.pack(MAGIC, op, dtype, count, size)
+        started = time.perf_counter()
+        self._requests.inc()
+        for attempt in (0, 1):
+            try:
+                status, count, body = self._exchange(header, payload)
+                break
+            except (ConnectionError, OSError) as e:
+                self._drop_socket()
+                if attempt == 0 and not isinstance(e, socket.timeout):
+                    self._reconnects.inc()
+                    continue
+                self._errors.inc()
+                raise SidecarError(f"inference server at {self.path} unavailable: {e}")
+        self._roundtrip_ms.observe((time.perf_counter() - started) * 1000.0)
+        if status != STATUS_OK:
+            self._errors.inc()
+            self._drop_socket()   # the server may have hung up (see _Handler)
+            raise SidecarError(bytes(body).decode("utf-8", "replace"))
+        return count, body
+
+    def info(self):
+        _, body = self._call(OP_INFO)
+        return json.loads(bytes(body).decode("utf-8"))
+
+    def predict(self, inputs):
+        """
+        Probabilities (N, classes) as a torch tensor for a list of (3, S, S)
+        tensors or an (N, 3, S, S) batch, all uint8 crops or all normalized
+        float32.
+        """
+        import torch
+
+        batch = torch.stack(list(inputs)) if isinstance(inputs, (list, tuple)) else inputs
+        batch = batch.detach().cpu().contiguous()
+        dtype = DTYPE_UINT8 if batch.dtype == torch.uint8 else DTYPE_FLOAT32
+        array = batch.numpy() if dtype == DTYPE_UINT8 else batch.float().numpy()
+        count, body = self._call(OP_PREDICT, dtype, array.shape[0], array.shape[-1], array.tobytes())
+        return torch.from_numpy(np.frombuffer(body, dtype=np.float32).reshape(count, -1))
+
+    def stats(self):
+        return {
+            "socket": self.path,
+            "requests": self._requests.value,
+            "errors": self._errors.value,
+            "reconnects": self._reconnects.value,
+        }
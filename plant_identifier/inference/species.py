@@ -0,0 +1,24 @@
+# plant_identifier/inference/species.py
+#
+# Class index -> species lookup tables built from the json/ mappings.
+
+import numpy as np
+
+
+def build_class_tables(class_idx_to_species_id, species_id_to_cmn_name, species_id_to_scn_name):
+    """
+    Arrays aligned with the model's class index, so a batch of predicted
+    indices maps to species ids / names with one fancy-index each instead of
+    per-item dict lookups. Missing entries get species id 0 / "Unknown".
+    """
+    size = max((int(k) for k in class_idx_to_species_id), default=-1) + 1
+    species_ids = np.zeros(size, dtype=np.int64)
+    cmn_names = np.full(size, "Unknown", dtype=object)
+    scn_names = np.full(size, "Unknown", dtype=object)
+    for idx, species_id in class_idx_to_species_id.items():
+        sid = str(species_id).strip()
+        i = int(idx)
+        species_ids[i] = int(sid)
+        cmn_names[i] = species_id_to_cmn_name.get(sid, "Unknown")
+        scn_names[i] = species_id_to_scn_name.get(sid, "Unknown")
+    return species_ids, cmn_names, scn_names
@@ -0,0 +1,105 @@
+# plant_identifier/inference/threads.py
+#
+# Per-process torch thread settings. By default every worker's intra-op pool
+# is as wide as the machine, so N gunicorn workers run N x cores threads and
+# fight over the same cores. The plan here splits a core budget between the
+# workers, optionally pinning each worker to its own CPUs.
+#
+# Environment (read by configure_from_env):
+#   PREDICT_TORCH_THREADS          intra-op threads per worker ("auto": budget // workers)
+#   PREDICT_TORCH_INTEROP_THREADS  inter-op threads per worker (default 1)
+#   PREDICT_CPU_BUDGET             cores to share between workers (default: usable CPUs)
+#   PREDICT_PIN_CPUS               pin each worker to its slice of the budget
+
+import os
+
+import torch
+
+_applied = None
+
+
+def available_cpus():
+    """CPUs this process may run on (cgroup/taskset aware where the OS allows)."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def plan_threads(workers: int, cpus, threads=None, interop_threads: int = 1, pin: bool = False, slot=None):
+    """
+    Thread plan for one of ``workers`` processes sharing ``cpus``. ``slot``
+    (0..workers-1) picks the worker's CPU slice when pinning.
+    """
+    cpus = list(cpus)
+    workers = max(1, int(workers))
+    per_worker = max(1, len(cpus) // workers)
+    pinned = None
+    if pin and slot is not None and cpus:
+        start = (slot * per_worker) % len(cpus)
+        pinned = [cpus[(start + i) % len(cpus)] for i in range(per_worker)]
+    return {
+        "workers": workers,
+        "slot": slot,
+        "cpu_budget": len(cpus),
+        "intra_op_threads": int(threads) if threads else per_worker,
+        "inter_op_threads": max(1, int(interop_threads)),
+        "pinned_cpus": pinned,
+    }
+
+
+def apply_threads(plan: dict):
+    """
+    Apply a plan to this process. Affinity goes first so the OpenMP pool is
+    created on the right CPUs. The inter-op pool can only be sized before
+    torch starts it; a failure there is recorded, not raised.
+    """
+    global _applied
+    applied = dict(plan, errors=[])
+    if plan.get("pinned_cpus"):
+        try:
+            os.sched_setaffinity(0, plan["pinned_cpus"])
+        except (AttributeError, OSError) as e:
+            applied["errors"].append(f"affinity: {e}")
+    torch.set_num_threads(plan["intra_op_threads"])
+    if torch.get_num_interop_threads() != plan["inter_op_threads"]:
+        try:
+            torch.set_num_interop_threads(plan["inter_op_threads"])
+        except RuntimeError as e:
+            applied["errors"].append(f"interop: {e}")
+    _applied = applied
+    return applied
+
+
+def configure_from_env(workers: int, slot=None, cpus=None):
+    """Plan from the PREDICT_* variables above and apply it; returns the applied plan."""
+    cpus = list(cpus) if cpus is not None else available_cpus()
+    budget = os.getenv("PREDICT_CPU_BUDGET", "").strip()
+    if budget:
+        cpus = cpus[:max(1, int(budget))]
+    threads = os.getenv("PREDICT_TORCH_THREADS", "auto").strip().lower()
+    plan = plan_threads(
+        workers,
+        cpus,
+        threads=None if threads in ("", "auto") else int(threads),
+        interop_threads=int(os.getenv("PREDICT_TORCH_INTEROP_THREADS", "1")),
+        pin=os.getenv("PREDICT_PIN_CPUS", "0").strip().lower() in ("1", "true", "yes"),
+        slot=slot,
+    )
+    return apply_threads(plan)
+
+
+def is_configured() -> bool:
+    return _applied is not None
+
+
+def thread_report():
+    """The applied plan (None if none was) and what torch/the OS actually use now."""
+    return {
+        "plan": _applied,
+        "effective": {
+            "intra_op_threads": torch.get_num_threads(),
+            "inter_op_threads": torch.get_num_interop_threads(),
+            "affinity": available_cpus(),
+        },
+    }
@@ -0,0 +1,85 @@
+import os
+import time
+
+import numpy as np
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from plant_identifier.inference.embeddings import Embedder, save_index
+from plant_identifier.inference.optimize import file_fingerprint
+from plant_identifier.inference.preprocess import build_transform, decode_image
+from plant_identifier.inference.reference import reference_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Extract penultimate-layer embeddings of every reference photo under media/images/ "
+        "into a float16 matrix used by /similar/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=os.path.join(settings.BASE_DIR, "models", "efficientnet_b3.pt"))
+        parser.add_argument("--output", default=os.path.join(settings.BASE_DIR, "models", "embeddings"),
+                            help="Index directory (matches PREDICT_EMBEDDINGS_DIR).")
+        parser.add_argument("--batch-size", type=int, default=16)
+        parser.add_argument("--limit", type=int, help="Only embed the first N reference photos.")
+        parser.add_argument("--threads", type=int, help="torch.set_num_threads for the extraction.")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        if not os.path.isfile(source):
+            raise CommandError(f"Model not found at {source}")
+        if options["threads"]:
+            torch.set_num_threads(options["threads"])
+
+        model = torch.jit.load(source, map_location="cpu").eval()
+        try:
+            embed = Embedder(model)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        pairs = reference_images(settings.MEDIA_ROOT, limit=options["limit"])
+        if not pairs:
+            raise CommandError(f"No reference images under {os.path.join(settings.MEDIA_ROOT, 'images')}")
+
+        transform = build_transform()
+        entries, chunks, batch = [], [], []
+        skipped = 0
+        started = time.perf_counter()
+
+        def flush():
+            if batch:
+                chunks.append(embed(torch.stack(batch)).numpy().astype(np.float16))
+                batch.clear()
+
+        for path, species_id in pairs:
+            try:
+                batch.append(transform(decode_image(path)))
+            except Exception as e:
+                skipped += 1
+                self.stderr.write(f"Skipping {path}: {e}")
+                continue
+            entries.append({
+                "path": os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/"),
+                "species_id": species_id,
+            })
+            if len(batch) >= options["batch_size"]:
+                flush()
+                self.stderr.write(f"  {len(entries)}/{len(pairs)}", ending="\r")
+        flush()
+        self.stderr.write("")
+
+        if not entries:
+            raise CommandError("None of the reference images could be decoded.")
+        matrix = np.concatenate(chunks)
+        save_index(options["output"], matrix, entries, {
+            "model_fingerprint": file_fingerprint(source),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+
+        self.stdout.write(
+            f"Embedded {len(entries)} images ({skipped} skipped) into {options['output']}: "
+            f"{matrix.shape[0]}x{matrix.shape[1]} float16, {matrix.nbytes / (1024 * 1024):.1f} MB "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
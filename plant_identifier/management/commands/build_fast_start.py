@@ -0,0 +1,153 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from plant_identifier.inference.fastload import (
+    build_fast_artifact, fast_artifact_path, load_fast_artifact, save_fast_artifact, source_stamp,
+)
+from plant_identifier.inference.optimize import file_fingerprint
+from plant_identifier.inference.preprocess import INPUT_SIZE, build_transform, decode_image
+from plant_identifier.inference.reference import reference_images
+
+# Runs in a fresh interpreter per artifact, so nothing is warm: load the
+# model the way the server does, then time the first forward passes.
+_COLD_START = """
+import json, os, sys, time
+import torch, torchvision
+sys.path.insert(0, os.getcwd())
+kind, path, threads, passes = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+if threads:
+    torch.set_num_threads(threads)
+started = time.perf_counter()
+if kind == "fast":
+    from plant_identifier.inference.fastload import load_fast_artifact
+    model, meta = load_fast_artifact(path)
+else:
+    from plant_identifier.inference.optimize import file_fingerprint, load_model
+    model, meta = load_model(path, torch.device("cpu"))
+    file_fingerprint(path)
+load_ms = (time.perf_counter() - started) * 1000.0
+x = torch.zeros(1, 3, {size}, {size})
+forward_ms = []
+with torch.no_grad():
+    for _ in range(passes):
+        t0 = time.perf_counter()
+        model(x)
+        forward_ms.append((time.perf_counter() - t0) * 1000.0)
+print(json.dumps({{"load_ms": load_ms, "forward_ms": forward_ms}}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Build models/efficientnet_b3.fast.pt: BN-folded eager weights that workers memory-map at "
+        "startup instead of deserializing TorchScript. Checks parity and compares cold starts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=os.path.join(settings.BASE_DIR, "models", "efficientnet_b3.pt"))
+        parser.add_argument("--output", help="Artifact path (default: next to --source, .fast.pt).")
+        parser.add_argument("--parity-images", type=int, default=16, help="Reference images used for the parity check.")
+        parser.add_argument("--atol", type=float, default=1e-3, help="Max allowed absolute logit difference.")
+        parser.add_argument("--passes", type=int, default=5, help="Forward passes timed after each cold load.")
+        parser.add_argument("--warmup-passes", type=int, default=int(os.getenv("PREDICT_WARMUP_PASSES", "3")),
+                            help="Passes counted towards 'ready' (PREDICT_WARMUP_PASSES).")
+        parser.add_argument("--threads", type=int, default=0, help="torch threads in the cold-start runs (0: default).")
+        parser.add_argument("--skip-cold-start", action="store_true", help="Do not run the cold-start comparison.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        if not os.path.isfile(source):
+            raise CommandError(f"Model not found at {source}")
+        output = options["output"] or fast_artifact_path(source)
+
+        module = torch.jit.load(source, map_location="cpu").eval()
+        started = time.perf_counter()
+        try:
+            weights, meta = build_fast_artifact(module)
+        except ValueError as e:
+            raise CommandError(str(e))
+        meta["source"] = {"fingerprint": file_fingerprint(source), **source_stamp(source)}
+        save_fast_artifact(weights, meta, output)
+        build_s = time.perf_counter() - started
+
+        # Parity: the artifact as workers load it against the TorchScript model.
+        fast, _ = load_fast_artifact(output)
+        transform = build_transform()
+        tensors = [transform(decode_image(path)) for path, _ in reference_images(settings.MEDIA_ROOT, limit=options["parity_images"])]
+        if not tensors:
+            tensors = [torch.randn(3, INPUT_SIZE, INPUT_SIZE) for _ in range(4)]
+        batch = torch.stack(tensors)
+        with torch.no_grad():
+            expected, actual = module(batch), fast(batch)
+        max_diff = float((expected - actual).abs().max())
+        agreement = float((expected.argmax(1) == actual.argmax(1)).float().mean())
+
+        report = {
+            "output": output,
+            "artifact_mb": os.path.getsize(output) / (1024 * 1024),
+            "build_s": build_s,
+            "fingerprint": meta["source"]["fingerprint"],
+            "folded_batchnorms": meta["folded_batchnorms"],
+            "parity_images": len(tensors),
+            "max_abs_logit_diff": max_diff,
+            "top1_agreement": agreement,
+            "atol": options["atol"],
+            "passed": max_diff <= options["atol"],
+        }
+        if not report["passed"]:
+            os.remove(output)
+            raise CommandError(
+                f"Parity check failed: max logit diff {max_diff:.2e} > atol {options['atol']:.0e}; removed {output}"
+            )
+        # Workers only serve an artifact that records a passing check.
+        meta["parity"] = {
+            "images": len(tensors), "max_abs_logit_diff": max_diff, "top1_agreement": agreement,
+            "atol": options["atol"], "passed": True,
+        }
+        save_fast_artifact(weights, meta, output)
+
+        if not options["skip_cold_start"]:
+            report["cold_start"] = {
+                "torchscript": self._cold_start("torchscript", source, options),
+                "fast": self._cold_start("fast", output, options),
+            }
+            report["ready_speedup"] = (
+                report["cold_start"]["torchscript"]["ready_ms"] / report["cold_start"]["fast"]["ready_ms"]
+            )
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f"Wrote {output} ({report['artifact_mb']:.1f} MB, {meta['folded_batchnorms']} BatchNorms folded) "
+            f"in {build_s:.1f}s; max |logit diff| {max_diff:.2e}, top-1 agreement {agreement:.2%}"
+        )
+        for name, run in report.get("cold_start", {}).items():
+            self.stdout.write(
+                f"  {name:<12} load {run['load_ms']:7.0f} ms  first pass {run['forward_ms'][0]:7.0f} ms  "
+                f"ready after {options['warmup_passes']} passes {run['ready_ms']:7.0f} ms"
+            )
+        if "ready_speedup" in report:
+            self.stdout.write(f"  cold start  {report['ready_speedup']:.1f}x faster to ready")
+        self.stdout.write("Serve it with PREDICT_FAST_START=1.")
+
+    def _cold_start(self, kind, path, options):
+        passes = max(options["passes"], options["warmup_passes"], 1)
+        out = subprocess.run(
+            [sys.executable, "-c", _COLD_START.format(size=INPUT_SIZE), kind, path, str(options["threads"]), str(passes)],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+        )
+        if out.returncode != 0:
+            raise CommandError(f"Cold-start run for {path} failed: {out.stderr.strip().splitlines()[-1:]}")
+        run = json.loads(out.stdout.strip().splitlines()[-1])
+        run["first_request_ms"] = run["load_ms"] + run["forward_ms"][0]
+        run["ready_ms"] = run["load_ms"] + sum(run["forward_ms"][:options["warmup_passes"]])
+        return run
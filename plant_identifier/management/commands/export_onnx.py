@@ -0,0 +1,106 @@
+import json
+import os
+import time
+
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from plant_identifier.inference.backends import OnnxRuntimeModel, export_onnx, onnx_path
+from plant_identifier.inference.optimize import file_fingerprint
+from plant_identifier.inference.preprocess import INPUT_SIZE, build_transform, decode_image
+from plant_identifier.inference.reference import reference_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Export models/efficientnet_b3.pt to ONNX for PREDICT_BACKEND=onnxruntime and check "
+        "logit parity against TorchScript on the reference photos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=os.path.join(settings.BASE_DIR, "models", "efficientnet_b3.pt"))
+        parser.add_argument("--output", help="ONNX path (default: next to --source, .onnx).")
+        parser.add_argument("--opset", type=int, default=17)
+        parser.add_argument("--parity-images", type=int, default=32, help="Reference images used for the parity check.")
+        parser.add_argument("--batch-size", type=int, default=4, help="Batch size for the parity check.")
+        parser.add_argument("--atol", type=float, default=1e-3, help="Max allowed absolute logit difference.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        if not os.path.isfile(source):
+            raise CommandError(f"Model not found at {source}")
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            raise CommandError("onnxruntime is not installed (pip install onnx onnxruntime)")
+
+        output = options["output"] or onnx_path(source)
+        module = torch.jit.load(source, map_location="cpu").eval()
+        meta = {
+            "source_fingerprint": file_fingerprint(source),
+            "opset": options["opset"],
+            "input_size": INPUT_SIZE,
+            "torch_version": torch.__version__,
+        }
+
+        self.stderr.write(f"Exporting {source} -> {output} ...")
+        started = time.perf_counter()
+        try:
+            export_onnx(module, output, meta, input_size=INPUT_SIZE, opset=options["opset"])
+        except Exception as e:
+            raise CommandError(f"ONNX export failed: {e}")
+        export_s = time.perf_counter() - started
+
+        # Parity: same preprocessed batches through both backends.
+        transform = build_transform()
+        pairs = reference_images(settings.MEDIA_ROOT, limit=options["parity_images"])
+        tensors = [transform(decode_image(path)) for path, _ in pairs]
+        if not tensors:
+            tensors = [torch.randn(3, INPUT_SIZE, INPUT_SIZE) for _ in range(options["batch_size"])]
+
+        ort_model = OnnxRuntimeModel(output)
+        max_diff = mean_diff = 0.0
+        agree = 0
+        with torch.no_grad():
+            for start in range(0, len(tensors), options["batch_size"]):
+                batch = torch.stack(tensors[start:start + options["batch_size"]])
+                expected = module(batch)
+                actual = ort_model(batch)
+                diff = (expected - actual).abs()
+                max_diff = max(max_diff, float(diff.max()))
+                mean_diff += float(diff.mean()) * len(batch)
+                agree += int((expected.argmax(1) == actual.argmax(1)).sum())
+        n = len(tensors)
+
+        report = {
+            "output": output,
+            "onnx_mb": os.path.getsize(output) / (1024 * 1024),
+            "export_s": export_s,
+            "opset": options["opset"],
+            "parity_images": n,
+            "max_abs_logit_diff": max_diff,
+            "mean_abs_logit_diff": mean_diff / n,
+            "top1_agreement": agree / n,
+            "atol": options["atol"],
+            "passed": max_diff <= options["atol"],
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"Wrote {output} ({report['onnx_mb']:.1f} MB) in {export_s:.1f}s")
+            self.stdout.write(
+                f"Parity over {n} images: max |logit diff| {max_diff:.2e}, "
+                f"mean {report['mean_abs_logit_diff']:.2e}, top-1 agreement {report['top1_agreement']:.2%}"
+            )
+
+        if not report["passed"]:
+            os.remove(output)
+            raise CommandError(
+                f"Parity check failed: max logit diff {max_diff:.2e} > atol {options['atol']:.0e}; "
+                f"removed {output}"
+            )
+        if not options["json"]:
+            self.stdout.write("Serve it with PREDICT_BACKEND=onnxruntime")
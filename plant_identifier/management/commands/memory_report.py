@@ -0,0 +1,46 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from plant_identifier.inference.memory import fork_report
+
+
+class Command(BaseCommand):
+    help = "Per-process RSS of a gunicorn master and its workers, split into shared and unique memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pid", type=int, help="PID of the gunicorn master.")
+        parser.add_argument("--pidfile", default="gunicorn.pid", help="gunicorn pidfile (used when --pid is not given).")
+        parser.add_argument("--json", action="store_true", help="Print the raw report as JSON.")
+
+    def handle(self, *args, **options):
+        pid = options["pid"]
+        if pid is None:
+            try:
+                with open(options["pidfile"], "r") as f:
+                    pid = int(f.read().strip())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read master pid from {options['pidfile']}: {e}")
+        if not os.path.exists(f"/proc/{pid}"):
+            raise CommandError(f"No such process: {pid}")
+
+        report = fork_report(pid)
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        def mb(kb):
+            return f"{kb / 1024:8.1f}"
+
+        self.stdout.write(f"{'role':<8} {'pid':>7} {'rss MB':>8} {'pss MB':>8} {'shared MB':>9} {'unique MB':>9}")
+        rows = ([("master", report["master"])] if report["master"] else []) + [("worker", w) for w in report["workers"]]
+        for role, m in rows:
+            self.stdout.write(
+                f"{role:<8} {m['pid']:>7} {mb(m['rss_kb'])} {mb(m['pss_kb'])} {mb(m['shared_kb']):>9} {mb(m['unique_kb']):>9}"
+            )
+        self.stdout.write(
+            f"total rss {mb(report['total_rss_kb']).strip()} MB, "
+            f"pss {mb(report['total_pss_kb']).strip()} MB, "
+            f"unique {mb(report['total_unique_kb']).strip()} MB"
+        )
@@ -0,0 +1,166 @@
+import json
+import os
+import time
+
+import torch
+from PIL import Image
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from plant_identifier.inference.metrics import percentile
+from plant_identifier.inference.optimize import VARIANTS, artifact_path, build_variant, load_model, save_variant
+from plant_identifier.inference.preprocess import build_transform
+from plant_identifier.inference.reference import reference_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Build an optimized CPU variant of models/efficientnet_b3.pt (frozen, INT8, channels-last) "
+        "and report its latency and top-1 agreement against the FP32 model."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--variant", choices=VARIANTS[1:], default="optimized")
+        parser.add_argument("--source", default=os.path.join(settings.BASE_DIR, "models", "efficientnet_b3.pt"))
+        parser.add_argument("--output", help="Artifact path (default: next to --source, named after the variant).")
+        parser.add_argument("--calibration-images", type=int, default=64, help="Reference images used for int8-static calibration.")
+        parser.add_argument("--eval-images", type=int, default=200, help="Reference images used for the agreement check.")
+        parser.add_argument("--batch-size", type=int, default=1, help="Batch size for the latency measurement.")
+        parser.add_argument("--runs", type=int, default=20, help="Timed forward passes per model.")
+        parser.add_argument("--threads", type=int, help="torch.set_num_threads for the measurement.")
+        parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        if not os.path.isfile(source):
+            raise CommandError(f"Model not found at {source}")
+        if options["threads"]:
+            torch.set_num_threads(options["threads"])
+
+        device = torch.device("cpu")
+        fp32, _ = load_model(source, device)
+        fp32.eval()
+
+        transform = build_transform()
+        needed = options["eval_images"] + options["calibration_images"]
+        pairs = reference_images(settings.MEDIA_ROOT, limit=needed)
+        eval_pairs = pairs[:options["eval_images"]]
+        calib_pairs = pairs[options["eval_images"]:]
+
+        def load(path):
+            return transform(Image.open(path).convert("RGB"))
+
+        calibration = [load(p).unsqueeze(0) for p, _ in calib_pairs] if options["variant"] == "int8-static" else []
+
+        self.stderr.write(f"Building {options['variant']} from {source} ...")
+        started = time.perf_counter()
+        try:
+            optimized, meta = build_variant(fp32, options["variant"], calibration)
+        except (RuntimeError, ValueError) as e:
+            raise CommandError(str(e))
+        build_s = time.perf_counter() - started
+
+        output = options["output"] or artifact_path(source, options["variant"])
+        save_variant(optimized, meta, output)
+        # Measure what the server will actually run: the artifact as loaded.
+        optimized, meta = load_model(output, device)
+        channels_last = meta["channels_last"]
+
+        def prepare(batch, for_variant):
+            if for_variant and channels_last:
+                return batch.contiguous(memory_format=torch.channels_last)
+            return batch
+
+        # Latency on a fixed input batch
+        if eval_pairs:
+            sample = load(eval_pairs[0][0])
+        else:
+            sample = transform(Image.new("RGB", (400, 300)))
+        batch = sample.unsqueeze(0).repeat(options["batch_size"], 1, 1, 1)
+
+        def time_model(model, for_variant):
+            x = prepare(batch, for_variant)
+            timings = []
+            with torch.no_grad():
+                for _ in range(3):
+                    model(x)
+                for _ in range(options["runs"]):
+                    t0 = time.perf_counter()
+                    model(x)
+                    timings.append((time.perf_counter() - t0) * 1000.0)
+            timings.sort()
+            return {
+                "mean_ms": sum(timings) / len(timings),
+                "p50_ms": percentile(timings, 50),
+                "p95_ms": percentile(timings, 95),
+                "images_per_s": options["batch_size"] * 1000.0 * len(timings) / sum(timings),
+            }
+
+        latency_fp32 = time_model(fp32, False)
+        latency_variant = time_model(optimized, True)
+
+        # Agreement / accuracy on the labelled reference photos
+        from plant_identifier.views.prediction_views import class_idx_to_species_id
+        species_to_idx = {str(v).strip(): int(k) for k, v in class_idx_to_species_id.items()}
+
+        agree = top5_overlap = correct_fp32 = correct_variant = labelled = 0
+        max_prob_diff = 0.0
+        with torch.no_grad():
+            for path, species_id in eval_pairs:
+                x = load(path).unsqueeze(0)
+                p_fp32 = torch.softmax(fp32(x), dim=1)[0]
+                p_var = torch.softmax(optimized(prepare(x, True)), dim=1)[0]
+                top_fp32, top_var = int(p_fp32.argmax()), int(p_var.argmax())
+                agree += top_fp32 == top_var
+                top5_overlap += len(set(p_fp32.topk(5).indices.tolist()) & set(p_var.topk(5).indices.tolist()))
+                max_prob_diff = max(max_prob_diff, float((p_fp32 - p_var).abs().max()))
+                label = species_to_idx.get(species_id)
+                if label is not None:
+                    labelled += 1
+                    correct_fp32 += top_fp32 == label
+                    correct_variant += top_var == label
+
+        n = len(eval_pairs)
+        report = {
+            "variant": options["variant"],
+            "artifact": output,
+            "artifact_mb": os.path.getsize(output) / (1024 * 1024),
+            "source_mb": os.path.getsize(source) / (1024 * 1024),
+            "build_s": build_s,
+            "threads": torch.get_num_threads(),
+            "batch_size": options["batch_size"],
+            "latency": {"fp32": latency_fp32, options["variant"]: latency_variant},
+            "speedup": latency_fp32["mean_ms"] / latency_variant["mean_ms"],
+            "eval_images": n,
+            "top1_agreement": (agree / n) if n else None,
+            "top5_overlap": (top5_overlap / (5 * n)) if n else None,
+            "max_prob_diff": max_prob_diff if n else None,
+            "accuracy": {
+                "fp32": (correct_fp32 / labelled) if labelled else None,
+                options["variant"]: (correct_variant / labelled) if labelled else None,
+            },
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"Wrote {output} ({report['artifact_mb']:.1f} MB, source {report['source_mb']:.1f} MB) in {build_s:.1f}s")
+        self.stdout.write(f"Latency @ batch {options['batch_size']}, {report['threads']} threads:")
+        for name, lat in report["latency"].items():
+            self.stdout.write(
+                f"  {name:<13} mean {lat['mean_ms']:7.1f} ms  p50 {lat['p50_ms']:7.1f} ms  "
+                f"p95 {lat['p95_ms']:7.1f} ms  {lat['images_per_s']:6.1f} img/s"
+            )
+        self.stdout.write(f"  speedup       {report['speedup']:.2f}x")
+        if n:
+            self.stdout.write(
+                f"Top-1 agreement {report['top1_agreement']:.2%} over {n} reference images "
+                f"(top-5 overlap {report['top5_overlap']:.2%}, max prob diff {max_prob_diff:.4f})"
+            )
+            if labelled:
+                self.stdout.write(
+                    f"Reference accuracy: fp32 {report['accuracy']['fp32']:.2%}, "
+                    f"{options['variant']} {report['accuracy'][options['variant']]:.2%}"
+                )
+        self.stdout.write(f"Serve it with PREDICT_MODEL_VARIANT={options['variant']}")
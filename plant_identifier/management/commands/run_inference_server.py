@@ -0,0 +1,87 @@
+import os
+import signal
+
+import torch
+from django.core.management.base import BaseCommand, CommandError
+
+from plant_identifier.inference.batching import MicroBatcher
+from plant_identifier.inference.sidecar import InferenceServer
+from plant_identifier.inference.threads import configure_from_env
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the prediction model over a Unix socket for web workers started with "
+        "PREDICT_SIDECAR_SOCKET, micro-batching requests from all of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=os.getenv("PREDICT_SIDECAR_SOCKET") or "/tmp/plant-inference.sock")
+        parser.add_argument("--max-batch-size", type=int, default=int(os.getenv("PREDICT_MAX_BATCH_SIZE", "8")))
+        parser.add_argument("--max-wait-ms", type=float, default=float(os.getenv("PREDICT_MAX_WAIT_MS", "5")))
+        parser.add_argument("--socket-mode", default="660", help="Octal permissions of the socket file.")
+
+    def handle(self, *args, **options):
+        from plant_identifier.views import prediction_views as pv
+
+        # This process is the one that owns the model: never forward to a
+        # sidecar from here, and give torch every core of the budget.
+        # Clients send uint8 crops, which only the fused path normalizes,
+        # whatever PREDICT_FUSED_PREPROCESS says for web workers.
+        pv.PREDICT_SIDECAR_SOCKET = ""
+        pv.PREDICT_FUSED_PREPROCESS = True
+        configure_from_env(workers=1)
+        try:
+            pv.warm_up()
+        except Exception as e:
+            raise CommandError(f"Model init failed: {e}")
+        if pv._readiness["state"] != "ready":
+            raise CommandError(f"Model init failed: {pv._readiness['error']}")
+
+        batcher = MicroBatcher(
+            pv._run_batch,
+            max_batch_size=options["max_batch_size"],
+            max_wait_ms=options["max_wait_ms"],
+            name="sidecar",
+        )
+
+        def predict(images):
+            tensors = torch.from_numpy(images)
+            if tensors.dtype == torch.uint8:
+                # Single crops from every connected worker share forward passes.
+                futures = [batcher.submit(crop) for crop in tensors.unbind(0)]
+                return torch.stack([f.result() for f in futures]).numpy()
+            return pv._probs_for_batch(tensors.to(pv._device)).cpu().numpy()
+
+        def info():
+            return {
+                "model_version": pv._model_version,
+                "backend": pv.PREDICT_BACKEND,
+                "model_variant": pv.PREDICT_MODEL_VARIANT,
+                "input_size": pv.INPUT_SIZE,
+                "classes": len(pv._class_species_ids),
+                "pid": os.getpid(),
+            }
+
+        server = InferenceServer(
+            options["socket"], predict, info,
+            input_size=pv.INPUT_SIZE,
+            max_images=max(options["max_batch_size"], pv.PREDICT_MAX_BATCH_IMAGES, len(pv._tta_transform)),
+        )
+        os.chmod(options["socket"], int(options["socket_mode"], 8))
+
+        def stop(*_):
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGTERM, stop)
+
+        self.stdout.write(
+            f"Serving {pv._model_version} on {options['socket']} "
+            f"(batches up to {options['max_batch_size']}, {options['max_wait_ms']:g} ms window)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
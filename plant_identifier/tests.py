@@ -1,3 +1,1452 @@
-from django.test import TestCase
+import io
+import os
+import socket
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import torch
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase
+from PIL import Image, ImageFile
+from rest_framework_simplejwt.tokens import AccessToken
+
+from plant.models import FlaggedCase, PlantIdentification
+from plant_identifier.flagging import AUTO_SUBMITTER, HourlyCap, flag_reason, make_flag_writer
+from plant_identifier.history import write_predictions
+from plant_identifier.inference.admission import (
+    AdmissionController, AdmissionError, DeadlineExceeded, Overloaded, deadline_after,
+)
+from plant_identifier.inference.backends import OnnxRuntimeModel, export_onnx, load_backend
+from plant_identifier.inference.batching import MicroBatcher
+from plant_identifier.inference.cache import LRUCache, SingleFlight, content_key
+from plant_identifier.inference.cascade import CascadeGate, confidence_and_margin
+from plant_identifier.inference.embeddings import Embedder, EmbeddingIndex, save_index
+from plant_identifier.inference.fastload import build_fast_artifact, load_fast_artifact, save_fast_artifact, source_stamp
+from plant_identifier.inference.optimize import file_fingerprint
+from plant_identifier.inference.pipeline import StagedPipeline
+from plant_identifier.inference.preprocess import (
+    INPUT_SIZE, STD, FusedPreprocess, ImageRejected, InputBufferPool, TTATransform, build_transform,
+    decode_image, sniff_image,
+)
+from plant_identifier.inference.reference import reference_images
+from plant_identifier.inference.resolution import ResolutionGovernor, parse_tiers
+from plant_identifier.inference import sidecar
+from plant_identifier.inference.sidecar import InferenceServer, SidecarClient, SidecarError
+from plant_identifier.inference.species import build_class_tables
+from plant_identifier.inference.threads import configure_from_env, plan_threads
+from plant_identifier.models import PlantHistory
+from plant_identifier.views import prediction_views as pv
+
+
+def _jpeg(color=(90, 140, 60), size=(64, 48)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached in time")
+        time.sleep(0.005)
+
+
+# =============================================================================
+# Pure inference modules
+# =============================================================================
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_results_come_back_per_item_in_order(self):
+        batcher = MicroBatcher(lambda items: [x * 10 for x in items], max_batch_size=4, max_wait_ms=20,
+                               name="test.batcher.order")
+        futures = [batcher.submit(i) for i in range(6)]
+        self.assertEqual([f.result(timeout=5) for f in futures], [0, 10, 20, 30, 40, 50])
+
+    def test_items_queued_behind_a_running_batch_share_the_next_one(self):
+        sizes, gate = [], threading.Event()
+
+        def run(items):
+            gate.wait(5)
+            sizes.append(len(items))
+            return items
+
+        batcher = MicroBatcher(run, max_batch_size=4, max_wait_ms=0, name="test.batcher.share")
+        first = batcher.submit(0)
+        time.sleep(0.05)
+        rest = [batcher.submit(i) for i in range(1, 6)]
+        gate.set()
+        self.assertEqual([f.result(timeout=5) for f in [first] + rest], list(range(6)))
+        self.assertEqual(sizes, [1, 4, 1])
+
+    def test_a_failing_batch_fails_every_caller(self):
+        def run(items):
+            raise RuntimeError("forward pass failed")
+
+        batcher = MicroBatcher(run, max_batch_size=4, max_wait_ms=20, name="test.batcher.error")
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            with self.assertRaises(RuntimeError):
+                future.result(timeout=5)
+
+    def test_expired_items_are_dropped_before_the_batch_runs(self):
+        seen, gate = [], threading.Event()
+
+        def run(items):
+            gate.wait(5)
+            seen.extend(items)
+            return items
+
+        batcher = MicroBatcher(run, max_batch_size=1, max_wait_ms=0, name="test.batcher.deadline")
+        blocker = batcher.submit("blocker")
+        expired = batcher.submit("expired", deadline=time.perf_counter() + 0.01)
+        live = batcher.submit("live", deadline=time.perf_counter() + 30)
+        time.sleep(0.05)
+        gate.set()
+
+        self.assertEqual(blocker.result(timeout=5), "blocker")
+        self.assertEqual(live.result(timeout=5), "live")
+        with self.assertRaises(DeadlineExceeded):
+            expired.result(timeout=5)
+        self.assertNotIn("expired", seen)
+
+
+class SpeciesTableTests(SimpleTestCase):
+    def test_tables_are_indexed_by_class(self):
+        species_ids, cmn_names, scn_names = build_class_tables(
+            {"2": " 30 ", "0": "10"}, {"10": "Ten", "30": "Thirty"}, {"10": "Decem"},
+        )
+        self.assertEqual(species_ids.tolist(), [10, 0, 30])
+        self.assertEqual(cmn_names.tolist(), ["Ten", "Unknown", "Thirty"])
+        self.assertEqual(scn_names.tolist(), ["Decem", "Unknown", "Unknown"])
+
+    def test_served_tables_match_the_json_mapping(self):
+        self.assertEqual(len(pv._class_species_ids), len(pv.class_idx_to_species_id))
+        for idx, species_id in list(pv.class_idx_to_species_id.items())[::97]:
+            sid = str(species_id).strip()
+            self.assertEqual(pv._class_species_ids[int(idx)], int(sid))
+            self.assertEqual(pv._class_cmn_names[int(idx)], pv.species_id_to_cmn_name.get(sid, "Unknown"))
+            self.assertEqual(pv._class_scn_names[int(idx)], pv.species_id_to_scn_name.get(sid, "Unknown"))
+
+
+class TopKTests(SimpleTestCase):
+    def _probs(self, by_index):
+        probs = torch.zeros(len(pv._class_species_ids))
+        for idx, p in by_index.items():
+            probs[idx] = p
+        return probs
+
+    def test_candidates_are_best_first_and_aligned_with_the_class_index(self):
+        candidates = pv._candidates(self._probs({7: 0.2, 5: 0.5, 2: 0.3}), 3)
+        self.assertEqual([c["predicted_index"] for c in candidates], [5, 2, 7])
+        self.assertEqual([round(c["confidence"], 6) for c in candidates], [0.5, 0.3, 0.2])
+        for c in candidates:
+            self.assertEqual(c["species_id"], int(pv._class_species_ids[c["predicted_index"]]))
+            self.assertEqual(c["scientific_name"], pv._class_scn_names[c["predicted_index"]])
+
+    def test_payload_keeps_the_top1_shape_and_adds_the_list_on_request(self):
+        probs = self._probs({5: 0.5, 2: 0.3})
+        plain = pv._prediction_payload(probs)
+        self.assertNotIn("top_k", plain)
+        self.assertEqual(plain["predicted_index"], 5)
+        ranked = pv._prediction_payload(probs, 2)
+        self.assertEqual({k: v for k, v in ranked.items() if k != "top_k"}, ranked["top_k"][0])
+        self.assertEqual(ranked["top_k"][0]["predicted_index"], 5)
+
+    def test_top_k_is_parsed_and_capped(self):
+        factory = RequestFactory()
+        self.assertIsNone(pv._parse_top_k(factory.get("/predict/")))
+        self.assertEqual(pv._parse_top_k(factory.get("/predict/", {"top_k": "3"})), 3)
+        self.assertEqual(pv._parse_top_k(factory.get("/predict/", {"top_k": "5000"})), pv.PREDICT_MAX_TOP_K)
+        with self.assertRaises(ValueError):
+            pv._parse_top_k(factory.get("/predict/", {"top_k": "0"}))
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_hits_misses_and_least_recently_used_eviction(self):
+        cache = LRUCache(2, name=f"test.cache.{id(self)}")
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)        # "b" is now the oldest
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"], stats["evictions"]), (2, 3, 2, 1))
+
+    def test_zero_entries_disables_it(self):
+        cache = LRUCache(0, name=f"test.cache.off.{id(self)}")
+        cache.put("a", 1)
+        self.assertFalse(cache.enabled)
+        self.assertIsNone(cache.get("a"))
+
+    def test_keys_depend_on_content_and_model_version(self):
+        self.assertEqual(content_key(b"leaf", "fp32-abc"), content_key(b"leaf", "fp32-abc"))
+        self.assertNotEqual(content_key(b"leaf", "fp32-abc"), content_key(b"leaf", "fp32-def"))
+        self.assertNotEqual(content_key(b"leaf", "fp32-abc"), content_key(b"bark", "fp32-abc"))
+
+
+class DecodeImageTests(SimpleTestCase):
+    def _encoded(self, size, fmt="JPEG", mode="RGB"):
+        buf = io.BytesIO()
+        Image.new(mode, size).save(buf, format=fmt)
+        buf.seek(0)
+        return buf
+
+    def test_draft_picks_the_smallest_scale_still_covering_min_size(self):
+        self.assertEqual(decode_image(self._encoded((1600, 1200))).size, (400, 300))
+        self.assertEqual(decode_image(self._encoded((1600, 1200)), min_size=350).size, (800, 600))
+        self.assertEqual(decode_image(self._encoded((1600, 1200)), min_size=1200).size, (1600, 1200))
+
+    def test_without_draft_or_for_other_formats_the_full_image_is_decoded(self):
+        self.assertEqual(decode_image(self._encoded((1600, 1200)), draft=False).size, (1600, 1200))
+        self.assertEqual(decode_image(self._encoded((1600, 1200), fmt="PNG")).size, (1600, 1200))
+
+    def test_always_rgb(self):
+        self.assertEqual(decode_image(self._encoded((40, 30), fmt="PNG", mode="RGBA")).mode, "RGB")
+        self.assertEqual(decode_image(self._encoded((40, 30), mode="L")).mode, "RGB")
+
+
+class SniffImageTests(SimpleTestCase):
+    def _encoded(self, size, fmt="PNG"):
+        buf = io.BytesIO()
+        Image.new("RGB", size).save(buf, format=fmt)
+        buf.seek(7)
+        return buf
+
+    def test_reports_format_and_size_and_rewinds(self):
+        upload = self._encoded((120, 80))
+        self.assertEqual(sniff_image(upload, max_pixels=10_000), ("PNG", (120, 80)))
+        self.assertEqual(upload.tell(), 0)
+
+    def test_pixel_budget_is_checked_from_the_header(self):
+        upload = self._encoded((120, 80))
+        with mock.patch.object(ImageFile.ImageFile, "load", side_effect=AssertionError("decoded")):
+            with self.assertRaises(ImageRejected) as ctx:
+                sniff_image(upload, max_pixels=9_599)
+        self.assertEqual(ctx.exception.status, 413)
+        self.assertEqual(upload.tell(), 0)
+
+    def test_unsupported_or_unreadable_uploads(self):
+        for upload in (self._encoded((8, 8), fmt="TIFF"), io.BytesIO(b"%PDF-1.4 not an image")):
+            with self.assertRaises(ImageRejected) as ctx:
+                sniff_image(upload, max_pixels=10_000)
+            self.assertEqual(ctx.exception.status, 415)
+
+
+class TTATransformTests(SimpleTestCase):
+    image = Image.new("RGB", (420, 360), (30, 120, 60))
+
+    def test_view_set(self):
+        self.assertEqual(len(TTATransform()), 8)
+        self.assertEqual(TTATransform(views=3).views, ("base", "base_flip", "zoom_center"))
+        self.assertEqual(len(TTATransform(views=0)), 1)
+        self.assertEqual(len(TTATransform(views=20)), 8)
+        batch = TTATransform(size=64, views=5)(self.image)
+        self.assertEqual(tuple(batch.shape), (5, 3, 64, 64))
+        self.assertEqual(tuple(TTATransform(size=64, views=5)(self.image, include_base=False).shape), (4, 3, 64, 64))
+
+    def test_views_are_the_eval_transform_and_crops_of_the_zoomed_image(self):
+        tta = TTATransform(size=64, zoom=1.25)
+        batch = tta(self.image)
+        base = build_transform(64)(self.image)
+        self.assertTrue(torch.equal(batch[0], base))
+        self.assertTrue(torch.equal(batch[1], base.flip(-1)))
+        zoomed = build_transform(80)(self.image)
+        self.assertTrue(torch.allclose(batch[2], zoomed[:, 8:72, 8:72]))
+
+
+class _EmbeddingModel(torch.nn.Module):
+    """Exposes ``features``/``avgpool`` like torchvision's EfficientNet."""
+
+    def __init__(self):
+        super().__init__()
+        self.features = torch.nn.Conv2d(3, 4, 1)
+        self.avgpool = torch.nn.AdaptiveAvgPool2d(1)
+
+
+class EmbeddingIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        matrix = np.array([[1, 0, 0], [0.6, 0.8, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+        entries = [{"path": f"images/{sid}/{i}.jpg", "species_id": sid} for i, sid in enumerate([11, 11, 22, 33])]
+        save_index(self.dir.name, matrix, entries, {"model_fingerprint": "abc"})
+        self.index = EmbeddingIndex.load(self.dir.name)
+
+    def test_round_trip(self):
+        self.assertEqual((len(self.index), self.index.dim), (4, 3))
+        self.assertEqual(self.index.matrix.dtype, np.float16)
+        self.assertEqual(self.index.meta["model_fingerprint"], "abc")
+        self.assertEqual(self.index.entries[2], {"path": "images/22/2.jpg", "species_id": 22})
+
+    def test_search_is_best_first(self):
+        hits = self.index.search([0.8, 0.6, 0], k=3)
+        self.assertEqual([row for row, _ in hits], [1, 0, 2])
+        self.assertAlmostEqual(hits[0][1], 0.96, places=2)
+        self.assertEqual(len(self.index.search([1, 0, 0], k=10)), 4)
+
+    def test_distinct_species_keeps_the_best_row_per_species(self):
+        hits = self.index.search([0.8, 0.6, 0], k=3, distinct_species=True)
+        self.assertEqual([row for row, _ in hits], [1, 2, 3])
+
+    def test_chunked_scores_match(self):
+        whole = self.index.scores([0, 0.6, 0.8])
+        with mock.patch("plant_identifier.inference.embeddings.SEARCH_CHUNK_ROWS", 3):
+            self.assertTrue(np.array_equal(self.index.scores([0, 0.6, 0.8]), whole))
+
+    def test_inconsistent_index_is_refused(self):
+        np.save(os.path.join(self.dir.name, "embeddings.f16.npy"), np.zeros((3, 3), dtype=np.float16))
+        with self.assertRaises(ValueError):
+            EmbeddingIndex.load(self.dir.name)
+
+    def test_embedder_needs_the_unfrozen_model(self):
+        with self.assertRaises(ValueError):
+            Embedder(torch.nn.Linear(3, 3))
+        embeddings = Embedder(_EmbeddingModel().eval())(torch.rand(2, 3, 16, 16))
+        self.assertEqual(tuple(embeddings.shape), (2, 4))
+        self.assertTrue(torch.allclose(embeddings.norm(dim=1), torch.ones(2)))
+
+
+class CascadeGateTests(SimpleTestCase):
+    def test_confidence_and_margin(self):
+        confidence, margin = confidence_and_margin(torch.tensor([0.1, 0.6, 0.3]))
+        self.assertAlmostEqual(confidence, 0.6)
+        self.assertAlmostEqual(margin, 0.3)
+        self.assertEqual(confidence_and_margin(torch.tensor([1.0])), (1.0, 1.0))
+
+    def test_escalates_unless_both_thresholds_are_met(self):
+        gate = CascadeGate(0.8, 0.2, name=f"test.cascade.{id(self)}")
+        cases = {
+            (0.85, 0.10, 0.05): False,    # confident, clear lead
+            (0.80, 0.20, 0.00): False,    # exactly at both thresholds
+            (0.70, 0.05, 0.25): True,     # not confident enough
+            (0.50, 0.45, 0.05): True,     # confident-ish, but a near tie
+        }
+        for probs, escalate in cases.items():
+            self.assertEqual(gate.should_escalate(torch.tensor(probs))[0], escalate, probs)
+        stats = gate.stats()
+        self.assertEqual((stats["accepted"], stats["escalated"], stats["escalation_rate"]), (2, 2, 0.5))
+
+    def test_latency_saved_per_request(self):
+        gate = CascadeGate(0.5, 0.0, name=f"test.cascade.saved.{id(self)}")
+        gate.should_escalate(torch.tensor([0.9, 0.1]))
+        gate.should_escalate(torch.tensor([0.3, 0.7]))
+        gate.should_escalate(torch.tensor([0.55, 0.45]))
+        gate.should_escalate(torch.tensor([0.4, 0.3, 0.3]))
+        for _ in range(4):
+            gate.observe(1, 10.0)
+        gate.observe(2, 100.0)
+        # 3 of 4 skip a 100 ms stage 2, all 4 pay 10 ms for stage 1.
+        self.assertAlmostEqual(gate.stats()["avg_latency_saved_ms"], 65.0)
+
+
+class PlanThreadsTests(SimpleTestCase):
+    def test_splits_the_budget_between_workers(self):
+        plan = plan_threads(4, range(16))
+        self.assertEqual((plan["cpu_budget"], plan["intra_op_threads"], plan["inter_op_threads"]), (16, 4, 1))
+        self.assertIsNone(plan["pinned_cpus"])
+        self.assertEqual(plan_threads(3, range(8))["intra_op_threads"], 2)
+
+    def test_at_least_one_thread(self):
+        plan = plan_threads(8, range(2), interop_threads=0)
+        self.assertEqual((plan["intra_op_threads"], plan["inter_op_threads"]), (1, 1))
+        self.assertEqual(plan_threads(0, range(2))["workers"], 1)
+
+    def test_explicit_threads_win(self):
+        self.assertEqual(plan_threads(4, range(16), threads=6)["intra_op_threads"], 6)
+
+    def test_pins_disjoint_slices_by_slot(self):
+        cpus = [10, 11, 12, 13, 14, 15]
+        slices = [plan_threads(3, cpus, pin=True, slot=slot)["pinned_cpus"] for slot in range(3)]
+        self.assertEqual(slices, [[10, 11], [12, 13], [14, 15]])
+        # More workers than slices: later slots wrap around.
+        self.assertEqual(plan_threads(3, cpus, pin=True, slot=4)["pinned_cpus"], [12, 13])
+        self.assertIsNone(plan_threads(3, cpus, pin=True)["pinned_cpus"])
+
+    def test_configure_from_env(self):
+        env = {
+            "PREDICT_CPU_BUDGET": "4",
+            "PREDICT_TORCH_THREADS": "auto",
+            "PREDICT_TORCH_INTEROP_THREADS": "2",
+            "PREDICT_PIN_CPUS": "1",
+        }
+        with mock.patch.dict(os.environ, env), mock.patch(
+            "plant_identifier.inference.threads.apply_threads", side_effect=lambda plan: plan,
+        ):
+            plan = configure_from_env(2, slot=1, cpus=range(8))
+        self.assertEqual(
+            (plan["cpu_budget"], plan["intra_op_threads"], plan["inter_op_threads"], plan["pinned_cpus"]),
+            (4, 2, 2, [2, 3]),
+        )
+
+
+class OnnxRuntimeModelTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        torch.manual_seed(0)
+        cls.module = torch.jit.script(torch.nn.Sequential(
+            torch.nn.Conv2d(3, 8, 3, stride=2), torch.nn.ReLU(), torch.nn.AdaptiveAvgPool2d(1),
+            torch.nn.Flatten(), torch.nn.Linear(8, 5),
+        ).eval())
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.tmp.name, "tiny.onnx")
+        export_onnx(cls.module, cls.path, {"source_fingerprint": "abc", "input_size": 32}, input_size=32)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def test_logits_match_torchscript(self):
+        model = OnnxRuntimeModel(self.path, intra_op_threads=1)
+        batch = torch.randn(3, 3, 32, 32)       # dynamic batch axis
+        with torch.no_grad():
+            expected = self.module(batch)
+        actual = model(batch)
+        self.assertIsInstance(actual, torch.Tensor)
+        self.assertLess(float((actual - expected).abs().max()), 1e-4)
+        self.assertTrue(torch.equal(actual.argmax(1), expected.argmax(1)))
+        self.assertIsInstance(model(batch.numpy()), np.ndarray)
+
+    def test_metadata_is_read_without_onnx(self):
+        with mock.patch.dict("sys.modules", {"onnx": None}):
+            model, meta = load_backend("onnxruntime", self.path)
+        self.assertEqual(meta, {"source_fingerprint": "abc", "input_size": 32, "channels_last": False})
+
+    def test_stale_export_is_refused(self):
+        source = os.path.join(self.tmp.name, "efficientnet_b3.pt")
+        with open(source, "wb") as f:
+            f.write(b"weights")
+        with mock.patch.object(pv, "_fp32_model_path", return_value=source):
+            pv._check_onnx_source(self.path, {"source_fingerprint": file_fingerprint(source)})
+            with self.assertRaisesRegex(ValueError, "exported from another model"):
+                pv._check_onnx_source(self.path, {"source_fingerprint": "abc"})
+            with redirect_stdout(io.StringIO()) as out:
+                pv._check_onnx_source(self.path, {})
+        self.assertIn("records no source fingerprint", out.getvalue())
+        with mock.patch.object(pv, "_fp32_model_path", return_value=source + ".missing"):
+            pv._check_onnx_source(self.path, {"source_fingerprint": "abc"})
+
+
+class FusedPreprocessParityTests(SimpleTestCase):
+    @staticmethod
+    def sample_images():
+        """Reference photos (when present) plus noisy gradients of awkward sizes."""
+        images = [decode_image(path) for path, _ in reference_images(settings.MEDIA_ROOT, limit=8)]
+        rng = np.random.default_rng(0)
+        for w, h in [(640, 480), (333, 517), (1200, 900), (301, 300), (2016, 1512)]:
+            y, x = np.mgrid[0:h, 0:w]
+            gradient = np.stack([x * 255 // w, y * 255 // h, (x + y) * 255 // (w + h)], axis=-1)
+            noisy = gradient + rng.integers(-40, 40, (h, w, 3))
+            images.append(Image.fromarray(noisy.clip(0, 255).astype(np.uint8)))
+        return images
+
+    def test_matches_build_transform(self):
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(
+            torch.nn.Conv2d(3, 16, 5, stride=4), torch.nn.ReLU(), torch.nn.AdaptiveAvgPool2d(1),
+            torch.nn.Flatten(), torch.nn.Linear(16, 50),
+        ).eval()
+        images = self.sample_images()
+        fused = FusedPreprocess()
+        expected = torch.stack([build_transform()(image) for image in images])
+        actual = fused.normalize_into([fused.crop_uint8(image) for image in images], torch.empty_like(expected))
+        # At most one uint8 rounding step, at crop edges only.
+        diff = (actual - expected).abs()
+        self.assertLessEqual(float(diff.max()), 1.0 / (255.0 * min(STD)) + 1e-5)
+        self.assertLess(float(diff.mean()), 1e-4)
+        with torch.no_grad():
+            self.assertTrue(torch.equal(model(actual).argmax(1), model(expected).argmax(1)))
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_followers_share_the_leaders_result(self):
+        flight, calls, gate = SingleFlight(name="test.flight.share"), [], threading.Event()
+
+        def work():
+            calls.append(1)
+            gate.wait(5)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.run("k", work))) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        _wait_until(lambda: flight.stats()["coalesced"] == 2)
+        gate.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, ["result"] * 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_follower_does_not_inherit_the_leaders_deadline(self):
+        flight, started, release = SingleFlight(name="test.flight.retry"), threading.Event(), threading.Event()
+
+        def leader_work():
+            started.set()
+            release.wait(5)
+            raise DeadlineExceeded("leader's budget ran out")
+
+        leader_outcome, follower_outcome = [], []
+
+        def leader():
+            try:
+                flight.run("k", leader_work, retry_on=AdmissionError)
+            except DeadlineExceeded as e:
+                leader_outcome.append(e)
+
+        def follower():
+            follower_outcome.append(flight.run("k", lambda: "own result", retry_on=AdmissionError))
+
+        threads = [threading.Thread(target=leader)]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=follower))
+        threads[1].start()
+        _wait_until(lambda: flight.stats()["coalesced"] == 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(leader_outcome), 1)
+        self.assertEqual(follower_outcome, ["own result"])
+        self.assertEqual(flight.stats()["leaders"], 2)
+
+    def test_other_failures_still_reach_followers(self):
+        flight, started, release = SingleFlight(name="test.flight.error"), threading.Event(), threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise ValueError("broken upload")
+
+        errors = []
+
+        def call():
+            try:
+                flight.run("k", failing, retry_on=AdmissionError)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=call))
+        threads[1].start()
+        _wait_until(lambda: flight.stats()["coalesced"] == 1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(errors), 2)
+
+
+class SidecarProtocolTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "inference.sock")
+        self.received = []
+
+        def predict(images):
+            self.received.append((images.dtype, images.shape))
+            return torch.full((images.shape[0], 5), 0.2).numpy()
+
+        self.server = InferenceServer(self.path, predict, lambda: {"input_size": 8, "classes": 5},
+                                      input_size=8, max_images=4, name=f"test.sidecar.{id(self)}")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.client = SidecarClient(self.path, timeout=5, name=f"test.sidecar.client.{id(self)}")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.dir.cleanup()
+
+    def test_info_round_trip(self):
+        self.assertEqual(self.client.info(), {"input_size": 8, "classes": 5})
+
+    def test_uint8_crops_and_float_batches(self):
+        probs = self.client.predict([torch.zeros(3, 8, 8, dtype=torch.uint8)] * 2)
+        self.assertEqual(tuple(probs.shape), (2, 5))
+        self.client.predict(torch.zeros(3, 3, 8, 8))
+        self.assertEqual([str(dtype) for dtype, _ in self.received], ["uint8", "float32"])
+        self.assertEqual([shape for _, shape in self.received], [(2, 3, 8, 8), (3, 3, 8, 8)])
+
+    def test_server_errors_raise_sidecar_error(self):
+        with self.assertRaises(SidecarError):
+            self.client.predict([torch.zeros(3, 16, 16, dtype=torch.uint8)])   # wrong input size
+        with self.assertRaises(SidecarError):
+            self.client.predict(torch.zeros(5, 3, 8, 8))                       # over max_images
+        self.assertEqual(tuple(self.client.predict(torch.zeros(1, 3, 8, 8)).shape), (1, 5))
+
+    def test_unavailable_server_raises_sidecar_error(self):
+        client = SidecarClient(os.path.join(self.dir.name, "missing.sock"), name=f"test.sidecar.missing.{id(self)}")
+        with self.assertRaises(SidecarError):
+            client.info()
+
+    def test_bad_header_is_rejected_before_the_payload(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        sock.settimeout(5)
+        sock.connect(self.path)
+        # A 4096-pixel square announces a 48 MiB payload; none of it is sent.
+        sock.sendall(sidecar.REQUEST.pack(sidecar.MAGIC, sidecar.OP_PREDICT, sidecar.DTYPE_UINT8, 1, 4096))
+        magic, status, _, nbytes = sidecar.RESPONSE.unpack(sidecar._recv_exact(sock, sidecar.RESPONSE.size))
+        self.assertEqual((magic, status), (sidecar.MAGIC, sidecar.STATUS_ERROR))
+        self.assertIn(b"input size 4096", bytes(sidecar._recv_exact(sock, nbytes)))
+        self.assertEqual(self.received, [])
+
+    def test_client_reads_the_rejection_of_a_large_payload(self):
+        with self.assertRaisesRegex(SidecarError, "input size 512"):
+            self.client.predict(torch.zeros(4, 3, 512, 512, dtype=torch.uint8))
+        self.assertEqual(tuple(self.client.predict(torch.zeros(1, 3, 8, 8)).shape), (1, 5))
+
+
+
+class FastLoadTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import torchvision
+
+        torch.manual_seed(0)
+        cls.source = torchvision.models.efficientnet_b3(weights=None, num_classes=7).eval()
+        # Non-trivial running statistics, so folding them actually matters.
+        for module in cls.source.modules():
+            if isinstance(module, torch.nn.BatchNorm2d):
+                module.running_mean.uniform_(-0.5, 0.5)
+                module.running_var.uniform_(0.5, 2.0)
+        cls.tmp = tempfile.TemporaryDirectory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def artifact(self, **meta):
+        weights, built = build_fast_artifact(self.source)
+        path = os.path.join(self.tmp.name, f"model{len(os.listdir(self.tmp.name))}.fast.pt")
+        save_fast_artifact(weights, {**built, **meta}, path)
+        return path, built
+
+    def test_round_trip_matches_the_source(self):
+        path, meta = self.artifact()
+        self.assertGreater(meta["folded_batchnorms"], 0)
+        model, loaded = load_fast_artifact(path)
+        self.assertEqual(loaded, meta)
+        batch = torch.randn(2, 3, 64, 64)
+        with torch.no_grad():
+            expected, actual = self.source(batch), model(batch)
+        self.assertLess(float((actual - expected).abs().max()), 1e-4)
+        self.assertFalse(any(isinstance(m, torch.nn.BatchNorm2d) for m in model.modules()))
+
+    def test_rejects_other_architectures(self):
+        with self.assertRaises(ValueError):
+            build_fast_artifact(torch.nn.Linear(3, 3))
+
+    def test_served_only_for_its_source_with_passing_parity(self):
+        source = os.path.join(self.tmp.name, "efficientnet_b3.pt")
+        with open(source, "wb") as f:
+            f.write(b"weights")
+        stamp = {"fingerprint": file_fingerprint(source), **source_stamp(source)}
+        passed = {"passed": True}
+        with redirect_stdout(io.StringIO()) as out:
+            for meta, served in [
+                ({"source": stamp, "parity": passed}, True),
+                ({"source": stamp}, False),
+                ({"source": dict(stamp, fingerprint="other", size=1), "parity": passed}, False),
+            ]:
+                path, _ = self.artifact(**meta)
+                with mock.patch("plant_identifier.views.prediction_views.fast_artifact_path", return_value=path):
+                    self.assertEqual(pv._load_fast_start(source) is not None, served, meta)
+        self.assertIn("no passing parity check", out.getvalue())
+        self.assertIn("built from another model", out.getvalue())
+
+
+class ResolutionGovernorTests(SimpleTestCase):
+    def test_parse_tiers_always_starts_at_full(self):
+        self.assertEqual(parse_tiers("224, 260", 300), (300, 260, 224))
+        self.assertEqual(parse_tiers("300,400,260,260", 300), (300, 260))
+        self.assertEqual(parse_tiers("", 300), (300,))
+
+    def _governor(self, **kwargs):
+        options = dict(high_depth=3, low_depth=1, high_p95_ms=800, low_p95_ms=300, dwell_s=0)
+        options.update(kwargs)
+        return ResolutionGovernor((300, 260, 224), name=f"test.resolution.{id(self)}", **options)
+
+    def test_steps_down_one_tier_at_a_time_under_depth(self):
+        governor = self._governor()
+        self.assertEqual([governor.enter() for _ in range(4)], [300, 300, 260, 224])
+        self.assertEqual(governor.stats()["step_down"], 2)
+
+    def test_needs_low_latency_evidence_to_step_back_up(self):
+        governor = self._governor()
+        for _ in range(3):
+            governor.enter()
+        for _ in range(3):
+            governor.exit()                # no latency samples: holds
+        self.assertEqual(governor.current, 260)
+        governor.enter()
+        governor.exit(latency_ms=100)
+        self.assertEqual(governor.current, 300)
+
+    def test_holds_between_the_watermarks(self):
+        governor = self._governor(high_depth=10)
+        governor.enter()
+        governor.exit(latency_ms=900)      # >= high: step down
+        self.assertEqual(governor.current, 260)
+        governor.enter()
+        governor.exit(latency_ms=500)      # between low and high
+        self.assertEqual(governor.current, 260)
+
+    def test_dwell_time_prevents_flapping(self):
+        governor = self._governor(high_depth=10, dwell_s=60)
+        governor.enter()
+        governor.exit(latency_ms=900)
+        governor.enter()
+        governor.exit(latency_ms=900)
+        self.assertEqual(governor.current, 260)
+        self.assertEqual(governor.stats()["step_down"], 1)
+
+
+class StagedPipelineTests(SimpleTestCase):
+    def _pipeline(self, prepare, run_batch=lambda items: [x * 2 for x in items], name="pipeline"):
+        infer = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=0, name=f"test.{name}.infer")
+        return StagedPipeline(prepare, infer, workers=2, queue_size=4, name=f"test.{name}")
+
+    def test_model_inputs_go_through_the_inference_stage(self):
+        pipeline = self._pipeline(lambda x: (None, x), name="pipeline.infer")
+        result, model_input, infer_ms = pipeline.submit((21,)).result(timeout=5)
+        self.assertEqual((result, model_input), (42, 21))
+        self.assertGreaterEqual(infer_ms, 0)
+
+    def test_prepare_can_answer_by_itself(self):
+        pipeline = self._pipeline(lambda x: ("early", None), name="pipeline.early")
+        self.assertEqual(pipeline.submit((1,)).result(timeout=5), ("early", None, None))
+
+    def test_prepare_errors_reach_the_caller(self):
+        def prepare(x):
+            raise ValueError("undecodable")
+
+        pipeline = self._pipeline(prepare, name="pipeline.error")
+        with self.assertRaises(ValueError):
+            pipeline.submit((1,)).result(timeout=5)
+
+    def test_expired_items_are_not_prepared(self):
+        prepared = []
+
+        def prepare(x):
+            prepared.append(x)
+            return None, x
+
+        pipeline = self._pipeline(prepare, name="pipeline.deadline")
+        with self.assertRaises(DeadlineExceeded):
+            pipeline.submit((1,), deadline=time.perf_counter() - 1).result(timeout=5)
+        self.assertEqual(prepared, [])
+        self.assertEqual(pipeline.stats()["infer_pending"], 0)
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    def _controller(self, slo_ms=250, samples=(100,) * 5):
+        controller = AdmissionController(slo_ms, name=f"test.admission.{id(self)}")
+        for ms in samples:
+            controller.observe(ms)
+        return controller
+
+    def test_admits_until_there_is_a_service_estimate(self):
+        controller = self._controller(samples=())
+        for _ in range(10):
+            controller.admit()
+        self.assertEqual(controller.stats()["rejected"], 0)
+
+    def test_rejects_when_the_projected_latency_misses_the_slo(self):
+        controller = self._controller()
+        controller.admit()                 # 100 ms in flight, 200 ms projected: fits 250
+        controller.admit()
+        with self.assertRaises(Overloaded) as ctx:
+            controller.admit()             # 200 ms in flight, 300 ms projected
+        self.assertEqual(ctx.exception.retry_after_s, 1)
+        stats = controller.stats()
+        self.assertEqual((stats["in_flight"], stats["rejected"]), (2, 1))
+
+        controller.release()
+        controller.admit()
+        self.assertEqual(controller.stats()["in_flight"], 2)
+
+    def test_always_admits_when_idle(self):
+        controller = self._controller(slo_ms=10)
+        controller.admit(cost=8)
+        self.assertEqual(controller.stats()["in_flight"], 8)
+
+    def test_cost_counts_images(self):
+        controller = self._controller()
+        controller.admit()
+        with self.assertRaises(Overloaded):
+            controller.admit(cost=2)
+
+    def test_client_budget_lowers_the_limit(self):
+        controller = self._controller(slo_ms=0)
+        controller.admit()
+        controller.admit(deadline=deadline_after(10_000))
+        with self.assertRaises(Overloaded):
+            controller.admit(deadline=deadline_after(150))
+
+    def test_passed_deadline_is_not_admitted(self):
+        controller = self._controller(samples=())
+        with self.assertRaises(DeadlineExceeded):
+            controller.admit(deadline=time.perf_counter() - 1)
+        self.assertEqual(controller.stats()["in_flight"], 0)
+
+
+# =============================================================================
+# /predict/ views (a tiny in-memory model stands in for EfficientNet-B3)
+# =============================================================================
+
+class _TinyModel(torch.nn.Module):
+    """
+    Global average pool + linear head; ``gate`` lets a test hold a forward
+    pass and ``calls`` counts them.
+    """
+
+    def __init__(self, num_classes):
+        super().__init__()
+        self.head = torch.nn.Linear(3, num_classes)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = 0
+
+    def forward(self, x):
+        self.gate.wait(10)
+        self.calls += 1
+        return self.head(x.mean(dim=(2, 3)))
+
+
+class PredictViewTestCase(TestCase):
+    def setUp(self):
+        self.model = _TinyModel(len(pv._class_species_ids)).eval()
+        preprocess = FusedPreprocess()
+        patcher = mock.patch.multiple(
+            pv,
+            _model=self.model,
+            _device=torch.device("cpu"),
+            _preprocess=preprocess,
+            _transform=preprocess,
+            _input_transforms={INPUT_SIZE: preprocess},
+            _input_pools={INPUT_SIZE: InputBufferPool(INPUT_SIZE, capacity=4)},
+            _tta_transform=TTATransform(),
+            _channels_last=False,
+            _model_version="test",
+            _governor=None,
+            _sidecar=None,
+            _batcher=None,
+            _prediction_cache=LRUCache(0),
+            _inflight=SingleFlight(name=f"test.coalesce.{id(self)}"),
+            _admission=AdmissionController(name=f"test.admission.{id(self)}"),
+            PREDICT_BATCHING=False,
+            PREDICT_PIPELINE=False,
+            PREDICT_HISTORY=False,
+            PREDICT_FLAGGING=False,
+            PREDICT_TTA_THRESHOLD=0.0,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data, path="/predict/", client=None, **extra):
+        """POST ``data`` (bytes, or a list of them for /predict/batch/) as 'image'."""
+        uploads = [
+            SimpleUploadedFile(f"leaf{i}.jpg", item, content_type="image/jpeg")
+            for i, item in enumerate(data if isinstance(data, list) else [data])
+        ]
+        return (client or Client()).post(path, {"image": uploads}, **extra)
+
+
+class PredictTopKViewTests(PredictViewTestCase):
+    def test_top_k_candidates_are_ranked(self):
+        response = self.post(_jpeg(), QUERY_STRING="top_k=4")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        confidences = [c["confidence"] for c in body["top_k"]]
+        self.assertEqual(len(confidences), 4)
+        self.assertEqual(confidences, sorted(confidences, reverse=True))
+        self.assertEqual(body["predicted_index"], body["top_k"][0]["predicted_index"])
+
+    def test_invalid_top_k_is_a_client_error(self):
+        self.assertEqual(self.post(_jpeg(), QUERY_STRING="top_k=0").status_code, 400)
+
+    def test_torchvision_path_gives_the_same_answer(self):
+        fused = self.post(_jpeg(), QUERY_STRING="top_k=3").json()
+        transform = build_transform()
+        with mock.patch.multiple(pv, _preprocess=None, _transform=transform, _input_transforms={INPUT_SIZE: transform}):
+            plain = self.post(_jpeg(), QUERY_STRING="top_k=3").json()
+        self.assertEqual(
+            [c["predicted_index"] for c in plain["top_k"]], [c["predicted_index"] for c in fused["top_k"]],
+        )
+
+
+class PredictBatchViewTests(PredictViewTestCase):
+    def _expected_probs(self, data):
+        return pv._probs_for_inputs([pv._load_input(data)])[0]
+
+    def test_one_result_per_image_and_a_consensus_of_their_mean(self):
+        photos = [_jpeg((200, 30, 30)), _jpeg((30, 200, 30)), _jpeg((30, 30, 200))]
+        response = self.post(photos, path="/predict/batch/", QUERY_STRING="top_k=2")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+
+        expected = [self._expected_probs(data) for data in photos]
+        for i, (result, probs) in enumerate(zip(body["results"], expected)):
+            self.assertEqual((result["index"], result["filename"]), (i, f"leaf{i}.jpg"))
+            self.assertEqual(result["predicted_index"], int(probs.argmax()))
+            self.assertAlmostEqual(result["confidence"], float(probs.max()), places=5)
+            self.assertEqual(len(result["top_k"]), 2)
+        mean = torch.stack(expected).mean(dim=0)
+        self.assertEqual(body["consensus"]["num_images"], 3)
+        self.assertEqual(body["consensus"]["predicted_index"], int(mean.argmax()))
+        self.assertAlmostEqual(body["consensus"]["confidence"], float(mean.max()), places=5)
+
+    def test_undecodable_images_are_reported_and_left_out_of_the_consensus(self):
+        good = _jpeg()
+        response = self.post([b"not an image", good], path="/predict/batch/")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertIn("error", body["results"][0])
+        self.assertEqual(body["consensus"]["num_images"], 1)
+        self.assertEqual(body["consensus"]["predicted_index"], body["results"][1]["predicted_index"])
+
+    def test_request_errors(self):
+        self.assertEqual(self.post([b"junk", b"more junk"], path="/predict/batch/").status_code, 400)
+        with mock.patch.object(pv, "PREDICT_MAX_BATCH_IMAGES", 2):
+            self.assertEqual(self.post([_jpeg()] * 3, path="/predict/batch/").status_code, 400)
+        self.assertEqual(Client().post("/predict/batch/").status_code, 400)
+
+    def test_unreachable_sidecar_is_unavailable_not_a_server_error(self):
+        with mock.patch.object(pv, "_lazy_load_stack", side_effect=SidecarError("inference server down")):
+            response = self.post([_jpeg()], path="/predict/batch/")
+        self.assertEqual(response.status_code, 503)
+
+
+class PredictAsyncViewTests(PredictViewTestCase):
+    def test_same_answer_as_the_sync_view(self):
+        data = _jpeg((120, 60, 200))
+        sync = self.post(data, QUERY_STRING="top_k=3")
+        native = self.post(data, path="/predict/async/", QUERY_STRING="top_k=3")
+        self.assertEqual(native.status_code, 200)
+        self.assertEqual(
+            [(c["predicted_index"], round(c["confidence"], 5)) for c in native.json()["top_k"]],
+            [(c["predicted_index"], round(c["confidence"], 5)) for c in sync.json()["top_k"]],
+        )
+
+    def test_request_errors(self):
+        self.assertEqual(Client().post("/predict/async/").status_code, 400)
+        self.assertEqual(self.post(b"not an image", path="/predict/async/").status_code, 415)
+        bad_budget = self.post(_jpeg(), path="/predict/async/", HTTP_X_REQUEST_TIMEOUT_MS="soon")
+        self.assertEqual(bad_budget.status_code, 400)
+
+    def test_shed_requests_get_retry_after(self):
+        with mock.patch.object(pv._admission, "admit", side_effect=Overloaded("Server busy.", retry_after_s=3)):
+            response = self.post(_jpeg(), path="/predict/async/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "3")
+        self.assertEqual(pv._inflight.stats()["in_flight"], 0)
+
+
+class ReadyViewTests(PredictViewTestCase):
+    def setUp(self):
+        super().setUp()
+        readiness = {"state": "not_loaded", "load_ms": None, "warmup_ms": [], "error": None}
+        patcher = mock.patch.object(pv, "_readiness", readiness)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ready(self, eager=False, model=True, **state):
+        pv._readiness.update(state)
+        with mock.patch.multiple(pv, PREDICT_EAGER_LOAD=eager, _model=self.model if model else None):
+            response = Client().get("/ready/")
+        return response.status_code, response.json()
+
+    def test_lazy_workers_are_always_routable_until_a_load_fails(self):
+        status, body = self.ready(model=False)
+        self.assertEqual((status, body["ready"], body["state"], body["model_loaded"]), (200, True, "not_loaded", False))
+        status, body = self.ready()
+        self.assertEqual((status, body["state"]), (200, "ready"))
+        status, body = self.ready(model=False, state="failed", error="no weights")
+        self.assertEqual((status, body["ready"], body["error"]), (503, False, "no weights"))
+
+    def test_eager_workers_are_ready_only_after_warm_up(self):
+        for state in ("not_loaded", "loading", "warming", "failed"):
+            status, body = self.ready(eager=True, model=state == "warming", state=state)
+            self.assertEqual((status, body["ready"], body["state"]), (503, False, state))
+        status, body = self.ready(eager=True, state="ready")
+        self.assertEqual((status, body["ready"]), (200, True))
+
+    def test_preloaded_model_reports_ready(self):
+        status, body = self.ready(eager=True, state="loaded")
+        self.assertEqual((status, body["state"]), (200, "ready"))
+
+    def test_warm_up_runs_the_passes_without_feeding_admission(self):
+        pv._admission = AdmissionController(min_samples=1, name=f"test.admission.warmup.{id(self)}")
+        pv.warm_up(passes=2)
+        self.assertEqual(pv._readiness["state"], "ready")
+        self.assertEqual([(w["resolution"], w["batch_size"]) for w in pv._readiness["warmup_ms"]], [(INPUT_SIZE, 1)] * 2)
+        self.assertIsNone(pv._admission.stats()["service_ms_per_image"])
+
+    def test_failed_load_is_reported(self):
+        with mock.patch.object(pv, "_model", None), \
+                mock.patch.object(pv, "_lazy_load_stack", side_effect=FileNotFoundError("Model not found")):
+            pv.warm_up()
+        self.assertEqual((pv._readiness["state"], pv._readiness["error"]), ("failed", "Model not found"))
+
+
+class PredictCacheViewTests(PredictViewTestCase):
+    def setUp(self):
+        super().setUp()
+        pv._prediction_cache = LRUCache(8, name=f"test.cache.view.{id(self)}")
+
+    def test_repeated_upload_skips_the_model(self):
+        data = _jpeg((10, 90, 10))
+        first = self.post(data).json()
+        calls = self.model.calls
+        self.assertEqual(self.post(data).json(), first)
+        self.assertEqual(self.model.calls, calls)
+        self.post(_jpeg((90, 10, 10)))
+        self.assertEqual(self.model.calls, calls + 1)
+
+    def test_a_new_model_version_misses(self):
+        data = _jpeg((10, 90, 10))
+        self.post(data)
+        with mock.patch.object(pv, "_model_version", "test-retrained"):
+            self.post(data)
+        self.assertEqual(self.model.calls, 2)
+
+    def test_reduced_resolution_results_are_keyed_apart(self):
+        governor = ResolutionGovernor((300, 260), name=f"test.resolution.key.{id(self)}")
+        with mock.patch.object(pv, "_governor", governor):
+            full = pv._cache_key(b"leaf", 300)
+            self.assertEqual(full, pv._cache_key(b"leaf"))
+            self.assertNotEqual(full, pv._cache_key(b"leaf", 260))
+
+
+class UploadGuardViewTests(PredictViewTestCase):
+    def test_oversized_request_is_refused_before_reading(self):
+        with mock.patch.object(pv, "PREDICT_MAX_UPLOAD_BYTES", 1024):
+            response = self.post(b"\xff" * (200 * 1024))
+        self.assertEqual(response.status_code, 413)
+
+    def test_oversized_file_is_aborted_mid_stream(self):
+        with mock.patch.object(pv, "PREDICT_MAX_UPLOAD_BYTES", 1024):
+            response = self.post(b"\xff" * (16 * 1024))
+        self.assertEqual(response.status_code, 413)
+        self.assertIn("1024", response.json()["error"])
+
+    def test_pixel_budget_and_format_are_enforced(self):
+        with mock.patch.object(pv, "PREDICT_MAX_PIXELS", 100):
+            self.assertEqual(self.post(_jpeg(size=(20, 10))).status_code, 413)
+        self.assertEqual(self.post(b"GIF89a" + b"\0" * 64).status_code, 415)
+
+    def test_small_uploads_stay_in_memory(self):
+        seen = []
+        read_upload = pv._read_upload
+
+        def spy(upload):
+            seen.append(type(upload).__name__)
+            return read_upload(upload)
+
+        with mock.patch.object(pv, "_read_upload", spy), mock.patch.object(pv, "PREDICT_IN_MEMORY_MAX_BYTES", 1024):
+            self.assertEqual(self.post(_jpeg()).status_code, 200)
+            self.assertEqual(self.post(_jpeg(size=(400, 300)) + b"\0" * 4096).status_code, 200)
+        self.assertEqual(seen, ["InMemoryUploadedFile", "TemporaryUploadedFile"])
+
+
+class PredictTTAViewTests(PredictViewTestCase):
+    def _view_probs(self, data):
+        batch = pv._tta_transform(decode_image(io.BytesIO(data), draft=False))
+        with torch.no_grad():
+            return torch.softmax(self.model(batch), dim=1)
+
+    def test_tta_probs_are_the_mean_over_all_views(self):
+        data = _jpeg((200, 120, 40), size=(420, 360))
+        views = self._view_probs(data)
+        self.assertTrue(torch.allclose(pv._tta_probs(data), views.mean(dim=0), atol=1e-6))
+        # A base prediction already paid for replaces the base view.
+        base = torch.zeros_like(views[0])
+        self.assertTrue(torch.allclose(pv._tta_probs(data, base), views[1:].sum(dim=0) / 8, atol=1e-6))
+
+    def test_forced_automatic_and_disabled(self):
+        data = _jpeg((200, 120, 40))
+        forced = self.post(data, QUERY_STRING="tta=1").json()
+        self.assertEqual((forced["tta"]["trigger"], forced["tta"]["views"]), ("explicit", 8))
+        self.assertIsNone(forced["tta"]["base_confidence"])
+        self.assertAlmostEqual(forced["confidence"], float(self._view_probs(data).mean(dim=0).max()), places=5)
+
+        with mock.patch.object(pv, "PREDICT_TTA_THRESHOLD", 1.0):
+            automatic = self.post(data).json()
+            self.assertEqual(automatic["tta"]["trigger"], "low_confidence")
+            self.assertNotIn("tta", self.post(data, QUERY_STRING="tta=0").json())
+        self.assertNotIn("tta", self.post(data).json())
+
+
+class SimilarViewTests(PredictViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.weights = os.path.join(self.dir.name, "efficientnet_b3.pt")
+        with open(self.weights, "wb") as f:
+            f.write(b"weights")
+        self.model = _EmbeddingModel().eval()
+        self.photos = [_jpeg((220, 40, 40)), _jpeg((40, 220, 40)), _jpeg((40, 40, 220))]
+        embed = Embedder(self.model)
+        matrix = torch.cat([embed(pv._transform(decode_image(io.BytesIO(p))).unsqueeze(0)) for p in self.photos])
+        species = [int(pv._class_species_ids[i]) for i in (0, 1, 2)]
+        self.entries = [{"path": f"images/{sid}/{i}.jpg", "species_id": sid} for i, sid in enumerate(species)]
+        self.fingerprint = file_fingerprint(self.weights)
+        save_index(self.dir.name, matrix.numpy(), self.entries, {"model_fingerprint": self.fingerprint})
+
+        patcher = mock.patch.multiple(
+            pv, _model=self.model, _embedder=None, _embedding_index=None,
+            PREDICT_EMBEDDINGS_DIR=self.dir.name, _fp32_model_path=lambda: self.weights,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_nearest_reference_photos(self):
+        response = self.post(self.photos[1], path="/similar/", QUERY_STRING="k=2")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["index_size"], 3)
+        self.assertEqual(len(body["results"]), 2)
+        self.assertEqual(body["results"][0]["image"], f"/media/{self.entries[1]['path']}")
+        self.assertAlmostEqual(body["results"][0]["similarity"], 1.0, places=2)
+
+    def test_index_from_another_model_is_flagged(self):
+        save_index(self.dir.name, np.eye(3, 4, dtype=np.float32), self.entries, {"model_fingerprint": "retrained"})
+        out = io.StringIO()
+        with redirect_stdout(out):
+            pv._load_similar_stack()
+        self.assertIn(f"built with model retrained, serving {self.fingerprint}", out.getvalue())
+
+    def test_workers_without_a_torchscript_model_do_not_load_one(self):
+        for mode in ({"PREDICT_SIDECAR_SOCKET": "/tmp/inference.sock"}, {"PREDICT_BACKEND": "onnxruntime"}):
+            with mock.patch.multiple(pv, **mode), mock.patch.object(pv, "_lazy_load_stack") as load:
+                response = self.post(self.photos[0], path="/similar/")
+            self.assertEqual(response.status_code, 503)
+            load.assert_not_called()
+
+
+class PredictCascadeViewTests(PredictViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stage1 = _TinyModel(len(pv._class_species_ids)).eval()
+        with torch.no_grad():
+            self.stage1.head.bias[7] = 10.0         # ~95% sure it is class 7
+        self.tta_bases = []
+        tta_probs = pv._tta_probs
+
+        def spy(data, base_probs=None):
+            self.tta_bases.append(base_probs)
+            return tta_probs(data, base_probs)
+
+        patcher = mock.patch.multiple(pv, _tta_probs=spy, PREDICT_TTA_THRESHOLD=1.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cascade(self, min_confidence):
+        return mock.patch.multiple(
+            pv,
+            _cascade_model=self.stage1,
+            _cascade_transform=build_transform(pv.PREDICT_CASCADE_INPUT_SIZE),
+            _cascade_gate=CascadeGate(min_confidence, 0.0, name=f"test.cascade.view.{id(self)}.{min_confidence}"),
+        )
+
+    def test_confident_stage1_answers_alone(self):
+        with self.cascade(0.5):
+            body = self.post(_jpeg(), QUERY_STRING="tta=0").json()
+        self.assertEqual((body["predicted_index"], body["resolution"]), (7, pv.PREDICT_CASCADE_INPUT_SIZE))
+        self.assertEqual(self.model.calls, 0)
+
+    def test_uncertain_stage1_escalates(self):
+        with self.cascade(1.01):
+            body = self.post(_jpeg(), QUERY_STRING="tta=0").json()
+        self.assertEqual(body["resolution"], INPUT_SIZE)
+        self.assertEqual(self.model.calls, 1)
+
+    def test_tta_reuses_only_a_main_model_base_view(self):
+        self.post(_jpeg())
+        self.assertIsNotNone(self.tta_bases.pop())
+        with self.cascade(0.5):
+            body = self.post(_jpeg((1, 2, 3))).json()
+        # Stage 1 answered: its probabilities are not the main model's base view.
+        self.assertIsNone(self.tta_bases.pop())
+        self.assertEqual(body["tta"]["trigger"], "low_confidence")
+
+    def test_tta_does_not_reuse_a_reduced_resolution_base(self):
+        governor = ResolutionGovernor((INPUT_SIZE, 260), high_depth=1, name=f"test.resolution.tta.{id(self)}")
+        with mock.patch.multiple(
+            pv,
+            _governor=governor,
+            _input_transforms={**pv._input_transforms, 260: FusedPreprocess(260)},
+            _input_pools={**pv._input_pools, 260: InputBufferPool(260, capacity=4)},
+        ):
+            body = self.post(_jpeg()).json()
+        self.assertEqual((body["resolution"], body["tta"]["resolution"]), (260, INPUT_SIZE))
+        self.assertIsNone(self.tta_bases.pop())
+
+
+class ResolutionViewTests(PredictViewTestCase):
+    def setUp(self):
+        super().setUp()
+        self.governor = ResolutionGovernor((INPUT_SIZE,), high_depth=100, name=f"test.resolution.view.{id(self)}")
+        patcher = mock.patch.object(pv, "_governor", self.governor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertNoLatencySamples(self):
+        stats = self.governor.stats()
+        self.assertEqual((stats["in_flight"], stats["recent_p95_ms"]), (0, None))
+
+    def test_failures_do_not_feed_the_p95(self):
+        with mock.patch.object(pv, "_stage_upload", side_effect=RuntimeError("model crashed")):
+            self.assertEqual(self.post(_jpeg()).status_code, 400)
+            self.assertEqual(self.post(_jpeg(), path="/predict/async/").status_code, 400)
+        with mock.patch.object(pv, "_probs_for_inputs", side_effect=RuntimeError("model crashed")):
+            self.assertEqual(self.post([_jpeg()], path="/predict/batch/").status_code, 400)
+        self.assertNoLatencySamples()
+
+    def test_shed_requests_do_not_feed_the_p95(self):
+        with mock.patch.object(pv._admission, "admit", side_effect=Overloaded("Server busy.")):
+            self.assertEqual(self.post(_jpeg()).status_code, 503)
+            self.assertEqual(self.post(_jpeg(), path="/predict/async/").status_code, 503)
+            self.assertEqual(self.post([_jpeg()], path="/predict/batch/").status_code, 503)
+        self.assertNoLatencySamples()
+
+    def test_successes_do(self):
+        self.assertEqual(self.post(_jpeg()).status_code, 200)
+        self.assertIsNotNone(self.governor.stats()["recent_p95_ms"])
+
+
+class PredictAdmissionViewTests(PredictViewTestCase):
+    def test_lazy_worker_sheds_load_once_it_has_service_times(self):
+        pv._admission = AdmissionController(slo_ms=0.001, min_samples=3, name=f"test.admission.slo.{id(self)}")
+        for i in range(3):
+            self.assertEqual(self.post(_jpeg((i, 100, 50))).status_code, 200)
+        # Never warmed up: the state a lazily loading worker stays in.
+        self.assertNotEqual(pv._readiness["state"], "ready")
+        self.assertIsNotNone(pv._admission.stats()["service_ms_per_image"])
+
+        self.model.gate.clear()
+        held = []
+        thread = threading.Thread(target=lambda: held.append(self.post(_jpeg((200, 0, 0)))))
+        thread.start()
+        _wait_until(lambda: pv._admission.stats()["in_flight"] == 1)
+
+        shed = self.post(_jpeg((0, 0, 200)))
+        tta = self.post(_jpeg((0, 0, 200)), QUERY_STRING="tta=1")
+        self.model.gate.set()
+        thread.join(10)
+
+        self.assertEqual(held[0].status_code, 200)
+        for response in (shed, tta):
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "1")
+        self.assertEqual(pv._admission.stats()["rejected"], 2)
+
+    def test_coalesced_follower_does_not_inherit_the_leaders_deadline(self):
+        data = _jpeg((10, 200, 10))
+        leader_entered, release = threading.Event(), threading.Event()
+        stage_upload = pv._stage_upload
+
+        def slow_stage_upload(*args):
+            if not leader_entered.is_set():
+                leader_entered.set()
+                release.wait(10)
+                time.sleep(0.06)          # past the leader's 50 ms budget
+            return stage_upload(*args)
+
+        with mock.patch.object(pv, "_stage_upload", slow_stage_upload), mock.patch.object(pv, "PREDICT_COALESCE", True):
+            responses = {}
+            leader = threading.Thread(
+                target=lambda: responses.update(leader=self.post(data, HTTP_X_REQUEST_TIMEOUT_MS="50")),
+            )
+            leader.start()
+            leader_entered.wait(10)
+            follower = threading.Thread(target=lambda: responses.update(follower=self.post(data)))
+            follower.start()
+            _wait_until(lambda: pv._inflight.stats()["coalesced"] == 1)
+            release.set()
+            leader.join(10)
+            follower.join(10)
+
+        self.assertEqual(responses["leader"].status_code, 503)
+        self.assertEqual(responses["follower"].status_code, 200)
+        # Only leaders are admitted: the follower was counted once it led.
+        self.assertEqual(pv._admission.stats()["admitted"], 2)
+
+
+
+
+# =============================================================================
+# Write-behind history
+# =============================================================================
+
+class WritePredictionsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ada", password="pw")
+
+    def record(self, species_id, confidence, user_id=None, **extra):
+        return {
+            "user_id": self.user.id if user_id is None else user_id,
+            "species_id": species_id,
+            "common_name": f"common {species_id}",
+            "scientific_name": f"Species {species_id}",
+            "confidence": confidence,
+            "image": None,
+            "media_base_url": "http://testserver/media/",
+            **extra,
+        }
+
+    def test_one_history_row_per_species_latest_wins(self):
+        write_predictions([self.record(1, 0.2), self.record(2, 0.5), self.record(1, 0.4)])
+        write_predictions([self.record(2, 0.9)])
+        rows = dict(PlantHistory.objects.filter(user=self.user).values_list("species_id", "confidence"))
+        self.assertEqual(rows, {1: 0.4, 2: 0.9})
+        self.assertIsNone(PlantHistory.objects.get(user=self.user, species_id=1).image_url)
+        # Every prediction is still its own identification.
+        self.assertEqual(PlantIdentification.objects.filter(user=self.user).count(), 4)
+
+    def test_unknown_users_are_dropped(self):
+        write_predictions([self.record(1, 0.5, user_id=self.user.id + 1000), self.record(3, 0.5)])
+        self.assertEqual(list(PlantHistory.objects.values_list("user_id", "species_id")), [(self.user.id, 3)])
+        self.assertEqual(PlantIdentification.objects.count(), 1)
+
+    def test_stored_upload_is_linked(self):
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            write_predictions([self.record(1, 0.5, image=_jpeg())])
+            name = PlantIdentification.objects.get().image.name
+            self.assertTrue(os.path.isfile(os.path.join(media, name)))
+        self.assertEqual(PlantHistory.objects.get().image_url, "http://testserver/media/" + name)
+
+
+class HistoryUserTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ada", password="pw")
+        self.factory = RequestFactory()
+        patcher = mock.patch.object(pv, "PREDICT_HISTORY", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, data=None, user=None, csrf_checked=True, **extra):
+        request = self.factory.post("/predict/", data or {}, **extra)
+        request.user = user or AnonymousUser()
+        request._dont_enforce_csrf_checks = not csrf_checked
+        return request
+
+    def bearer(self, user=None):
+        return {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user or self.user)}"}
+
+    def test_anonymous_user_id_is_not_trusted(self):
+        self.assertIsNone(pv._history_user_id(self.request({"user_id": self.user.id})))
+
+    def test_jwt_bearer(self):
+        self.assertEqual(pv._history_user_id(self.request(**self.bearer())), self.user.id)
+        self.assertEqual(pv._history_user_id(self.request({"user_id": self.user.id}, **self.bearer())), self.user.id)
+
+    def test_invalid_token_logs_nothing(self):
+        self.assertIsNone(pv._history_user_id(self.request(HTTP_AUTHORIZATION="Bearer not-a-token")))
+
+    def test_user_id_must_match_the_authenticated_user(self):
+        other = User.objects.create_user("grace", password="pw")
+        with self.assertRaises(pv._RequestError) as raised:
+            pv._history_user_id(self.request({"user_id": other.id}, **self.bearer()))
+        self.assertEqual(raised.exception.status, 403)
+        with self.assertRaises(pv._RequestError) as raised:
+            pv._history_user_id(self.request({"user_id": "ada"}, **self.bearer()))
+        self.assertEqual(raised.exception.status, 400)
+
+    def test_session_user_needs_csrf(self):
+        self.assertIsNone(pv._history_user_id(self.request(user=self.user, csrf_checked=True)))
+        self.assertEqual(pv._history_user_id(self.request(user=self.user, csrf_checked=False)), self.user.id)
+
+    def test_history_off(self):
+        with mock.patch.object(pv, "PREDICT_HISTORY", False):
+            self.assertIsNone(pv._history_user_id(self.request(**self.bearer())))
+
+    def test_upload_bytes_are_queued_only_when_stored(self):
+        queue = mock.Mock()
+        payload = {"species_id": 1, "common_name": "c", "scientific_name": "s", "confidence": 0.5}
+        with mock.patch.object(pv, "history_queue", return_value=queue):
+            pv._queue_history(self.request(), self.user.id, b"bytes", payload)
+            with mock.patch.object(pv, "PREDICT_HISTORY_STORE_IMAGES", True):
+                pv._queue_history(self.request(), self.user.id, b"bytes", payload)
+        self.assertEqual([call.args[0]["image"] for call in queue.submit.call_args_list], [None, b"bytes"])
+
+
+# =============================================================================
+# Review flags
+# =============================================================================
+
+class HourlyCapTests(SimpleTestCase):
+    def test_limit_resets_each_clock_hour(self):
+        cap = HourlyCap(2)
+        with mock.patch("plant_identifier.flagging.time.time", return_value=3600 * 10 + 5):
+            self.assertEqual([cap.allow() for _ in range(3)], [True, True, False])
+        with mock.patch("plant_identifier.flagging.time.time", return_value=3600 * 11):
+            self.assertTrue(cap.allow())
+
+    def test_flag_reason(self):
+        self.assertEqual(flag_reason(0.2, 0.15, 0.3, 0.1), "low_confidence")
+        self.assertEqual(flag_reason(0.5, 0.05, 0.3, 0.1), "multiple_matches")
+        self.assertIsNone(flag_reason(0.5, 0.1, 0.3, 0.1))
+
+
+class FlagWriterTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def record(self, color):
+        return {
+            "plant_name": "Species 1",
+            "reason": "low_confidence",
+            "confidence": 0.1,
+            "image": _jpeg(color),
+            "media_base_url": "http://testserver/media/",
+        }
+
+    def test_cap_counts_only_automatic_flags(self):
+        FlaggedCase.objects.create(
+            plant_name="p", image_url="http://x/1.jpg", reason="user_report", confidence=0.5,
+            submitted_by="automatix",
+        )
+        FlaggedCase.objects.create(
+            plant_name="p", image_url="http://x/2.jpg", reason="low_confidence", confidence=0.5,
+            submitted_by=AUTO_SUBMITTER,
+        )
+        make_flag_writer(3)([self.record((i, 0, 0)) for i in range(4)])
+        self.assertEqual(FlaggedCase.objects.filter(submitted_by=AUTO_SUBMITTER).count(), 3)
+
+    def test_an_upload_is_flagged_once(self):
+        writer = make_flag_writer(10)
+        writer([self.record((1, 2, 3)), self.record((1, 2, 3))])
+        writer([self.record((1, 2, 3)), self.record((4, 5, 6))])
+        self.assertEqual(FlaggedCase.objects.count(), 2)
+
+    def test_flags_opt_in(self):
+        request = RequestFactory().post("/predict/")
+        probs = torch.full((10,), 0.1)
+        with mock.patch.object(pv, "flag_queue") as flag_queue:
+            pv._queue_flag(request, b"bytes", probs, {"scientific_name": "s"})
+            flag_queue.assert_not_called()
+            with mock.patch.object(pv, "PREDICT_FLAGGING", True):
+                flag_queue.return_value = (mock.Mock(), HourlyCap(5))
+                pv._queue_flag(request, b"bytes", probs, {"scientific_name": "s"})
+            self.assertEqual(flag_queue.return_value[0].submit.call_args.args[0]["reason"], "low_confidence")
@@ -0,0 +1,96 @@
+# plant_identifier/uploads.py
+#
+# Upload guard for the prediction endpoints: caps request/file size while
+# streaming, and keeps small uploads in memory instead of spilling them to
+# temp files.
+
+from io import BytesIO
+
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import (
+    FileUploadHandler,
+    StopFutureHandlers,
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+
+
+class GuardedUploadHandler(FileUploadHandler):
+    """
+    Rejects bodies whose Content-Length exceeds ``max_request_bytes`` before
+    reading them, and aborts mid-stream as soon as one file passes
+    ``max_file_bytes`` (chunked or lying clients). Requests up to
+    ``in_memory_max_bytes`` are buffered in memory; larger ones fall through
+    to the next handler (temp file).
+
+    The reason for a rejection is left on ``request.upload_rejected`` so the
+    view can answer 413 instead of "no image".
+    """
+
+    def __init__(self, request, max_file_bytes, max_request_bytes, in_memory_max_bytes):
+        super().__init__(request)
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.in_memory_max_bytes = in_memory_max_bytes
+        self.activated = False
+        self.received = 0
+
+    def _reject(self, message):
+        self.request.upload_rejected = message
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length > self.max_request_bytes:
+            self._reject(f"Upload exceeds {self.max_request_bytes} bytes.")
+            # Returning a result short-circuits parsing: the body is never read.
+            return QueryDict(encoding=encoding), MultiValueDict()
+        self.activated = content_length <= self.in_memory_max_bytes
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        if self.activated:
+            self.file = BytesIO()
+            raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_file_bytes:
+            self._reject(f"Image exceeds {self.max_file_bytes} bytes.")
+            raise StopUpload(connection_reset=True)
+        if self.activated:
+            self.file.write(raw_data)
+            return None
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.activated:
+            return None
+        self.file.seek(0)
+        return InMemoryUploadedFile(
+            file=self.file,
+            field_name=self.field_name,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+
+
+def install_upload_guard(request, max_file_bytes, max_files=1, in_memory_max_bytes=None):
+    """
+    Replace the request's upload handlers. Must run before request.POST /
+    request.FILES are touched (the views are csrf_exempt, so nothing reads
+    the body earlier).
+    """
+    # Multipart framing and small form fields on top of the file bytes.
+    max_request_bytes = max_file_bytes * max_files + 64 * 1024
+    if in_memory_max_bytes is None:
+        in_memory_max_bytes = max_request_bytes
+    request.upload_rejected = None
+    request.upload_handlers = [
+        GuardedUploadHandler(request, max_file_bytes, max_request_bytes, in_memory_max_bytes),
+        TemporaryFileUploadHandler(request),
+    ]
@@ -1,20 +1,50 @@
 # plant_identifier/views/prediction_views.py
 
+import io
 import os
 import json
+import asyncio
 import re
 import random
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from requests.exceptions import ReadTimeout, ConnectionError as ReqConnError
 
 import torch
-from torchvision import transforms
 from PIL import Image
 
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 
+from ..inference import metrics
+from ..inference.admission import (
+    AdmissionController, AdmissionError, DeadlineExceeded, check_deadline, deadline_after,
+)
+from ..inference.backends import BACKENDS, load_backend, onnx_path
+from ..inference.batching import MicroBatcher
+from ..inference.memory import prepare_for_fork, process_memory
+from ..inference.cache import LRUCache, SingleFlight, content_key
+from ..inference.cascade import CascadeGate, confidence_and_margin
+from ..inference.embeddings import Embedder, EmbeddingIndex
+from ..inference.fastload import fast_artifact_path, load_fast_artifact, source_stamp
+from ..inference.optimize import artifact_path, file_fingerprint, load_model
+from ..inference.pipeline import StagedPipeline
+from ..inference.resolution import ResolutionGovernor, parse_tiers
+from ..inference.sidecar import SidecarClient, SidecarError
+from ..inference.species import build_class_tables
+from ..inference.threads import configure_from_env, is_configured, thread_report
+from ..inference.preprocess import (
+    INPUT_SIZE, FusedPreprocess, ImageRejected, InputBufferPool, TTATransform,
+    build_transform, decode_image, sniff_image,
+)
+from ..flagging import flag_queue, flag_reason
+from ..history import history_queue
+from ..uploads import install_upload_guard
+
 
 # =============================================================================
 # Public JSON mappings (loaded at import time so random_views.py can import them)
@@ -49,6 +79,10 @@ _scn = _safe_load_json(
 )
 species_id_to_scn_name = {str(k).strip(): v for k, v in _scn.items()}
 
+_class_species_ids, _class_cmn_names, _class_scn_names = build_class_tables(
+    class_idx_to_species_id, species_id_to_cmn_name, species_id_to_scn_name
+)
+
 
 # =============================================================================
 # Tiny CORS shim for dev
@@ -61,7 +95,8 @@ def _corsify(request, response):
         response["Access-Control-Allow-Origin"] = origin
         response["Vary"] = "Origin"
         response["Access-Control-Allow-Credentials"] = "true"
-        response["Access-Control-Allow-Headers"] = "content-type, x-csrftoken, authorization"
+        response["Access-Control-Allow-Headers"] = "content-type, x-csrftoken, authorization, x-request-timeout-ms"
+        response["Access-Control-Expose-Headers"] = "Retry-After"
         response["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
     return response
 
@@ -213,87 +248,1377 @@ Rules:
 # CNN Predict endpoint (/predict/) – lazy-loaded model & transforms
 # =============================================================================
 
+def _env_flag(name: str, default: str = "0") -> bool:
+    return (os.getenv(name, default) or "").strip().lower() in ("1", "true", "yes")
+
+# Micro-batching: gather concurrent /predict/ calls into one forward pass.
+# Only pays off when a worker serves requests concurrently (gthread / ASGI).
+PREDICT_BATCHING       = _env_flag("PREDICT_BATCHING")
+PREDICT_MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "8"))
+PREDICT_MAX_WAIT_MS    = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+
+# Staged pipeline for /predict/ (threaded workers): decode + transform run on
+# PREDICT_PIPELINE_WORKERS threads and hand model inputs to a dedicated
+# inference thread (the micro-batcher when PREDICT_BATCHING is on), so
+# preprocessing of one request overlaps the forward pass of another.
+# PREDICT_PIPELINE_QUEUE bounds the work waiting in front of each stage.
+PREDICT_PIPELINE         = _env_flag("PREDICT_PIPELINE")
+PREDICT_PIPELINE_WORKERS = int(os.getenv("PREDICT_PIPELINE_WORKERS", "2"))
+PREDICT_PIPELINE_QUEUE   = int(os.getenv("PREDICT_PIPELINE_QUEUE", "16"))
+
+# Which artifact to serve: fp32 (efficientnet_b3.pt) or one of the CPU
+# variants produced by `manage.py optimize_model` (optimized, int8-dynamic,
+# int8-static).
+PREDICT_MODEL_VARIANT  = os.getenv("PREDICT_MODEL_VARIANT", "fp32").strip().lower()
+
+# Inference backend: torchscript, or onnxruntime to serve efficientnet_b3.onnx
+# (`manage.py export_onnx`) on ONNX Runtime's CPU provider.
+PREDICT_BACKEND        = os.getenv("PREDICT_BACKEND", "torchscript").strip().lower()
+
+# Fast cold start (opt-in): with models/efficientnet_b3.fast.pt present
+# (`manage.py build_fast_start`), built from the current efficientnet_b3.pt
+# and recorded as passing its parity check, fp32 TorchScript serving
+# memory-maps its BN-folded weights into the eager model instead of running
+# torch.jit.load and the JIT's profiling passes.
+PREDICT_FAST_START      = _env_flag("PREDICT_FAST_START")
+
+# Out-of-process inference: with a socket path set, this worker loads no
+# model and /predict/ sends uint8 crops to `manage.py run_inference_server`
+# listening there (cascade stage 1 is not used in this mode).
+PREDICT_SIDECAR_SOCKET  = os.getenv("PREDICT_SIDECAR_SOCKET", "").strip()
+PREDICT_SIDECAR_TIMEOUT = float(os.getenv("PREDICT_SIDECAR_TIMEOUT", "30"))
+
+# Two-stage cascade: a cheaper TorchScript model over the same 1081 classes
+# (path absolute or relative to models/) answers first; /predict/ escalates
+# to the main model only when its top-1 confidence or top-1/top-2 margin is
+# below the thresholds. Empty disables the cascade.
+PREDICT_CASCADE_MODEL          = os.getenv("PREDICT_CASCADE_MODEL", "").strip()
+PREDICT_CASCADE_INPUT_SIZE     = int(os.getenv("PREDICT_CASCADE_INPUT_SIZE", "224"))
+PREDICT_CASCADE_MIN_CONFIDENCE = float(os.getenv("PREDICT_CASCADE_MIN_CONFIDENCE", "0.8"))
+PREDICT_CASCADE_MIN_MARGIN     = float(os.getenv("PREDICT_CASCADE_MIN_MARGIN", "0.2"))
+
+# LRU cache of probabilities keyed by SHA-256 of the upload + model version,
+# so retried/shared photos skip decode and inference. 0 disables it.
+PREDICT_CACHE_SIZE     = int(os.getenv("PREDICT_CACHE_SIZE", "512"))
+
+# Single-flight: a /predict/ upload identical to one still being computed
+# (double tap, client retry) waits for that result instead of running the
+# model a second time.
+PREDICT_COALESCE       = _env_flag("PREDICT_COALESCE", "1")
+
+# Admission control: with PREDICT_SLO_MS > 0 a /predict/ request whose
+# projected latency (images in flight x observed per-image service time /
+# PREDICT_ADMISSION_CONCURRENCY) exceeds it is rejected up front with 503 and
+# Retry-After instead of queueing. Clients may also send their own budget in
+# an X-Request-Timeout-Ms header; work still waiting when it runs out is
+# dropped, with or without an SLO.
+PREDICT_SLO_MS                = float(os.getenv("PREDICT_SLO_MS", "0"))
+PREDICT_ADMISSION_CONCURRENCY = int(os.getenv("PREDICT_ADMISSION_CONCURRENCY", "1"))
+
+# Decode JPEGs with libjpeg DCT scaling to just above the input size (off
+# by default): much cheaper for phone photos, but the DCT downscale changes
+# the resampling ahead of Resize(300), so model inputs are not bit-identical
+# to a full decode. Check top-1 agreement with benchmarks/bench_decode.py.
+PREDICT_JPEG_DRAFT     = _env_flag("PREDICT_JPEG_DRAFT")
+
+# Fused preprocessing (opt-in): resize+crop straight to a uint8 crop, then
+# normalize whole batches into pooled, preallocated input buffers. Inputs
+# differ from the torchvision Compose by at most one uint8 rounding step at
+# crop edges; check top-1 agreement with benchmarks/bench_preprocess.py
+# --forward. Off, each image goes through build_transform.
+PREDICT_FUSED_PREPROCESS = _env_flag("PREDICT_FUSED_PREPROCESS")
+
+# Load-aware resolution (off by default): under load the main model runs on
+# smaller center crops, one PREDICT_RESOLUTION_TIERS step at a time, when
+# PREDICT_RESOLUTION_HIGH_DEPTH requests are in flight in the worker or the
+# recent inference p95 reaches PREDICT_RESOLUTION_HIGH_P95_MS. It steps back
+# up once both are under their LOW marks, at most once per DWELL_S.
+PREDICT_ADAPTIVE_RESOLUTION    = _env_flag("PREDICT_ADAPTIVE_RESOLUTION")
+PREDICT_RESOLUTION_TIERS       = os.getenv("PREDICT_RESOLUTION_TIERS", "300,260,224")
+PREDICT_RESOLUTION_HIGH_DEPTH  = int(os.getenv("PREDICT_RESOLUTION_HIGH_DEPTH", "4"))
+PREDICT_RESOLUTION_LOW_DEPTH   = int(os.getenv("PREDICT_RESOLUTION_LOW_DEPTH", "1"))
+PREDICT_RESOLUTION_HIGH_P95_MS = float(os.getenv("PREDICT_RESOLUTION_HIGH_P95_MS", "800"))
+PREDICT_RESOLUTION_LOW_P95_MS  = float(os.getenv("PREDICT_RESOLUTION_LOW_P95_MS", "300"))
+PREDICT_RESOLUTION_DWELL_S     = float(os.getenv("PREDICT_RESOLUTION_DWELL_S", "5"))
+
+# Upload guard: byte cap per image (enforced while streaming), header-sniffed
+# pixel budget, and the request size below which uploads stay in memory
+# instead of spilling to a temp file.
+PREDICT_MAX_UPLOAD_BYTES    = int(os.getenv("PREDICT_MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+PREDICT_MAX_PIXELS          = int(os.getenv("PREDICT_MAX_PIXELS", "64000000"))
+PREDICT_IN_MEMORY_MAX_BYTES = int(os.getenv("PREDICT_IN_MEMORY_MAX_BYTES", str(10 * 1024 * 1024)))
+
+# Test-time augmentation: ?tta=1 forces it, ?tta=0 disables it, and with a
+# threshold > 0 predictions whose top-1 confidence falls below it are
+# re-scored over PREDICT_TTA_VIEWS crops/flips in one batched forward pass.
+PREDICT_TTA_THRESHOLD  = float(os.getenv("PREDICT_TTA_THRESHOLD", "0"))
+PREDICT_TTA_VIEWS      = int(os.getenv("PREDICT_TTA_VIEWS", "8"))
+PREDICT_TTA_ZOOM       = float(os.getenv("PREDICT_TTA_ZOOM", "1.15"))
+
+# "Similar plants" index written by `manage.py build_embeddings`.
+PREDICT_EMBEDDINGS_DIR = os.getenv("PREDICT_EMBEDDINGS_DIR", os.path.join(BASE_DIR, "models", "embeddings"))
+PREDICT_SIMILAR_MAX_K  = int(os.getenv("PREDICT_SIMILAR_MAX_K", "20"))
+
+# Write-behind history: /predict/ calls made by an authenticated user (JWT
+# bearer or session) or carrying user_id are recorded in PlantHistory and
+# PlantIdentification by a background writer that batches the inserts.
+# Storing the uploads is opt-in: the queue then holds each record's image
+# bytes (up to PREDICT_HISTORY_QUEUE_SIZE x the upload limit in memory).
+PREDICT_HISTORY              = _env_flag("PREDICT_HISTORY", "1")
+PREDICT_HISTORY_QUEUE_SIZE   = int(os.getenv("PREDICT_HISTORY_QUEUE_SIZE", "256"))
+PREDICT_HISTORY_BATCH_SIZE   = int(os.getenv("PREDICT_HISTORY_BATCH_SIZE", "100"))
+PREDICT_HISTORY_FLUSH_MS     = float(os.getenv("PREDICT_HISTORY_FLUSH_MS", "250"))
+PREDICT_HISTORY_STORE_IMAGES = _env_flag("PREDICT_HISTORY_STORE_IMAGES")
+
+# Review flags: uncertain predictions are queued as FlaggedCase rows
+# (low_confidence below the confidence threshold, else multiple_matches
+# when the top-1/top-2 margin is small), at most PREDICT_FLAG_MAX_PER_HOUR
+# automatic flags per hour across all workers. Opt-in: PREDICT_FLAGGING=1.
+PREDICT_FLAGGING          = _env_flag("PREDICT_FLAGGING")
+PREDICT_FLAG_CONFIDENCE   = float(os.getenv("PREDICT_FLAG_CONFIDENCE", "0.3"))
+PREDICT_FLAG_MARGIN       = float(os.getenv("PREDICT_FLAG_MARGIN", "0.1"))
+PREDICT_FLAG_MAX_PER_HOUR = int(os.getenv("PREDICT_FLAG_MAX_PER_HOUR", "60"))
+
+# Upper bound for ?top_k= so a client cannot ask for all 1081 classes.
+PREDICT_MAX_TOP_K      = int(os.getenv("PREDICT_MAX_TOP_K", "10"))
+
+# Max photos accepted by /predict/batch/ in one multipart request.
+PREDICT_MAX_BATCH_IMAGES = int(os.getenv("PREDICT_MAX_BATCH_IMAGES", "10"))
+
+# Threads used by predict_async for decode + inference (ASGI only).
+PREDICT_ASYNC_WORKERS  = int(os.getenv("PREDICT_ASYNC_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Eager start-up: load the model from AppConfig.ready and run a few dummy
+# forward passes so the JIT profiling runs happen before real traffic.
+PREDICT_EAGER_LOAD        = _env_flag("PREDICT_EAGER_LOAD")
+PREDICT_WARMUP_PASSES     = int(os.getenv("PREDICT_WARMUP_PASSES", "3"))
+PREDICT_WARMUP_BACKGROUND = _env_flag("PREDICT_WARMUP_BACKGROUND", "1")
+
+# Set by gunicorn.conf.py when the model is loaded once in the master.
+PREDICT_PREFORK           = _env_flag("PREDICT_PREFORK")
+
 _use_gpu = False
 _device = None
 _model = None
 _transform = None
+_preprocess = None
+_input_transforms = {}      # resolution -> FusedPreprocess or torchvision transform
+_input_pools = {}           # resolution -> InputBufferPool
+_governor = None
+_tta_transform = None
+_cascade_model = None
+_cascade_transform = None
+_cascade_gate = None
+_channels_last = False
+_model_version = None
+_sidecar = None
+_load_report = {"artifact": None, "format": None, "load_ms": None}
+_prediction_cache = LRUCache(PREDICT_CACHE_SIZE)
+_inflight = SingleFlight()
+_admission = AdmissionController(PREDICT_SLO_MS, concurrency=PREDICT_ADMISSION_CONCURRENCY)
+_batcher = None
+_pipeline = None
+_executor = None
+_load_lock = threading.Lock()
+
+def _fp32_model_path():
+    return os.path.join(BASE_DIR, "models", "efficientnet_b3.pt")
 
 def _lazy_load_stack():
-    global _device, _model, _transform
+    global _device, _model, _transform, _preprocess, _input_transforms, _input_pools, _governor
+    global _tta_transform, _channels_last, _model_version
+    global _cascade_model, _cascade_transform, _cascade_gate, _sidecar
     if _model is not None:
         return
 
-    _device = torch.device('cuda' if _use_gpu else 'cpu')
+    with _load_lock:
+        if _model is not None:
+            return
 
-    model_path = os.path.join(BASE_DIR, "models", "efficientnet_b3.pt")
-    if not os.path.isfile(model_path):
-        raise FileNotFoundError(f"Model not found at {model_path}")
+        _device = torch.device('cuda' if _use_gpu else 'cpu')
 
-    _model = torch.jit.load(model_path, map_location=_device)
-    _model.to(_device).eval()
+        # gunicorn workers are configured in post_fork; a preloading master
+        # must not size pools its children would inherit.
+        if not is_configured() and not PREDICT_PREFORK:
+            configure_from_env(int(os.getenv("WEB_CONCURRENCY", "1")))
 
-    global transforms
-    _transform = transforms.Compose([
-        transforms.Resize(300),
-        transforms.CenterCrop(300),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                             std=[0.229, 0.224, 0.225])
-    ])
+        if PREDICT_SIDECAR_SOCKET:
+            client = SidecarClient(PREDICT_SIDECAR_SOCKET, timeout=PREDICT_SIDECAR_TIMEOUT)
+            info = client.info()
+            _preprocess = _transform = FusedPreprocess(info["input_size"])
+            _input_transforms = {info["input_size"]: _preprocess}
+            if PREDICT_ADAPTIVE_RESOLUTION:
+                print("[prediction_views] Warning: PREDICT_ADAPTIVE_RESOLUTION is ignored with PREDICT_SIDECAR_SOCKET")
+            _tta_transform = TTATransform(info["input_size"], zoom=PREDICT_TTA_ZOOM, views=PREDICT_TTA_VIEWS)
+            _model_version = info["model_version"]
+            if PREDICT_CASCADE_MODEL:
+                print("[prediction_views] Warning: PREDICT_CASCADE_MODEL is ignored with PREDICT_SIDECAR_SOCKET")
+            _sidecar = client
+            _load_report.update(artifact=PREDICT_SIDECAR_SOCKET, format="sidecar")
+            # The client stands in for the model: "stack is ready".
+            _model = client
+            return
 
-def _sample_image_for_species(species_id_str: str):
+        if PREDICT_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown PREDICT_BACKEND {PREDICT_BACKEND!r}; expected one of {BACKENDS}")
+        if PREDICT_BACKEND == "onnxruntime":
+            if PREDICT_MODEL_VARIANT != "fp32":
+                raise ValueError("PREDICT_BACKEND=onnxruntime serves the fp32 export only")
+            model_path = onnx_path(_fp32_model_path())
+            hint = " (export it with: manage.py export_onnx)"
+        else:
+            model_path = artifact_path(_fp32_model_path(), PREDICT_MODEL_VARIANT)
+            hint = ""
+            if PREDICT_MODEL_VARIANT != "fp32":
+                hint = f" (build it with: manage.py optimize_model --variant {PREDICT_MODEL_VARIANT})"
+        started = time.perf_counter()
+        fast = None
+        if PREDICT_FAST_START and PREDICT_BACKEND == "torchscript" and PREDICT_MODEL_VARIANT == "fp32":
+            fast = _load_fast_start(model_path)
+        if fast is not None:
+            model, meta, fingerprint, artifact = fast
+            artifact_format = "mmap"
+        else:
+            if not os.path.isfile(model_path):
+                raise FileNotFoundError(f"Model not found at {model_path}{hint}")
+            model, meta = load_backend(PREDICT_BACKEND, model_path, _device)
+            if PREDICT_BACKEND == "onnxruntime":
+                _check_onnx_source(model_path, meta)
+            fingerprint, artifact, artifact_format = file_fingerprint(model_path), model_path, PREDICT_BACKEND
+        model.eval()
+        _channels_last = bool(meta.get("channels_last"))
+        version = "onnx" if PREDICT_BACKEND == "onnxruntime" else PREDICT_MODEL_VARIANT
+        _model_version = f"{version}-{fingerprint}"
+        _load_report.update(
+            artifact=artifact, format=artifact_format, load_ms=(time.perf_counter() - started) * 1000.0,
+        )
+
+        tiers = (INPUT_SIZE,)
+        if PREDICT_ADAPTIVE_RESOLUTION:
+            if PREDICT_BACKEND == "onnxruntime":
+                print("[prediction_views] Warning: the ONNX export has a fixed input size; "
+                      "PREDICT_ADAPTIVE_RESOLUTION is ignored")
+            else:
+                tiers = parse_tiers(PREDICT_RESOLUTION_TIERS, INPUT_SIZE)
+        if PREDICT_FUSED_PREPROCESS:
+            _input_transforms = {size: FusedPreprocess(size) for size in tiers}
+            _preprocess = _input_transforms[INPUT_SIZE]
+        else:
+            _input_transforms = {size: build_transform(size) for size in tiers}
+            _preprocess = None
+        _transform = _input_transforms[INPUT_SIZE]
+        _input_pools = {
+            size: InputBufferPool(
+                size,
+                capacity=max(PREDICT_MAX_BATCH_SIZE if PREDICT_BATCHING else 1, PREDICT_MAX_BATCH_IMAGES),
+                channels_last=_channels_last,
+                max_buffers=max(4, PREDICT_ASYNC_WORKERS),
+            )
+            for size in tiers
+        }
+        if len(tiers) > 1:
+            _governor = ResolutionGovernor(
+                tiers,
+                high_depth=PREDICT_RESOLUTION_HIGH_DEPTH,
+                low_depth=PREDICT_RESOLUTION_LOW_DEPTH,
+                high_p95_ms=PREDICT_RESOLUTION_HIGH_P95_MS,
+                low_p95_ms=PREDICT_RESOLUTION_LOW_P95_MS,
+                dwell_s=PREDICT_RESOLUTION_DWELL_S,
+            )
+        _tta_transform = TTATransform(zoom=PREDICT_TTA_ZOOM, views=PREDICT_TTA_VIEWS)
+
+        if PREDICT_CASCADE_MODEL:
+            cascade_path = os.path.join(BASE_DIR, "models", PREDICT_CASCADE_MODEL)
+            if not os.path.isfile(cascade_path):
+                raise FileNotFoundError(f"Cascade model not found at {cascade_path}")
+            cascade_model, _ = load_model(cascade_path, _device)
+            _cascade_model = cascade_model.to(_device).eval()
+            _cascade_transform = build_transform(PREDICT_CASCADE_INPUT_SIZE)
+            _cascade_gate = CascadeGate(PREDICT_CASCADE_MIN_CONFIDENCE, PREDICT_CASCADE_MIN_MARGIN)
+            # Cached results depend on the first stage and its thresholds too.
+            _model_version += (
+                f"+cascade-{file_fingerprint(cascade_path)}"
+                f"-{PREDICT_CASCADE_MIN_CONFIDENCE:g}-{PREDICT_CASCADE_MIN_MARGIN:g}"
+            )
+
+        # Publish the model last: other threads treat it as "stack is ready".
+        _model = model
+
+def _check_onnx_source(path, meta):
+    """
+    Refuse an ONNX export whose recorded source fingerprint no longer
+    matches efficientnet_b3.pt: it would serve the old weights under a new
+    deploy. Without the .pt (ONNX-only deploys) there is nothing to check.
+    """
+    source_path = _fp32_model_path()
+    if not os.path.isfile(source_path):
+        return
+    recorded = meta.get("source_fingerprint")
+    if recorded is None:
+        print(f"[prediction_views] Warning: {path} records no source fingerprint; "
+              f"re-export it with: manage.py export_onnx")
+    elif recorded != file_fingerprint(source_path):
+        raise ValueError(f"{path} was exported from another model; re-export it with: manage.py export_onnx")
+
+def _load_fast_start(source_path):
+    """
+    (model, meta, fingerprint, path) from the fast-start artifact, or None
+    when there is none, it was built from a different source model or it
+    records no passing parity check against it. The source's fingerprint is
+    stored in the artifact, so it is only re-hashed when its size or mtime
+    no longer match.
+    """
+    path = fast_artifact_path(source_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        model, meta = load_fast_artifact(path, _device)
+    except Exception as e:
+        print(f"[prediction_views] Warning: ignoring {path}: {e}")
+        return None
+    source = meta.get("source", {})
+    if os.path.isfile(source_path):
+        stamp = source_stamp(source_path)
+        stale = any(source.get(k) != v for k, v in stamp.items())
+        if stale and file_fingerprint(source_path) != source.get("fingerprint"):
+            print(f"[prediction_views] Warning: {path} was built from another model; "
+                  f"rebuild it with: manage.py build_fast_start")
+            return None
+    if not meta.get("parity", {}).get("passed"):
+        print(f"[prediction_views] Warning: {path} records no passing parity check; "
+              f"rebuild it with: manage.py build_fast_start")
+        return None
+    return model, meta, source.get("fingerprint"), path
+
+def _get_batcher():
+    """The process' MicroBatcher, started on first use; None when disabled."""
+    global _batcher
+    if _batcher is None and PREDICT_BATCHING:
+        with _load_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    _run_batch,
+                    max_batch_size=PREDICT_MAX_BATCH_SIZE,
+                    max_wait_ms=PREDICT_MAX_WAIT_MS,
+                )
+    return _batcher
+
+def _get_pipeline():
+    """The process' StagedPipeline, started on first use; None when disabled."""
+    global _pipeline
+    if _pipeline is None and PREDICT_PIPELINE:
+        batcher = _get_batcher()
+        with _load_lock:
+            if _pipeline is None:
+                _pipeline = StagedPipeline(
+                    _stage_upload,
+                    batcher or MicroBatcher(_run_batch, max_batch_size=1, max_wait_ms=0, name="predict.pipeline.infer"),
+                    workers=PREDICT_PIPELINE_WORKERS,
+                    queue_size=PREDICT_PIPELINE_QUEUE,
+                )
+    return _pipeline
+
+def _reset_after_fork():
+    # Threads don't survive fork(): a child of a preloading gunicorn master
+    # must start its own batcher/pipeline/executor instead of waiting on dead ones.
+    global _batcher, _pipeline, _executor, _load_lock
+    _batcher = None
+    _pipeline = None
+    _executor = None
+    _load_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def _probs_for_batch(batch):
+    """Softmax probabilities for an (N, C, H, W) tensor already on _device."""
+    if _sidecar is not None:
+        return _sidecar.predict(batch)
+    if _channels_last:
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        output = _model(batch)
+        return torch.nn.functional.softmax(output, dim=1)
+
+def _model_input(image, size=None):
+    """
+    Main-model input for a decoded image at resolution ``size`` (default:
+    full): a uint8 crop (fused) or a float tensor.
+    """
+    transform = _input_transforms[size] if size else _transform
+    if _preprocess is not None:
+        return transform.crop_uint8(image)
+    return transform(image)
+
+def _probs_for_inputs(inputs, warmup=False):
+    """
+    Probabilities for a list of _model_input() results. They are written
+    into a pooled input buffer (normalized there when they are uint8 crops)
+    instead of a freshly allocated batch. Except for ``warmup`` passes, the
+    per-image time feeds admission control.
+    """
+    started = time.perf_counter()
+    if _sidecar is not None:
+        probs = _sidecar.predict(inputs)
+    else:
+        pool = _input_pools[inputs[0].shape[-1]]
+        buf = pool.acquire(len(inputs))
+        try:
+            batch = buf[:len(inputs)]
+            if inputs[0].dtype == torch.uint8:
+                _preprocess.normalize_into(inputs, batch)
+            else:
+                torch.stack(inputs, out=batch)
+            probs = _probs_for_batch(batch.to(_device))
+        finally:
+            pool.release(buf)
+    if not warmup:
+        _admission.observe((time.perf_counter() - started) * 1000.0 / len(inputs))
+    return probs
+
+def _run_batch(inputs):
+    """
+    MicroBatcher callback: per-request inputs -> one probability row each,
+    one forward pass per resolution present in the batch.
+    """
+    results = [None] * len(inputs)
+    by_size = {}
+    for i, tensor in enumerate(inputs):
+        by_size.setdefault(tensor.shape[-1], []).append(i)
+    for positions in by_size.values():
+        probs = _probs_for_inputs([inputs[i] for i in positions]).cpu()
+        for i, row in zip(positions, probs.unbind(0)):
+            results[i] = row
+    return results
+
+def _load_tensor(data: bytes):
+    """Decode uploaded image bytes and run them through _transform -> (C, H, W)."""
+    image = decode_image(io.BytesIO(data), draft=PREDICT_JPEG_DRAFT)
+    return _transform(image)
+
+def _load_input(data: bytes, size=None):
+    """Decode uploaded image bytes into a main-model input (see _model_input)."""
+    return _model_input(decode_image(io.BytesIO(data), draft=PREDICT_JPEG_DRAFT), size)
+
+def _stage1_probs(image):
+    """
+    Cascade stage 1 on a decoded image: its probabilities when the cheap
+    model is confident enough, None when the request must escalate (or the
+    cascade is off).
+    """
+    if _cascade_model is None:
+        return None
+    started = time.perf_counter()
+    batch = _cascade_transform(image).unsqueeze(0).to(_device)
+    with torch.no_grad():
+        probs = torch.nn.functional.softmax(_cascade_model(batch), dim=1)[0].cpu()
+    _cascade_gate.observe(1, (time.perf_counter() - started) * 1000.0)
+    escalate, _, _ = _cascade_gate.should_escalate(probs)
+    return None if escalate else probs
+
+def _observe_stage2(started=None, ms=None):
+    if _cascade_gate is not None:
+        _cascade_gate.observe(2, ms if ms is not None else (time.perf_counter() - started) * 1000.0)
+
+def _cache_key(data: bytes, size=None):
+    """
+    Content key for an upload, or None when neither the cache nor coalescing
+    is on. Results at a reduced resolution are keyed apart from full ones.
+    """
+    if not (_prediction_cache.enabled or PREDICT_COALESCE):
+        return None
+    version = _model_version
+    if size and _governor is not None and size != _governor.tiers[0]:
+        version = f"{version}@{size}"
+    return content_key(data, version)
+
+def _coalesce_key(key):
+    return key if PREDICT_COALESCE else None
+
+def _cached_result(key):
+    """(probs, resolution) from the cache, or (None, None)."""
+    if key is None or not _prediction_cache.enabled:
+        return None, None
+    return _prediction_cache.get(key) or (None, None)
+
+def _store_probs(key, probs, resolution):
+    if key is not None:
+        # clone(): rows from a batch are views that would pin the whole batch.
+        _prediction_cache.put(key, (probs.detach().cpu().clone(), resolution))
+
+def _admitted(cost, deadline, fn, *args):
+    """fn(*args) counted in flight as ``cost`` images; raises AdmissionError when shed."""
+    _admission.admit(cost, deadline)
+    try:
+        return fn(*args)
+    finally:
+        _admission.release(cost)
+
+def _enter_tier():
+    """Resolution for a request about to run (None: full); pair with _exit_tier()."""
+    return _governor.enter() if _governor is not None else None
+
+def _exit_tier(started=None):
+    if _governor is not None:
+        _governor.exit((time.perf_counter() - started) * 1000.0 if started is not None else None)
+
+def _predict_probs(tensor, deadline=None):
+    """Probabilities (1-D) for a single _model_input() result."""
+    batcher = _get_batcher()
+    if batcher is not None:
+        return batcher.submit(tensor, deadline).result()
+    check_deadline(deadline)
+    return _probs_for_inputs([tensor])[0]
+
+_tta_explicit = metrics.counter("predict.tta.explicit")
+_tta_low_confidence = metrics.counter("predict.tta.low_confidence")
+_tta_latency_ms = metrics.histogram("predict.tta.latency_ms", metrics.LATENCY_MS_BUCKETS)
+
+def _parse_tta(request):
+    """?tta= from the query string or form body: True, False, or None (automatic)."""
+    raw = (request.GET.get("tta") or request.POST.get("tta") or "").strip().lower()
+    if raw in ("1", "true", "yes", "on"):
+        return True
+    if raw in ("0", "false", "no", "off"):
+        return False
+    return None
+
+def _tta_probs(data: bytes, base_probs=None):
+    """
+    Mean softmax over the TTA views of an upload, from one batched forward
+    pass. With ``base_probs`` (the plain prediction, already paid for) the
+    base view is not recomputed and only the extra views are run.
+    """
+    started = time.perf_counter()
+    # The zoom views are cropped from a resize to size * zoom: decode at
+    # least that large, or the draft scale would leave them upsampled.
+    image = decode_image(
+        io.BytesIO(data), min_size=round(_tta_transform.size * PREDICT_TTA_ZOOM), draft=PREDICT_JPEG_DRAFT,
+    )
+    include_base = base_probs is None
+    batch = _tta_transform(image, include_base=include_base)
+    total = _probs_for_batch(batch.to(_device)).sum(dim=0).cpu()
+    if not include_base:
+        total = total + base_probs.cpu()
+    _tta_latency_ms.observe((time.perf_counter() - started) * 1000.0)
+    return total / len(_tta_transform)
+
+def _is_tta_base_view(resolution):
+    """
+    Whether probabilities at ``resolution`` are the main model's full-size
+    prediction, i.e. TTA's base view. Cascade stage 1 answers are reported
+    at PREDICT_CASCADE_INPUT_SIZE; when that equals the TTA size the two
+    cannot be told apart, so neither is reused.
+    """
+    if resolution != _tta_transform.size:
+        return False
+    return _cascade_model is None or PREDICT_CASCADE_INPUT_SIZE != resolution
+
+def _apply_tta(tta, data, probs, key, deadline=None, resolution=None):
+    """
+    Decide whether to re-score ``probs`` with TTA (see _parse_tta) and do it.
+    ``probs`` may be None when tta is forced, to skip the plain pass. Returns
+    (probs, tta_info or None); TTA results are cached under their own key.
+    ``probs`` stand in for the base view only when they are that view (see
+    _is_tta_base_view), not a stage-1 or reduced-resolution prediction.
+    The views that run go through admission control as that many images.
+    """
+    if tta is False or len(_tta_transform) < 2:
+        return probs, None
+    if tta is None:
+        if PREDICT_TTA_THRESHOLD <= 0 or probs is None:
+            return probs, None
+        base_confidence = float(probs.max())
+        if base_confidence >= PREDICT_TTA_THRESHOLD:
+            return probs, None
+        trigger = "low_confidence"
+        _tta_low_confidence.inc()
+    else:
+        base_confidence = float(probs.max()) if probs is not None else None
+        trigger = "explicit"
+        _tta_explicit.inc()
+
+    tta_key = f"tta{len(_tta_transform)}:{key}" if key is not None else None
+    tta_probs, _ = _cached_result(tta_key)
+    if tta_probs is None:
+        base_probs = probs if probs is not None and _is_tta_base_view(resolution) else None
+        views = len(_tta_transform) - (base_probs is not None)
+        tta_probs = _admitted(views, deadline, _tta_probs, data, base_probs)
+        _store_probs(tta_key, tta_probs, _tta_transform.size)
+    return tta_probs, {
+        "trigger": trigger,
+        "views": len(_tta_transform),
+        "resolution": _tta_transform.size,
+        "base_confidence": base_confidence,
+    }
+
+def _payload_with_tta(probs, top_k, tta_info, resolution):
+    payload = _prediction_payload(probs, top_k)
+    # Input resolution of the base prediction (the TTA views report theirs).
+    payload["resolution"] = resolution or (tta_info or {}).get("resolution")
+    if tta_info is not None:
+        payload["tta"] = tta_info
+    return payload
+
+@lru_cache(maxsize=None)
+def _species_image_files(species_id_str: str):
     media_root = getattr(settings, "MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
-    media_url  = getattr(settings, "MEDIA_URL", "/media/")
     folder = os.path.join(media_root, "images", species_id_str)
     if not os.path.isdir(folder):
-        return None
-    files = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
+        return ()
+    return tuple(f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f)))
+
+def _sample_image_for_species(species_id_str: str):
+    media_url  = getattr(settings, "MEDIA_URL", "/media/")
+    files = _species_image_files(species_id_str)
     if not files:
         return None
     choice = random.choice(files)
     return f"{media_url.rstrip('/')}/images/{species_id_str}/{choice}"
 
+def _candidates(probs, k: int = 1):
+    """Top-k candidates for a 1-D probability vector, best first."""
+    top_probs, top_idx = torch.topk(probs, k)
+    idx = top_idx.cpu().numpy()
+    species_ids = _class_species_ids[idx]
+    cmn_names = _class_cmn_names[idx]
+    scn_names = _class_scn_names[idx]
+    confidences = top_probs.cpu().tolist()
+
+    candidates = []
+    for i in range(len(idx)):
+        species_id = int(species_ids[i])
+        sample_image_url = _sample_image_for_species(str(species_id)) if species_id else None
+        candidates.append({
+            "predicted_index": int(idx[i]),
+            "species_id": species_id,
+            "common_name": cmn_names[i],
+            "scientific_name": scn_names[i],
+            "confidence": float(confidences[i]),
+            "sample_image": sample_image_url or "Not available",
+        })
+    return candidates
+
+def _prediction_payload(probs, top_k=None):
+    """Top-1 fields (the original response shape) plus optional top-k list."""
+    candidates = _candidates(probs, top_k or 1)
+    payload = dict(candidates[0])
+    if top_k:
+        payload["top_k"] = candidates
+    return payload
+
+def _parse_top_k(request):
+    """?top_k= from the query string or form body; None when not requested."""
+    raw = request.GET.get("top_k") or request.POST.get("top_k")
+    if raw in (None, ""):
+        return None
+    top_k = int(raw)
+    if top_k < 1:
+        raise ValueError("top_k must be a positive integer.")
+    return min(top_k, PREDICT_MAX_TOP_K, len(_class_species_ids))
+
+class _RequestError(Exception):
+    """A /predict/ failure that maps straight onto an error response."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def _request_deadline(request):
+    """time.perf_counter() deadline from the X-Request-Timeout-Ms header, or None."""
+    raw = request.headers.get("X-Request-Timeout-Ms")
+    if not raw:
+        return None
+    try:
+        budget_ms = float(raw)
+    except ValueError:
+        raise _RequestError("X-Request-Timeout-Ms must be a number of milliseconds.")
+    return deadline_after(budget_ms) if budget_ms > 0 else None
+
+def _shed_response(request, e):
+    """503 + Retry-After for a request turned away by admission control."""
+    if isinstance(e, DeadlineExceeded):
+        _admission.expired()
+    response = JsonResponse({"error": e.message, "retry_after_s": e.retry_after_s}, status=503)
+    response["Retry-After"] = str(e.retry_after_s)
+    return _corsify(request, response)
+
+def _guard_uploads(request, max_files=1):
+    install_upload_guard(
+        request,
+        max_file_bytes=PREDICT_MAX_UPLOAD_BYTES,
+        max_files=max_files,
+        in_memory_max_bytes=PREDICT_IN_MEMORY_MAX_BYTES,
+    )
+
+def _checked_files(request):
+    """request.FILES after the upload guard ran; 413 if it refused the body."""
+    files = request.FILES
+    if getattr(request, "upload_rejected", None):
+        raise _RequestError(request.upload_rejected, status=413)
+    return files
+
+def _read_upload(upload):
+    """Sniff the header (format, pixel budget) before reading the bytes."""
+    try:
+        sniff_image(upload, PREDICT_MAX_PIXELS)
+    except ImageRejected as e:
+        raise _RequestError(str(e), status=e.status)
+    return upload.read()
+
+def _session_user_id(request):
+    """
+    The session user, but only with a valid CSRF token: /predict/ is
+    csrf_exempt, so a cookie alone could come from a cross-site form.
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return None
+    from rest_framework.authentication import SessionAuthentication
+    from rest_framework.exceptions import PermissionDenied
+    try:
+        SessionAuthentication().enforce_csrf(request)
+    except PermissionDenied:
+        return None
+    return user.id
+
+def _history_user_id(request):
+    """
+    Who a prediction is logged for: the JWT bearer, else the session user
+    (CSRF-checked). None (nothing logged) for anonymous callers or a token
+    that does not validate; a bad token never fails the prediction itself.
+    A user_id field is only accepted as a cross-check against that user.
+    """
+    if not PREDICT_HISTORY:
+        return None
+    user_id = None
+    if request.headers.get("Authorization", "").startswith("Bearer "):
+        from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+        try:
+            result = JWTStatelessUserAuthentication().authenticate(request)
+        except Exception:
+            result = None
+        if result is not None:
+            user_id = int(result[0].id)
+    else:
+        user_id = _session_user_id(request)
+
+    raw = request.POST.get("user_id") or request.GET.get("user_id")
+    if raw not in (None, "") and user_id is not None:
+        try:
+            claimed = int(raw)
+        except ValueError:
+            raise _RequestError("user_id must be an integer.")
+        if claimed != user_id:
+            raise _RequestError("user_id does not match the authenticated user.", status=403)
+    return user_id
+
+def _queue_history(request, user_id, data, payload):
+    """Hand the prediction to the write-behind queue; returns whether it was queued."""
+    if not payload.get("species_id"):
+        return False
+    record = {
+        "user_id": user_id,
+        "species_id": payload["species_id"],
+        "common_name": payload["common_name"],
+        "scientific_name": payload["scientific_name"],
+        "confidence": payload["confidence"],
+        "image": data if PREDICT_HISTORY_STORE_IMAGES else None,
+        "media_base_url": request.build_absolute_uri(getattr(settings, "MEDIA_URL", "/media/")),
+    }
+    queue = history_queue(
+        max_items=PREDICT_HISTORY_QUEUE_SIZE,
+        max_batch=PREDICT_HISTORY_BATCH_SIZE,
+        flush_interval_ms=PREDICT_HISTORY_FLUSH_MS,
+    )
+    return queue.submit(record)
+
+def _queue_flag(request, data, probs, payload):
+    """Queue a FlaggedCase for an uncertain prediction (subject to the hourly cap)."""
+    if not PREDICT_FLAGGING:
+        return
+    confidence, margin = confidence_and_margin(probs)
+    reason = flag_reason(confidence, margin, PREDICT_FLAG_CONFIDENCE, PREDICT_FLAG_MARGIN)
+    if reason is None:
+        return
+    queue, cap = flag_queue(PREDICT_FLAG_MAX_PER_HOUR, max_items=PREDICT_HISTORY_QUEUE_SIZE)
+    if not cap.allow():
+        metrics.counter("predict.flags.rate_limited").inc()
+        return
+    queue.submit({
+        "plant_name": payload["scientific_name"],
+        "reason": reason,
+        "confidence": confidence,
+        "image": data,
+        "media_base_url": request.build_absolute_uri(getattr(settings, "MEDIA_URL", "/media/")),
+    })
+
+def _respond(request, user_id, data, probs, payload):
+    """
+    The /predict/ JSON response, after queueing the history record (if
+    there is a user) and a review flag (if the prediction is uncertain).
+    """
+    if user_id is not None:
+        payload["history_queued"] = _queue_history(request, user_id, data, payload)
+    _queue_flag(request, data, probs, payload)
+    return _corsify(request, JsonResponse(payload))
+
+def _prepare_predict(request):
+    """
+    Validate a /predict/ POST, make sure the model stack is loaded and read
+    the upload. Returns (data, top_k, tta, user_id); raises _RequestError.
+    """
+    if request.method != "POST" or not _checked_files(request).get("image"):
+        raise _RequestError("POST an image with key 'image'.")
+
+    try:
+        _lazy_load_stack()
+    except SidecarError as e:
+        raise _RequestError(str(e), status=503)
+    except Exception as e:
+        raise _RequestError(f"Model init failed: {e}", status=500)
+
+    try:
+        top_k = _parse_top_k(request)
+    except ValueError:
+        raise _RequestError("top_k must be a positive integer.")
+
+    user_id = _history_user_id(request)
+    data = _read_upload(request.FILES["image"])
+    return data, top_k, _parse_tta(request), user_id
+
+def _decode_upload(data: bytes):
+    try:
+        return _load_tensor(data)
+    except Exception as e:
+        raise _RequestError(str(e))
+
+def _stage_upload(data: bytes, size=None):
+    """
+    Decode an upload and run cascade stage 1 on it. Returns (probs, None)
+    when stage 1 answered, else (None, main-model input at ``size``).
+    """
+    try:
+        image = decode_image(io.BytesIO(data), draft=PREDICT_JPEG_DRAFT)
+    except Exception as e:
+        raise _RequestError(str(e))
+    probs = _stage1_probs(image)
+    if probs is not None:
+        return probs, None
+    return None, _model_input(image, size)
+
+def _infer_upload(data: bytes, key, size=None, deadline=None):
+    """
+    Cascade stage 1, else the main model at ``size``, for one upload.
+    Returns (probs, resolution); the result is cached. Raises
+    DeadlineExceeded instead of running the model after ``deadline``.
+    """
+    pipeline = _get_pipeline()
+    if pipeline is not None:
+        probs, tensor, infer_ms = pipeline.submit((data, size), deadline).result()
+        if tensor is not None:
+            _observe_stage2(ms=infer_ms)
+    else:
+        probs, tensor = _stage_upload(data, size)
+        if probs is None:
+            started = time.perf_counter()
+            probs = _predict_probs(tensor, deadline)
+            _observe_stage2(started)
+    if tensor is not None:
+        resolution = tensor.shape[-1]
+    else:
+        resolution = PREDICT_CASCADE_INPUT_SIZE
+    # Cached before the flight settles, so a repeat that just misses the
+    # flight still finds the result.
+    _store_probs(key, probs, resolution)
+    return probs, resolution
+
 @csrf_exempt
 def predict(request):
     # Preflight
     if request.method == "OPTIONS":
         return _corsify(request, HttpResponse(status=200))
-    if request.method != "POST" or not request.FILES.get("image"):
-        return _corsify(request, JsonResponse({"error": "POST an image with key 'image'."}, status=400))
+    _guard_uploads(request)
+
+    try:
+        deadline = _request_deadline(request)
+        data, top_k, tta, user_id = _prepare_predict(request)
+        size = _enter_tier()
+        started, ok = None, False
+        try:
+            key = _cache_key(data, size)
+            probs, resolution = _cached_result(key)
+            if probs is None and tta is not True:
+                # Only the leader is admitted and bound by its deadline; a
+                # follower the leader's shedding fails retries on its own.
+                started = time.perf_counter()
+                probs, resolution = _inflight.run(
+                    _coalesce_key(key), _admitted, 1, deadline, _infer_upload, data, key, size, deadline,
+                    retry_on=AdmissionError,
+                )
+            ok = True
+        finally:
+            # Shed, failed and timed-out requests say nothing about how
+            # long inference takes: only successes feed the governor's p95.
+            _exit_tier(started if ok else None)
+        probs, tta_info = _apply_tta(tta, data, probs, key, deadline, resolution)
+        return _respond(request, user_id, data, probs, _payload_with_tta(probs, top_k, tta_info, resolution))
+
+    except _RequestError as e:
+        return _corsify(request, JsonResponse({"error": e.message}, status=e.status))
+    except AdmissionError as e:
+        return _shed_response(request, e)
+    except SidecarError as e:
+        return _corsify(request, JsonResponse({"error": str(e)}, status=503))
+    except Exception as e:
+        return _corsify(request, JsonResponse({"error": str(e)}, status=400))
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _load_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=PREDICT_ASYNC_WORKERS,
+                    thread_name_prefix="predict",
+                )
+    return _executor
+
+async def _infer_upload_async(loop, executor, data: bytes, key, size=None, deadline=None):
+    """_infer_upload without holding a thread while the batch future is pending."""
+    probs, tensor = await loop.run_in_executor(executor, _stage_upload, data, size)
+    if probs is None:
+        started = time.perf_counter()
+        batcher = _get_batcher()
+        if batcher is not None:
+            probs = await asyncio.wrap_future(batcher.submit(tensor, deadline))
+        else:
+            probs = await loop.run_in_executor(executor, _predict_probs, tensor, deadline)
+        _observe_stage2(started)
+        resolution = tensor.shape[-1]
+    else:
+        resolution = PREDICT_CASCADE_INPUT_SIZE
+    _store_probs(key, probs, resolution)
+    return probs, resolution
+
+@csrf_exempt
+async def predict_async(request):
+    """
+    Native async /predict/ for ASGI (daphne). Under ASGI a sync view runs on
+    asgiref's shared sync thread, so slow uploads serialize behind each
+    other; here decode/transform and the forward pass go to a bounded
+    executor and the event loop stays free while they run. With micro-
+    batching on, the batch future is awaited without holding a thread.
+    """
+    if request.method == "OPTIONS":
+        return _corsify(request, HttpResponse(status=200))
+
+    _guard_uploads(request)
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    try:
+        deadline = _request_deadline(request)
+        data, top_k, tta, user_id = await loop.run_in_executor(executor, _prepare_predict, request)
+        size = _enter_tier()
+        started, ok = None, False
+        try:
+            key = await loop.run_in_executor(executor, _cache_key, data, size)
+            probs, resolution = _cached_result(key)
+            if probs is None and tta is not True:
+                started = time.perf_counter()
+                flight_key = _coalesce_key(key)
+                # Same as SingleFlight.run(..., retry_on=AdmissionError):
+                # only a leader is admitted and bound by its own deadline.
+                while True:
+                    flight, leader = _inflight.join(flight_key)
+                    if leader:
+                        break
+                    try:
+                        probs, resolution = await asyncio.wrap_future(flight)
+                        break
+                    except AdmissionError:
+                        continue
+                if leader:
+                    try:
+                        _admission.admit(deadline=deadline)
+                        try:
+                            probs, resolution = await _infer_upload_async(
+                                loop, executor, data, key, size, deadline,
+                            )
+                        finally:
+                            _admission.release()
+                    except BaseException as e:
+                        _inflight.settle(flight_key, flight, exception=e)
+                        raise
+                    _inflight.settle(flight_key, flight, (probs, resolution))
+            ok = True
+        finally:
+            _exit_tier(started if ok else None)   # as in predict()
+        if tta is not False:
+            probs, tta_info = await loop.run_in_executor(
+                executor, _apply_tta, tta, data, probs, key, deadline, resolution,
+            )
+        else:
+            tta_info = None
+        return _respond(request, user_id, data, probs, _payload_with_tta(probs, top_k, tta_info, resolution))
+
+    except _RequestError as e:
+        return _corsify(request, JsonResponse({"error": e.message}, status=e.status))
+    except AdmissionError as e:
+        return _shed_response(request, e)
+    except SidecarError as e:
+        return _corsify(request, JsonResponse({"error": str(e)}, status=503))
+    except Exception as e:
+        return _corsify(request, JsonResponse({"error": str(e)}, status=400))
+
+@csrf_exempt
+def predict_batch(request):
+    """
+    Several photos of the same plant (leaf, flower, bark...) in one multipart
+    request under repeated 'image' keys. All decodable images go through the
+    model as a single batch; the response has one result per image plus a
+    consensus prediction from the averaged probabilities.
+    """
+    if request.method == "OPTIONS":
+        return _corsify(request, HttpResponse(status=200))
+    _guard_uploads(request, max_files=PREDICT_MAX_BATCH_IMAGES)
+    try:
+        files = _checked_files(request).getlist("image") if request.method == "POST" else []
+    except _RequestError as e:
+        return _corsify(request, JsonResponse({"error": e.message}, status=e.status))
+    if not files:
+        return _corsify(request, JsonResponse({"error": "POST one or more images with key 'image'."}, status=400))
+    if len(files) > PREDICT_MAX_BATCH_IMAGES:
+        return _corsify(request, JsonResponse(
+            {"error": f"At most {PREDICT_MAX_BATCH_IMAGES} images per request."},
+            status=400,
+        ))
+
+    try:
+        top_k = _parse_top_k(request)
+    except ValueError:
+        return _corsify(request, JsonResponse({"error": "top_k must be a positive integer."}, status=400))
+    try:
+        deadline = _request_deadline(request)
+    except _RequestError as e:
+        return _corsify(request, JsonResponse({"error": e.message}, status=e.status))
 
     try:
         _lazy_load_stack()
+    except SidecarError as e:
+        return _corsify(request, JsonResponse({"error": str(e)}, status=503))
     except Exception as e:
         return _corsify(request, JsonResponse({"error": f"Model init failed: {e}"}, status=500))
 
+    results = [None] * len(files)
+    rows = {}                      # position -> probabilities
+    resolutions = {}               # position -> input resolution
+    keys, tensors, pending = {}, [], []
+    size = _enter_tier()
+    for i, image_file in enumerate(files):
+        try:
+            data = _read_upload(image_file)
+            keys[i] = _cache_key(data, size)
+            cached, resolution = _cached_result(keys[i])
+            if cached is not None:
+                rows[i], resolutions[i] = cached, resolution
+                continue
+            tensors.append(_load_input(data, size))
+            pending.append(i)
+        except _RequestError as e:
+            results[i] = {"index": i, "filename": image_file.name, "error": e.message}
+        except Exception as e:
+            results[i] = {"index": i, "filename": image_file.name, "error": str(e)}
+
+    if not rows and not tensors:
+        _exit_tier()
+        return _corsify(request, JsonResponse({"error": "None of the images could be decoded.", "results": results}, status=400))
+
+    if tensors:
+        try:
+            _admission.admit(len(tensors), deadline)
+        except AdmissionError as e:
+            _exit_tier()
+            return _shed_response(request, e)
+        started, ok = time.perf_counter(), False
+        try:
+            probs = _probs_for_inputs(tensors).cpu()
+            ok = True
+        except SidecarError as e:
+            return _corsify(request, JsonResponse({"error": str(e)}, status=503))
+        except Exception as e:
+            return _corsify(request, JsonResponse({"error": str(e)}, status=400))
+        finally:
+            _admission.release(len(tensors))
+            _exit_tier(started if ok else None)   # as in predict()
+        for row, i in enumerate(pending):
+            rows[i], resolutions[i] = probs[row], tensors[row].shape[-1]
+            _store_probs(keys[i], probs[row], resolutions[i])
+    else:
+        _exit_tier()
+
+    for i, row in rows.items():
+        results[i] = {
+            "index": i, "filename": files[i].name,
+            **_prediction_payload(row, top_k), "resolution": resolutions[i],
+        }
+
+    consensus = _prediction_payload(torch.stack(list(rows.values())).mean(dim=0), top_k)
+    consensus["num_images"] = len(rows)
+
+    return _corsify(request, JsonResponse({"consensus": consensus, "results": results}))
+
+@csrf_exempt
+def predict_metrics(request):
+    """Per-worker inference metrics (batch sizes, queue wait, ...) as JSON."""
+    if request.method == "OPTIONS":
+        return _corsify(request, HttpResponse(status=200))
+    return _corsify(request, JsonResponse({
+        "pid": os.getpid(),
+        "batching": {
+            "enabled": PREDICT_BATCHING,
+            "max_batch_size": PREDICT_MAX_BATCH_SIZE,
+            "max_wait_ms": PREDICT_MAX_WAIT_MS,
+        },
+        "pipeline": _pipeline.stats() if _pipeline is not None else {"enabled": PREDICT_PIPELINE},
+        "memory": process_memory(os.getpid()),
+        "backend": PREDICT_BACKEND,
+        "model_variant": PREDICT_MODEL_VARIANT,
+        "model_version": _model_version,
+        "sidecar": _sidecar.stats() if _sidecar is not None else None,
+        "cache": _prediction_cache.stats(),
+        "coalescing": {"enabled": PREDICT_COALESCE, **_inflight.stats()},
+        "admission": _admission.stats(),
+        "preprocess": {
+            "fused": _preprocess is not None,
+            "input_pools": {str(size): pool.stats() for size, pool in _input_pools.items()},
+        },
+        "resolution": _governor.stats() if _governor is not None else {
+            "adaptive": False, "tiers": sorted(_input_transforms, reverse=True),
+        },
+        "cascade": {
+            "enabled": _cascade_gate is not None,
+            "model": PREDICT_CASCADE_MODEL or None,
+            **(_cascade_gate.stats() if _cascade_gate is not None else {}),
+        },
+        "tta": {
+            "threshold": PREDICT_TTA_THRESHOLD,
+            "views": PREDICT_TTA_VIEWS,
+            "zoom": PREDICT_TTA_ZOOM,
+        },
+        "metrics": metrics.snapshot(),
+    }))
+
+
+# =============================================================================
+# Similar plants (/similar/) – nearest reference photos by embedding
+# =============================================================================
+
+_embedder = None
+_embedding_index = None
+
+class _SimilarUnavailable(Exception):
+    """/similar/ cannot be served in this worker's inference mode."""
+
+def _load_similar_stack():
+    """
+    Load the embedding index (memory-mapped) and an embedder. The serving
+    model is reused when it still exposes its submodules; frozen variants
+    do not, and the fp32 model is loaded alongside for embeddings. Workers
+    that hold no TorchScript model (sidecar, ONNX Runtime) do not load one
+    just for this: _SimilarUnavailable.
+    """
+    global _embedder, _embedding_index
+    if _embedding_index is not None:
+        return
+    if PREDICT_SIDECAR_SOCKET or PREDICT_BACKEND != "torchscript":
+        mode = "PREDICT_SIDECAR_SOCKET" if PREDICT_SIDECAR_SOCKET else f"PREDICT_BACKEND={PREDICT_BACKEND}"
+        raise _SimilarUnavailable(f"Similar plants need the TorchScript model in the web worker; unavailable with {mode}.")
+    _lazy_load_stack()
+
+    with _load_lock:
+        if _embedding_index is not None:
+            return
+        if not os.path.isfile(os.path.join(PREDICT_EMBEDDINGS_DIR, "embeddings.json")):
+            raise FileNotFoundError(
+                f"No embedding index in {PREDICT_EMBEDDINGS_DIR} (build it with: manage.py build_embeddings)"
+            )
+        index = EmbeddingIndex.load(PREDICT_EMBEDDINGS_DIR)
+
+        try:
+            embedder = Embedder(_model)
+        except ValueError:
+            fp32 = torch.jit.load(_fp32_model_path(), map_location=_device).eval()
+            embedder = Embedder(fp32)
+
+        fingerprint = file_fingerprint(_fp32_model_path())
+        if index.meta.get("model_fingerprint") != fingerprint:
+            print(
+                f"[prediction_views] Warning: embedding index was built with model "
+                f"{index.meta.get('model_fingerprint')}, serving {fingerprint}; rebuild it."
+            )
+
+        _embedder = embedder
+        _embedding_index = index
+
+def _parse_k(request, default=5):
+    raw = request.GET.get("k") or request.POST.get("k")
+    if raw in (None, ""):
+        return default
+    k = int(raw)
+    if k < 1:
+        raise ValueError("k must be a positive integer.")
+    return min(k, PREDICT_SIMILAR_MAX_K)
+
+@csrf_exempt
+def similar(request):
+    """
+    Nearest reference photos to an upload (key 'image') by cosine similarity
+    of penultimate-layer embeddings. ?k= caps the results; ?distinct=1 keeps
+    only the best photo per species.
+    """
+    if request.method == "OPTIONS":
+        return _corsify(request, HttpResponse(status=200))
+    _guard_uploads(request)
+
     try:
-        image_file = request.FILES["image"]
-        image = Image.open(image_file).convert("RGB")
-        image = _transform(image).unsqueeze(0).to(_device)
-
-        with torch.no_grad():
-            output = _model(image)
-            probs = torch.nn.functional.softmax(output, dim=1)
-            top_prob, predicted_idx = torch.max(probs, dim=1)
-            confidence = float(top_prob.item())
-            predicted_idx = int(predicted_idx.item())
-
-        species_id = class_idx_to_species_id.get(str(predicted_idx), None)
-        species_id_str = str(species_id).strip() if species_id is not None else None
-
-        common_name = species_id_to_cmn_name.get(species_id_str, "Unknown")
-        scientific_name = species_id_to_scn_name.get(species_id_str, "Unknown")
-
-        sample_image_url = _sample_image_for_species(species_id_str) if species_id_str else None
-
-        return _corsify(request, JsonResponse({
-            "predicted_index": predicted_idx,
-            "species_id": int(species_id) if species_id is not None else 0,
-            "common_name": common_name,
-            "scientific_name": scientific_name,
-            "confidence": confidence,
-            "sample_image": sample_image_url or "Not available",
-        }))
+        if request.method != "POST" or not _checked_files(request).get("image"):
+            raise _RequestError("POST an image with key 'image'.")
+        try:
+            k = _parse_k(request)
+        except ValueError:
+            raise _RequestError("k must be a positive integer.")
+        distinct = (request.GET.get("distinct") or request.POST.get("distinct") or "").lower() in ("1", "true", "yes")
+        try:
+            _load_similar_stack()
+        except (FileNotFoundError, _SimilarUnavailable) as e:
+            raise _RequestError(str(e), status=503)
+        except Exception as e:
+            raise _RequestError(f"Model init failed: {e}", status=500)
+
+        data = _read_upload(request.FILES["image"])
+        tensor = _decode_upload(data)
+        query = _embedder(tensor.unsqueeze(0).to(_device))[0].cpu().numpy()
+        hits = _embedding_index.search(query, k, distinct_species=distinct)
+
+        media_url = getattr(settings, "MEDIA_URL", "/media/").rstrip("/")
+        results = []
+        for row, score in hits:
+            entry = _embedding_index.entries[row]
+            sid = str(entry["species_id"])
+            results.append({
+                "species_id": int(sid),
+                "common_name": species_id_to_cmn_name.get(sid, "Unknown"),
+                "scientific_name": species_id_to_scn_name.get(sid, "Unknown"),
+                "image": f"{media_url}/{entry['path']}",
+                "similarity": score,
+            })
+        return _corsify(request, JsonResponse({"results": results, "index_size": len(_embedding_index)}))
 
+    except _RequestError as e:
+        return _corsify(request, JsonResponse({"error": e.message}, status=e.status))
     except Exception as e:
         return _corsify(request, JsonResponse({"error": str(e)}, status=400))
+
+
+# =============================================================================
+# Warm-up & readiness (/ready/)
+# =============================================================================
+
+_readiness = {
+    "state": "not_loaded",   # not_loaded [-> loaded] -> loading -> warming -> ready | failed
+    "load_ms": None,
+    "warmup_ms": [],
+    "error": None,
+}
+
+def warm_up(passes: int = PREDICT_WARMUP_PASSES):
+    """
+    Load the model stack and run ``passes`` dummy forward passes through it.
+    The first TorchScript calls are the slow, profiling ones; paying for them
+    here keeps them off the first real request. Safe to call more than once.
+    """
+    _readiness.update(state="loading", error=None, warmup_ms=[])
+    try:
+        if _model is None:
+            started = time.perf_counter()
+            _lazy_load_stack()
+            _readiness["load_ms"] = (time.perf_counter() - started) * 1000.0
+
+        _readiness["state"] = "warming"
+        batch_sizes = [1]
+        if PREDICT_BATCHING and PREDICT_MAX_BATCH_SIZE > 1:
+            batch_sizes.append(PREDICT_MAX_BATCH_SIZE)
+        # Every resolution tier: a new input shape is a cold start of its own.
+        for size in sorted(_input_transforms, reverse=True):
+            dummy = _model_input(Image.new("RGB", (400, 300)), size)
+            for batch_size in batch_sizes:
+                # Through the input pool, so its buffers exist before traffic.
+                for _ in range(max(0, passes)):
+                    started = time.perf_counter()
+                    _probs_for_inputs([dummy] * batch_size, warmup=True)
+                    _readiness["warmup_ms"].append({
+                        "resolution": size,
+                        "batch_size": batch_size,
+                        "ms": (time.perf_counter() - started) * 1000.0,
+                    })
+        if _cascade_model is not None:
+            stage1 = _cascade_transform(Image.new("RGB", (400, 300))).unsqueeze(0).to(_device)
+            with torch.no_grad():
+                for _ in range(max(0, passes)):
+                    _cascade_model(stage1)
+        _readiness["state"] = "ready"
+    except Exception as e:
+        _readiness.update(state="failed", error=str(e))
+        print(f"[prediction_views] Warning: warm-up failed: {e}")
+
+def preload_for_fork():
+    """
+    Load the model and species tables in the gunicorn master so workers
+    inherit them copy-on-write. No forward pass runs here (see start_warm_up).
+    """
+    started = time.perf_counter()
+    _lazy_load_stack()
+    _readiness.update(state="loaded", load_ms=(time.perf_counter() - started) * 1000.0)
+    prepare_for_fork(_model)
+
+def start_warm_up():
+    """Entry point for AppConfig.ready(); no-op unless PREDICT_EAGER_LOAD is set."""
+    if not PREDICT_EAGER_LOAD or _readiness["state"] != "not_loaded":
+        return
+    if PREDICT_PREFORK:
+        # gunicorn.conf.py loads in the master and warms up in each worker;
+        # forward passes in the master would start torch threads pre-fork.
+        return
+    if PREDICT_WARMUP_BACKGROUND:
+        threading.Thread(target=warm_up, name="predict-warmup", daemon=True).start()
+    else:
+        warm_up()
+
+@csrf_exempt
+def ready(request):
+    """
+    Readiness probe. With PREDICT_EAGER_LOAD the worker only reports 200 once
+    the model is loaded and warmed; in lazy mode it is always routable and
+    the model loads on the first /predict/.
+    """
+    if request.method == "OPTIONS":
+        return _corsify(request, HttpResponse(status=200))
+
+    state = _readiness["state"]
+    if state in ("not_loaded", "loaded") and _model is not None:
+        state = "ready"   # loaded lazily by a request
+    is_ready = state == "ready" or (not PREDICT_EAGER_LOAD and state != "failed")
+
+    return _corsify(request, JsonResponse({
+        "ready": is_ready,
+        "state": state,
+        "eager_load": PREDICT_EAGER_LOAD,
+        "model_loaded": _model is not None,
+        "load_ms": _readiness["load_ms"],
+        "warmup_ms": _readiness["warmup_ms"],
+        "error": _readiness["error"],
+        "model_load": _load_report,
+        "threads": thread_report(),
+        "pid": os.getpid(),
+    }, status=200 if is_ready else 503))